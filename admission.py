@@ -0,0 +1,210 @@
+"""
+Client-side admission control in front of the analysis endpoint.
+
+Every analysis must get through two gates before its POST goes out:
+
+    * a token bucket, which paces requests to `rate` per second with bursts of
+      up to `burst`, so a crowd of clicks does not trigger a scale-up storm;
+    * a max-in-flight limit on concurrent requests to the endpoint.
+
+Requests that cannot pass yet wait in a bounded priority queue (interactive
+before batch, FIFO within a priority). A request whose estimated wait is
+longer than `max_wait`, or longer than its own deadline allows, is rejected
+straight away with a "busy, estimated wait N s" result instead of queueing
+only to time out later.
+
+    MEDGEMMA_RATE=2 MEDGEMMA_BURST=4            # requests/s, bucket size (0 disables pacing)
+    MEDGEMMA_MAX_IN_FLIGHT=4                    # concurrent endpoint requests
+    MEDGEMMA_ADMISSION_QUEUE=64                 # waiting requests
+    MEDGEMMA_MAX_WAIT=60                        # seconds; longer estimated waits are rejected
+"""
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from deadline import Deadline
+import metrics
+
+INTERACTIVE = 0
+NORMAL = 1
+BATCH = 2
+
+
+class Busy(Exception):
+    """Admission refused because the estimated wait is too long or the queue is full"""
+
+    def __init__(self, estimated_wait: float, reason: str = "busy"):
+        self.estimated_wait = estimated_wait
+        self.reason = reason
+        super().__init__(f"Analyzer busy, estimated wait {math.ceil(estimated_wait)} s")
+
+
+def busy_result(exc: Busy) -> Dict[str, Any]:
+    """The {"error": ...} dict returned for a rejected analysis"""
+    return {"error": str(exc), "error_type": "busy", "retry_after": math.ceil(exc.estimated_wait)}
+
+
+class TokenBucket:
+    """Tokens refill continuously at `rate` per second, up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is available"""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def wait_for(self, count: int) -> float:
+        """Seconds until `count` more tokens will have been available"""
+        self._refill()
+        return max(0.0, (count - self._tokens) / self.rate)
+
+
+class _Slot:
+    """An admitted request; release it (or leave the with block) when the request is done"""
+
+    __slots__ = ("controller", "started", "queued_for")
+
+    def __init__(self, controller: "AdmissionController", queued_for: float):
+        self.controller = controller
+        self.started = time.monotonic()
+        self.queued_for = queued_for
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def release(self):
+        if self.controller is not None:
+            self.controller._release(time.monotonic() - self.started)
+            self.controller = None
+
+
+class AdmissionController:
+    """Token bucket plus max-in-flight limit, with a bounded priority queue and early rejection"""
+
+    def __init__(self, rate: float = 2.0, burst: float = 4.0, max_in_flight: int = 4, max_queue: int = 64,
+                 max_wait: float = 60.0, initial_estimate: float = 30.0):
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        # Exponentially weighted mean of request durations, for the wait estimate
+        self._mean_duration = initial_estimate
+        self.admitted = 0
+        self.rejected = 0
+
+    def _estimate_locked(self, priority: int) -> float:
+        ahead = sum(1 for entry in self._queue if entry[0] <= priority)
+        # Requests that must finish before a slot is free for this one
+        completions = ahead + self._in_flight - self.max_in_flight + 1
+        slot_wait = max(0, completions) * self._mean_duration / self.max_in_flight
+        token_wait = self.bucket.wait_for(ahead + 1) if self.bucket is not None else 0.0
+        return max(slot_wait, token_wait)
+
+    def estimate_wait(self, priority: int = NORMAL) -> float:
+        """Seconds a request submitted now would wait before being sent"""
+        with self._cond:
+            return self._estimate_locked(priority)
+
+    def acquire(self, priority: int = NORMAL, deadline: Optional[Deadline] = None) -> _Slot:
+        """Wait for admission; raises Busy up front rather than waiting too long"""
+        with self._cond:
+            estimate = self._estimate_locked(priority)
+            remaining = deadline.remaining() if deadline is not None else None
+            if len(self._queue) >= self.max_queue:
+                reason = "queue_full"
+            elif estimate > self.max_wait:
+                reason = "wait"
+            elif remaining is not None and estimate > remaining:
+                reason = "deadline"
+            else:
+                reason = None
+            if reason is not None:
+                self.rejected += 1
+                metrics.ADMISSIONS.inc(outcome=f"rejected_{reason}")
+                raise Busy(estimate, reason)
+
+            entry = [priority, next(self._seq)]
+            heapq.heappush(self._queue, entry)
+            queued_at = time.monotonic()
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] is entry and self._in_flight < self.max_in_flight:
+                        wait = self.bucket.take() if self.bucket is not None else 0.0
+                        if wait == 0:
+                            heapq.heappop(self._queue)
+                            self._in_flight += 1
+                            self.admitted += 1
+                            # The next waiter may be able to go too
+                            self._cond.notify_all()
+                            break
+                    if deadline is not None:
+                        deadline.check("waiting for admission")
+                        remaining = deadline.remaining()
+                        if remaining is not None:
+                            wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+
+        queued_for = time.monotonic() - queued_at
+        metrics.ADMISSIONS.inc(outcome="admitted")
+        metrics.STAGE_SECONDS.observe(queued_for, stage="admission")
+        return _Slot(self, queued_for)
+
+    def _release(self, duration: float):
+        with self._cond:
+            self._in_flight -= 1
+            self._mean_duration += 0.2 * (duration - self._mean_duration)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "mean_duration": round(self._mean_duration, 2),
+                "estimated_wait": round(self._estimate_locked(NORMAL), 1),
+            }
+
+
+def controller_from_env() -> AdmissionController:
+    """AdmissionController configured by the MEDGEMMA_* variables above"""
+    return AdmissionController(
+        rate=float(os.environ.get("MEDGEMMA_RATE", "2")),
+        burst=float(os.environ.get("MEDGEMMA_BURST", "4")),
+        max_in_flight=int(os.environ.get("MEDGEMMA_MAX_IN_FLIGHT", "4")),
+        max_queue=int(os.environ.get("MEDGEMMA_ADMISSION_QUEUE", "64")),
+        max_wait=float(os.environ.get("MEDGEMMA_MAX_WAIT", "60")),
+    )
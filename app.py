@@ -1,205 +1,442 @@
 import streamlit as st
 import json
-import base64
+import os
 from pathlib import Path
 from typing import Union
-from function import xray_analysis, clean_and_parse_json
+from function import cached_xray_analysis, stream_xray_analysis, clean_and_parse_json, keep_warm
+from models import (AnalysisResult, ImageMetadata, Anatomy, Findings, ClinicalAssessment,
+                    TechnicalNotes, parse_section)
+from preprocess import normalize_image
+from result_cache import image_digest
+from profiling import maybe_profile, profiler_from_env
+from jobs import JobPool, QueueFull, CANCELLED, QUEUED
+from admission import INTERACTIVE
+from result_store import store_from_env
+
+# End-to-end budget for one analysis: encoding, upload, retries and parsing
+ANALYSIS_BUDGET = float(os.environ.get("MEDGEMMA_ANALYSIS_BUDGET", "180"))
+PREWARM = os.environ.get("MEDGEMMA_PREWARM", "1").lower() not in ("0", "false", "off", "no")
+# Longest edge of on-screen previews; full-size uploads are never sent to the browser
+PREVIEW_EDGE = 640
 
 # ---------------- Utility Functions ----------------
-def extract_analysis_data(result):
-    """Extract and clean analysis data from various response formats"""
-    if result.get("raw_response"):
-        cleaned_data = clean_and_parse_json(result["raw_response"])
-        if cleaned_data:
-            return cleaned_data
-    return result
-
-def display_xray_results(data, original_result):
+def parse_analysis(result) -> AnalysisResult:
+    """Validate a response into the typed model, repairing raw_response output"""
+    return AnalysisResult.from_response(result, repair=clean_and_parse_json)
+
+def render_image_metadata(metadata: ImageMetadata):
+    """Image metadata section"""
+    st.subheader("📷 Image Metadata")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if metadata.body_part:
+            st.metric("Body Part", metadata.body_part)
+    with col2:
+        if metadata.view_type:
+            st.metric("View Type", metadata.view_type)
+    with col3:
+        if metadata.side:
+            st.metric("Side", metadata.side)
+    if metadata.side_marker:
+        st.info(f"**Side Marker:** {metadata.side_marker}")
+
+def render_anatomy(anatomy: Anatomy):
+    """Anatomical structures section"""
+    st.subheader("🦴 Anatomical Structures")
+    col1, col2 = st.columns(2)
+    with col1:
+        if anatomy.bones_identified:
+            st.write("**Bones Identified:**")
+            for bone in anatomy.bones_identified[:5]:
+                st.write(f"• {bone}")
+    with col2:
+        if anatomy.joints_in_view:
+            st.write("**Joints in View:**")
+            for joint in anatomy.joints_in_view:
+                st.write(f"• {joint}")
+        st.metric("Soft Tissues Evaluated", "Yes" if anatomy.soft_tissues_evaluated else "No")
+
+def render_fracture_details(fractures):
+    for i, fracture in enumerate(fractures, 1):
+        with st.expander(f"Fracture #{i} Details"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write(f"**Bone:** {fracture.bone_name}")
+                st.write(f"**Location:** {fracture.location_on_bone}")
+                st.write(f"**Type:** {fracture.type_of_fracture}")
+            with col2:
+                st.write(f"**Displacement:** {fracture.displacement}")
+                if fracture.angulation:
+                    st.write(f"**Angulation:** {fracture.angulation}")
+                st.write(f"**Joint Surface:** {'Involved' if fracture.involves_joint_surface else 'Not involved'}")
+                st.write(f"**Open Fracture:** {'Yes' if fracture.open_fracture else 'No'}")
+
+def render_findings(findings: Findings):
+    """Clinical findings section"""
+    st.subheader("🔍 Clinical Findings")
+    if findings.fracture_detected:
+        st.error("🚨 **FRACTURE DETECTED!**")
+        render_fracture_details(findings.fracture_details)
+    else:
+        st.success("✅ **No fractures detected**")
+        if findings.fractures_unflagged:
+            st.warning("⚠️ The model did not flag a fracture but listed the details below; please review them")
+            render_fracture_details(findings.fracture_details)
+
+    if findings.other_abnormalities:
+        st.write("**Other Findings:**")
+        for abnormality in findings.other_abnormalities:
+            if abnormality.location:
+                st.write(f"• **{abnormality.type}:** {abnormality.description} (Location: {abnormality.location})")
+            else:
+                st.write(f"• **{abnormality.type}:** {abnormality.description}")
+
+    if findings.bone_density:
+        st.info(f"**Bone Density:** {findings.bone_density}")
+    if findings.degenerative_changes:
+        st.info(f"**Degenerative Changes:** {', '.join(findings.degenerative_changes)}")
+
+def render_clinical_assessment(assessment: ClinicalAssessment):
+    """Clinical assessment section"""
+    st.subheader("⚕️ Clinical Assessment")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Severity Level", assessment.severity_level.title())
+    with col2:
+        st.metric("Urgency", f"{assessment.urgency_icon} {assessment.urgency.title()}")
+    if assessment.differential_diagnosis:
+        st.write("**📋 Differential Diagnosis:**")
+        for i, diagnosis in enumerate(assessment.differential_diagnosis, 1):
+            st.write(f"{i}. {diagnosis}")
+    if assessment.recommendations:
+        st.write("**💡 Recommendations:**")
+        for i, rec in enumerate(assessment.recommendations, 1):
+            st.write(f"{i}. {rec}")
+
+def render_technical_notes(technical: TechnicalNotes):
+    """Technical assessment section"""
+    st.subheader("📋 Technical Assessment")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Image Quality", technical.image_quality)
+    with col2:
+        st.metric("Artifacts Present", "Yes" if technical.artifacts_present else "No")
+    if technical.positioning_notes:
+        st.info(f"**Positioning:** {technical.positioning_notes}")
+    if technical.comments:
+        st.info(f"**Comments:** {technical.comments}")
+
+SECTION_RENDERERS = {
+    "image_metadata": render_image_metadata,
+    "anatomy": render_anatomy,
+    "findings": render_findings,
+    "clinical_assessment": render_clinical_assessment,
+    "technical_notes": render_technical_notes,
+}
+
+def display_xray_results(analysis: AnalysisResult):
     """Display X-ray analysis results with clean headings and key information only"""
     st.subheader("📊 X-Ray Analysis Report")
 
-    if original_result.get("success") is False:
+    if not analysis.success:
         st.warning("⚠️ Analysis completed with some issues.")
 
-    analysis = data.get("analysis", {}) if isinstance(data, dict) else data
-
-    # 📷 IMAGE METADATA
-    metadata = analysis.get("image_metadata", {})
-    if metadata:
-        st.subheader("📷 Image Metadata")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            if metadata.get('body_part'):
-                st.metric("Body Part", metadata['body_part'])
-        with col2:
-            if metadata.get('view_type'):
-                st.metric("View Type", metadata['view_type'])
-        with col3:
-            if metadata.get('side'):
-                st.metric("Side", metadata['side'])
-        if metadata.get('side_marker') and metadata['side_marker'] != 'None':
-            st.info(f"**Side Marker:** {metadata['side_marker']}")
-
-    # 🦴 ANATOMICAL STRUCTURES
-    anatomy = analysis.get("anatomy", {})
-    if anatomy:
-        st.subheader("🦴 Anatomical Structures")
-        col1, col2 = st.columns(2)
-        with col1:
-            bones = anatomy.get("bones_identified", [])
-            if bones:
-                st.write("**Bones Identified:**")
-                for bone in bones[:5]:
-                    st.write(f"• {bone}")
-        with col2:
-            joints = anatomy.get("joints_in_view", [])
-            if joints:
-                st.write("**Joints in View:**")
-                for joint in joints:
-                    st.write(f"• {joint}")
-            soft_tissues = anatomy.get('soft_tissues_evaluated', False)
-            st.metric("Soft Tissues Evaluated", "Yes" if soft_tissues else "No")
-
-    # 🔍 CLINICAL FINDINGS
-    findings = analysis.get("findings", {})
-    if findings:
-        st.subheader("🔍 Clinical Findings")
-        if findings.get("fracture_detected"):
-            st.error("🚨 **FRACTURE DETECTED!**")
-            fracture_details = findings.get("fracture_details", [])
-            for i, fracture in enumerate(fracture_details, 1):
-                with st.expander(f"Fracture #{i} Details"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write(f"**Bone:** {fracture.get('bone_name', 'Unknown')}")
-                        st.write(f"**Location:** {fracture.get('location_on_bone', 'Unknown')}")
-                        st.write(f"**Type:** {fracture.get('type_of_fracture', 'Unknown')}")
-                    with col2:
-                        st.write(f"**Displacement:** {fracture.get('displacement', 'Unknown')}")
-                        if fracture.get('angulation') and fracture['angulation'] != 'None':
-                            st.write(f"**Angulation:** {fracture['angulation']}")
-                        st.write(f"**Joint Surface:** {'Involved' if fracture.get('involves_joint_surface') else 'Not involved'}")
-                        st.write(f"**Open Fracture:** {'Yes' if fracture.get('open_fracture') else 'No'}")
-        else:
-            st.success("✅ **No fractures detected**")
-
-        other_abnormalities = findings.get("other_abnormalities", [])
-        if other_abnormalities:
-            st.write("**Other Findings:**")
-            for abnormality in other_abnormalities:
-                abnorm_type = abnormality.get('type', 'Unknown')
-                description = abnormality.get('description', '')
-                location = abnormality.get('location', '')
-                if location:
-                    st.write(f"• **{abnorm_type}:** {description} (Location: {location})")
-                else:
-                    st.write(f"• **{abnorm_type}:** {description}")
-
-        if findings.get('bone_density'):
-            st.info(f"**Bone Density:** {findings['bone_density']}")
-        degenerative = findings.get("degenerative_changes", [])
-        if degenerative:
-            st.info(f"**Degenerative Changes:** {', '.join(degenerative)}")
-
-    # ⚕️ CLINICAL ASSESSMENT
-    assessment = analysis.get("clinical_assessment", {})
-    if assessment:
-        st.subheader("⚕️ Clinical Assessment")
-        col1, col2 = st.columns(2)
-        with col1:
-            severity = assessment.get('severity_level', 'Unknown')
-            st.metric("Severity Level", severity.title())
-        with col2:
-            urgency = assessment.get('urgency', 'Unknown')
-            urgency_icon = {'emergent': '🚨','urgent': '⚠️','routine': '✅'}.get(urgency.lower(), '')
-            st.metric("Urgency", f"{urgency_icon} {urgency.title()}")
-        differential = assessment.get("differential_diagnosis", [])
-        if differential:
-            st.write("**📋 Differential Diagnosis:**")
-            for i, diagnosis in enumerate(differential, 1):
-                st.write(f"{i}. {diagnosis}")
-        recommendations = assessment.get("recommendations", [])
-        if recommendations:
-            st.write("**💡 Recommendations:**")
-            for i, rec in enumerate(recommendations, 1):
-                st.write(f"{i}. {rec}")
-
-    # 📋 TECHNICAL ASSESSMENT
-    technical = analysis.get("technical_notes", {})
-    if technical:
-        st.subheader("📋 Technical Assessment")
-        quality = technical.get('image_quality', 'Unknown')
-        artifacts = technical.get('artifacts_present', False)
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("Image Quality", quality)
-        with col2:
-            st.metric("Artifacts Present", "Yes" if artifacts else "No")
-        if technical.get('positioning_notes'):
-            st.info(f"**Positioning:** {technical['positioning_notes']}")
-        if technical.get('comments'):
-            st.info(f"**Comments:** {technical['comments']}")
+    for key, section in analysis.sections():
+        SECTION_RENDERERS[key](section)
 
     st.divider()
     st.warning("⚠️ **MEDICAL DISCLAIMER:** This analysis is for educational purposes only. Always consult qualified medical professionals for diagnosis and treatment.")
 
     with st.expander("🔍 View Technical Details"):
-        model_info = original_result.get("model_info", {})
+        model_info = analysis.model_info
         if model_info:
             st.write("**🤖 Model Information:**")
-            st.write(f"• Model: {model_info.get('model_id', 'Unknown')}")
-            st.write(f"• Max Tokens: {model_info.get('max_tokens', 'Unknown')}")
-            if model_info.get('input_tokens'):
-                st.write(f"• Input Tokens: {model_info['input_tokens']}")
-        st.json(data)
-
-def encode_image(image_input: Union[str, "UploadedFile"]):
-    """Encode image to base64."""
+            st.write(f"• Model: {model_info.model_id}")
+            st.write(f"• Max Tokens: {model_info.max_tokens or 'Unknown'}")
+            if model_info.input_tokens:
+                st.write(f"• Input Tokens: {model_info.input_tokens}")
+        for problem in analysis.problems:
+            st.write(f"• Skipped {problem}")
+        st.json(analysis.to_dict())
+
+@st.fragment
+def display_view(name, view, thumbnail=None):
+    """Results, export and stats for one analyzed view.
+
+    A fragment, so its own widgets (downloads, expanders) rerun only this view
+    instead of the whole page.
+    """
+    analysis = view["analysis"]
+
+    # Create layout for results and download
+    col1, col2 = st.columns([3, 1])
+
+    with col1:
+        # Display main analysis results
+        display_xray_results(analysis)
+
+    with col2:
+        if thumbnail is not None:
+            st.image(thumbnail, caption=name, use_container_width=True)
+
+        # Download section
+        st.markdown("### 📄 Export Report")
+        md_report = view_report(view)
+
+        # Download button
+        st.download_button(
+            label="📥 Download Report",
+            data=md_report,
+            file_name=f"xray_analysis_report_{name.split('.')[0]}.md",
+            mime="text/markdown",
+            use_container_width=True,
+            help="Download the complete analysis report as a Markdown file",
+            key=f"download_{name}"
+        )
+
+        # Analysis stats
+        st.markdown("### 📊 Analysis Stats")
+        model_info = analysis.model_info
+        if model_info:
+            st.metric("Model Used", model_info.model_id.split('/')[-1])
+            st.metric("Tokens Used", f"{model_info.input_tokens or 'N/A'}")
+
+@st.cache_resource
+def get_job_pool():
+    """One bounded analysis pool shared by every session of this server process"""
+    return JobPool()
+
+@st.cache_resource
+def get_result_store():
+    """Analysis history at MEDGEMMA_RESULT_STORE, shared by every session; None when off"""
+    return store_from_env()
+
+@st.cache_resource
+def get_keep_warm():
+    """Keep-warm scheduler (MEDGEMMA_KEEPWARM=1), started once per server process, which also prewarms the endpoint"""
+    if os.environ.get("MEDGEMMA_KEEPWARM", "").lower() in ("1", "true", "on", "yes"):
+        keep_warm.start()
+    if PREWARM:
+        keep_warm.prewarm("app_start")
+    return keep_warm
+
+@st.cache_resource
+def get_profiler():
+    """Profiler enabled by MEDGEMMA_PROFILE=<dir>, or None"""
+    return profiler_from_env()
+
+def analysis_job(image_bytes, stream: bool, label: str = "analysis"):
+    """Job body for the pool; when streaming, finished report sections are published as they arrive"""
+    profiler = get_profiler()
+
+    def run(job):
+        # Profiled here, on the worker thread, because cProfile only sees the thread it runs on
+        with maybe_profile(profiler, label):
+            if not stream:
+                return cached_xray_analysis(image_bytes, deadline=job.deadline, priority=INTERACTIVE)
+            result = None
+            for event in stream_xray_analysis(image_bytes, deadline=job.deadline, priority=INTERACTIVE):
+                if event[0] == "section":
+                    # Parsed on the worker, so status refreshes only render
+                    section = parse_section(*event[1:])
+                    if section is not None:
+                        job.emit((event[1], section))
+                elif event[0] == "result":
+                    result = event[1]
+            return result
+    return run
+
+def cancel_analysis():
+    """Abandon every in-flight analysis of this session"""
+    for job in (st.session_state.get("analysis_jobs") or {}).values():
+        job.cancel()
+    st.session_state.analysis_jobs = {}
+
+def finish_analysis(jobs):
+    """Move finished jobs' results into the session, noting any view without one"""
+    st.session_state.analysis_jobs = {}
+    digests = st.session_state.get("analysis_digests") or {}
+    views, notices = {}, []
+    for name, job in jobs.items():
+        result = job.result if job.error is None else {"error": str(job.error)}
+        if job.status == CANCELLED or (result or {}).get("error_type") in ("cancelled", "deadline"):
+            notices.append(f"⏹️ {name}: {(result or {}).get('error', 'Analysis cancelled')}")
+        elif (result or {}).get("error_type") == "busy":
+            notices.append(f"🚦 {name}: {result['error']}. Please try again shortly.")
+        elif result:
+            digest = digests.get(name)
+            # Parsed once here; the session keeps the model, not the raw response
+            analysis = parse_analysis(result)
+            views[name] = {"analysis": analysis, "digest": digest}
+            store = get_result_store()
+            if store is not None:
+                store.record(analysis, digest=digest, image_name=name, latency=job.elapsed(), source="app")
+        else:
+            notices.append(f"❌ {name}: Failed to analyze the X-ray. Please try again.")
+    st.session_state.analysis_results = views or None
+    st.session_state.analysis_notice = "\n\n".join(notices) or None
+
+def job_status_line(name, job, pool):
+    """One progress line for a view in the status area"""
+    if job.done:
+        return f"✅ **{name}** — finished in {job.elapsed():.0f}s"
+    eta = pool.eta(job)
+    if job.status == QUEUED:
+        ahead = pool.position(job)
+        return f"🕒 **{name}** — queued, {ahead} {'analysis' if ahead == 1 else 'analyses'} ahead · ETA ≈ {eta:.0f}s"
+    return f"⏳ **{name}** — analyzing, {job.elapsed():.0f}s elapsed · ETA ≈ {eta:.0f}s"
+
+@st.fragment(run_every=1)
+def analysis_status():
+    """Refresh only the job status area; the rest of the page stays interactive"""
+    jobs = st.session_state.get("analysis_jobs")
+    if not jobs:
+        return
+    finished = sum(job.done for job in jobs.values())
+    if finished == len(jobs):
+        finish_analysis(jobs)
+        st.rerun()
+
+    pool = get_job_pool()
+    st.progress(finished / len(jobs), text=f"⏳ Analyzing X-ray images... {finished}/{len(jobs)} views done")
+    for name, job in jobs.items():
+        st.markdown(job_status_line(name, job, pool))
+    if st.button("⏹️ Cancel analysis", use_container_width=True):
+        cancel_analysis()
+        st.rerun()
+
+    # Progressive sections are shown for a single view; a study shows per-view progress instead
+    job = next(iter(jobs.values()))
+    if len(jobs) == 1 and job.events:
+        st.subheader("📊 X-Ray Analysis Report")
+        for key, section in list(job.events):
+            SECTION_RENDERERS[key](section)
+
+def read_image_bytes(image_input: Union[str, "UploadedFile"]):
+    """Read raw image bytes from an upload or a file path."""
     try:
+        if hasattr(image_input, "getvalue"):
+            return image_input.getvalue()
         if hasattr(image_input, "read"):
-            image_data = image_input.read()
-        else:
-            path = Path(image_input)
-            if not path.exists():
-                return None
-            with open(path, "rb") as f:
-                image_data = f.read()
-        return base64.b64encode(image_data).decode("utf-8")
+            return image_input.read()
+        path = Path(image_input)
+        if not path.exists():
+            return None
+        with open(path, "rb") as f:
+            return f.read()
     except Exception:
         return None
 
-def generate_markdown_report(data: dict) -> str:
-    md = "# 🩻 X-Ray Analysis Report\n\n"
-    if "analysis" in data:
-        analysis = data["analysis"]
-        metadata = analysis.get("image_metadata", {})
-        if metadata:
-            md += "## 📷 Image Metadata\n"
-            for k, v in metadata.items():
-                md += f"- **{k.replace('_',' ').title()}**: {v}\n"
-            md += "\n"
-        anatomy = analysis.get("anatomy", {})
-        if anatomy:
-            md += "## 🦴 Anatomical Structures\n"
-            if anatomy.get("bones_identified"):
-                md += "- **Bones Identified**: " + ", ".join(anatomy["bones_identified"]) + "\n"
-            if anatomy.get("joints_in_view"):
-                md += "- **Joints in View**: " + ", ".join(anatomy["joints_in_view"]) + "\n"
-            md += "\n"
-        findings = analysis.get("findings", {})
-        if findings:
-            md += "## 🔍 Clinical Findings\n"
-            for k, v in findings.items():
-                md += f"- **{k.replace('_',' ').title()}**: {v}\n"
-            md += "\n"
-        assessment = analysis.get("clinical_assessment", {})
-        if assessment:
-            md += "## ⚕️ Clinical Assessment\n"
-            for k, v in assessment.items():
-                md += f"- **{k.replace('_',' ').title()}**: {v}\n"
-            md += "\n"
-    md += "\n⚠️ *Medical Disclaimer: This report is for educational purposes only.*\n"
-    return md
+def upload_digest(uploaded_file, image_bytes=None):
+    """SHA-256 of an upload, hashed once per uploaded file rather than once per rerun"""
+    file_id = getattr(uploaded_file, "file_id", None)
+    digests = st.session_state.setdefault("upload_digests", {})
+    if file_id is None or file_id not in digests:
+        digest = image_digest(image_bytes if image_bytes is not None else read_image_bytes(uploaded_file))
+        if file_id is None:
+            return digest
+        digests[file_id] = digest
+    return digests[file_id]
+
+# Arguments starting with "_" are not hashed by st.cache_data; the other arguments are the key
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def preview_image(digest: str, _image_bytes: bytes) -> bytes:
+    """Small JPEG preview of an upload"""
+    preview, _ = normalize_image(_image_bytes, max_edge=PREVIEW_EDGE, crop_borders=False)
+    return preview
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _report_cached(digest: str, analysis: AnalysisResult) -> str:
+    return generate_markdown_report(analysis)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _combined_report_cached(analyses: tuple, _views: dict) -> str:
+    return generate_combined_report(_views)
+
+def view_report(view):
+    """Markdown report for a view, rendered once per analyzed image"""
+    if view.get("digest") and view["analysis"].ok:
+        return _report_cached(view["digest"], view["analysis"])
+    return generate_markdown_report(view["analysis"])
+
+def combined_report(views):
+    if all(view.get("digest") and view["analysis"].ok for view in views.values()):
+        analyses = tuple((name, view["digest"], view["analysis"]) for name, view in views.items())
+        return _combined_report_cached(analyses, views)
+    return generate_combined_report(views)
+
+DISCLAIMER_MD = "\n⚠️ *Medical Disclaimer: This report is for educational purposes only.*\n"
+
+def generate_markdown_report(analysis: AnalysisResult) -> str:
+    lines = ["# 🩻 X-Ray Analysis Report\n"]
+    markdown_report_sections(analysis, lines)
+    lines.append(DISCLAIMER_MD)
+    return "\n".join(lines)
+
+def _format_field(value) -> str:
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, tuple):
+        return "; ".join(
+            ", ".join(f"{k.replace('_', ' ')}: {_format_field(v)}" for k, v in item.items() if v not in ("", ()))
+            if hasattr(item, "items") else str(item)
+            for item in value
+        ) or "None"
+    return str(value) or "—"
+
+def _field_lines(section, lines: list):
+    for k, v in section.items():
+        lines.append(f"- **{k.replace('_',' ').title()}**: {_format_field(v)}")
+    lines.append("")
+
+def markdown_report_sections(analysis: AnalysisResult, lines: list, level: int = 2):
+    """Append one view's report body to `lines`, with section headings at the given level.
+
+    Reports are built as a list of lines and joined once; repeated string
+    concatenation re-copies the whole report on every line.
+    """
+    h = "#" * level
+    if analysis.image_metadata:
+        lines.append(f"{h} 📷 Image Metadata")
+        _field_lines(analysis.image_metadata, lines)
+    anatomy = analysis.anatomy
+    if anatomy:
+        lines.append(f"{h} 🦴 Anatomical Structures")
+        if anatomy.bones_identified:
+            lines.append("- **Bones Identified**: " + ", ".join(anatomy.bones_identified))
+        if anatomy.joints_in_view:
+            lines.append("- **Joints in View**: " + ", ".join(anatomy.joints_in_view))
+        lines.append("")
+    if analysis.findings:
+        lines.append(f"{h} 🔍 Clinical Findings")
+        _field_lines(analysis.findings, lines)
+    if analysis.clinical_assessment:
+        lines.append(f"{h} ⚕️ Clinical Assessment")
+        _field_lines(analysis.clinical_assessment, lines)
+
+def generate_combined_report(views: dict) -> str:
+    """One study report: a summary table across views, then each view's findings"""
+    lines = [
+        "# 🩻 X-Ray Study Report\n",
+        "## 🧾 Study Summary",
+        "| View | Body Part | View Type | Fracture | Severity | Urgency |",
+        "|---|---|---|---|---|---|",
+    ]
+    for name, view in views.items():
+        analysis = view["analysis"]
+        metadata = analysis.image_metadata or ImageMetadata()
+        findings = analysis.findings
+        assessment = analysis.clinical_assessment
+        fracture = "—" if findings is None else "Yes" if findings.fracture_detected else "No"
+        lines.append(f"| {name} | {metadata.body_part or '—'} | {metadata.view_type or '—'} | {fracture} "
+                     f"| {assessment.severity_level if assessment else '—'} | {assessment.urgency if assessment else '—'} |")
+    lines.append("")
+    for name, view in views.items():
+        lines.append(f"## 🖼️ {name}\n")
+        markdown_report_sections(view["analysis"], lines, level=3)
+    lines.append(DISCLAIMER_MD)
+    return "\n".join(lines)
 
 # ---------------- Page Config ----------------
 st.set_page_config(page_title="Sushruta", layout="wide")
@@ -437,95 +674,137 @@ with st.sidebar:
     
     st.warning("⚠️ **Disclaimer:** For educational/demo purposes only. Not for clinical decision-making.")
 
+    stream_results = st.toggle("⚡ Show sections as they generate", value=True)
+
 # ---- Main Content Area ----
 st.markdown("### 📤 Upload X-ray Image")
 
+# Boot the endpoint while the user is still choosing files; prewarm() skips
+# the ping if the endpoint was reached within the last minute
+keeper = get_keep_warm()
+if PREWARM and not st.session_state.get("prewarmed"):
+    keeper.prewarm("page_open")
+    st.session_state.prewarmed = True
+
 # File uploader
-uploaded_file = st.file_uploader(
-    "Choose an X-ray image file", 
+uploaded_files = st.file_uploader(
+    "Choose X-ray image files (e.g. AP, lateral and oblique views of one study)", 
     type=["jpg", "jpeg", "png"],
-    help="Supported formats: JPG, JPEG, PNG. Maximum file size: 200MB"
+    accept_multiple_files=True,
+    help="Supported formats: JPG, JPEG, PNG. Maximum file size: 200MB per image"
 )
 
-if uploaded_file is not None:
-    # Display uploaded image
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col2:
-        st.image(uploaded_file, caption="✅ Uploaded X-ray Image", use_container_width=True)
-    
-    # Initialize session state
-    if "analysis_result" not in st.session_state:
-        st.session_state.analysis_result = None
-        st.session_state.extracted_data = None
-
-    # Analysis button and logic
-    if st.session_state.analysis_result is None:
+if uploaded_files:
+    # Name each view after its file, disambiguating repeated file names
+    uploads = {}
+    for uploaded_file in uploaded_files:
+        name = uploaded_file.name
+        if name in uploads:
+            name = f"{name} ({len(uploads) + 1})"
+        uploads[name] = uploaded_file
+
+    # Display uploaded images
+    # Previews are small cached JPEGs keyed by content hash, so a rerun neither
+    # re-hashes nor re-sends the full-size uploads
+    images = {name: read_image_bytes(uploaded_file) for name, uploaded_file in uploads.items()}
+    digests = {name: upload_digest(uploads[name], image_bytes)
+               for name, image_bytes in images.items() if image_bytes}
+    previews = {name: preview_image(digests[name], images[name]) for name in digests}
+    if len(uploads) == 1:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            if st.button("🔬 Analyze X-ray", use_container_width=True, type="primary"):
-                with st.spinner("⏳ Analyzing X-ray image... This may take a moment."):
-                    image_b64 = encode_image(uploaded_file)
-                    if image_b64:
-                        result = xray_analysis(image_b64)
-                        if result:
-                            st.session_state.analysis_result = result
-                            st.session_state.extracted_data = extract_analysis_data(result)
-                            st.rerun()
-                        else:
-                            st.error("❌ Failed to analyze the X-ray. Please try again.")
+            if previews:
+                st.image(next(iter(previews.values())), caption="✅ Uploaded X-ray Image", use_container_width=True)
+    else:
+        columns = st.columns(min(len(uploads), 4))
+        for i, (name, preview) in enumerate(previews.items()):
+            with columns[i % len(columns)]:
+                st.image(preview, caption=f"✅ {name}", use_container_width=True)
+    
+    # Initialize session state
+    if "analysis_results" not in st.session_state:
+        st.session_state.analysis_results = None
+        st.session_state.analysis_jobs = {}
+        st.session_state.analysis_notice = None
+
+    # Analysis button and logic: every view runs concurrently on the shared job
+    # pool and only the status fragment refreshes while they are in flight
+    if st.session_state.analysis_results is None:
+        if not st.session_state.analysis_jobs:
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col2:
+                label = "🔬 Analyze X-ray" if len(uploads) == 1 else f"🔬 Analyze {len(uploads)} X-rays"
+                analyze_clicked = st.button(label, use_container_width=True, type="primary")
+            if st.session_state.analysis_notice:
+                st.warning(st.session_state.analysis_notice)
+            if analyze_clicked:
+                st.session_state.analysis_notice = None
+                if all(images.values()):
+                    st.session_state.analysis_digests = digests
+                    pool = get_job_pool()
+                    try:
+                        for name, image_bytes in images.items():
+                            st.session_state.analysis_jobs[name] = pool.submit(
+                                analysis_job(image_bytes, stream_results, name), ANALYSIS_BUDGET
+                            )
+                    except QueueFull:
+                        cancel_analysis()
+                        st.error("🚦 The analyzer is at capacity right now. Please try again in a minute.")
                     else:
-                        st.error("❌ Failed to process the uploaded image. Please try again.")
+                        st.rerun()
+                else:
+                    st.error("❌ Failed to process the uploaded image. Please try again.")
+        analysis_status()
     
     # Display results if analysis is complete
-    if st.session_state.analysis_result is not None:
-        extracted_data = st.session_state.extracted_data
-        result = st.session_state.analysis_result
+    if st.session_state.analysis_results is not None:
+        views = st.session_state.analysis_results
 
         # Success message
-        st.success("✅ Analysis Complete!")
-        
-        # Create layout for results and download
-        col1, col2 = st.columns([3, 1])
-        
+        st.success("✅ Analysis Complete!" if len(views) == 1 else f"✅ Analysis Complete! {len(views)} views analyzed")
+        if st.session_state.analysis_notice:
+            st.warning(st.session_state.analysis_notice)
+
+        if len(views) == 1:
+            name, view = next(iter(views.items()))
+            display_view(name, view)
+        else:
+            tabs = st.tabs([f"🖼️ {name}" for name in views])
+            for tab, (name, view) in zip(tabs, views.items()):
+                with tab:
+                    display_view(name, view, previews.get(name))
+
+        st.markdown("### 🔄 Actions")
+        col1, col2 = st.columns(2)
         with col1:
-            # Display main analysis results
-            display_xray_results(extracted_data, result)
-        
+            if len(views) > 1:
+                # Combined study report
+                st.download_button(
+                    label="📥 Download Combined Study Report",
+                    data=combined_report(views),
+                    file_name="xray_study_report.md",
+                    mime="text/markdown",
+                    use_container_width=True,
+                    help="All views in one Markdown report, with a summary table"
+                )
         with col2:
-            # Download section
-            st.markdown("### 📄 Export Report")
-            md_report = generate_markdown_report(extracted_data)
-            
-            # Download button
-            st.download_button(
-                label="📥 Download Report",
-                data=md_report,
-                file_name=f"xray_analysis_report_{uploaded_file.name.split('.')[0]}.md",
-                mime="text/markdown",
-                use_container_width=True,
-                help="Download the complete analysis report as a Markdown file"
-            )
-            
-            # Analysis stats
-            st.markdown("### 📊 Analysis Stats")
-            model_info = result.get("model_info", {})
-            if model_info:
-                st.metric("Model Used", model_info.get('model_id', 'Unknown').split('/')[-1])
-                st.metric("Tokens Used", f"{model_info.get('input_tokens', 'N/A')}")
-            
-            # Reset button
-            st.markdown("### 🔄 Actions")
             if st.button("🆕 Analyze New Image", use_container_width=True):
-                st.session_state.analysis_result = None
-                st.session_state.extracted_data = None
+                cancel_analysis()
+                st.session_state.analysis_results = None
+                st.session_state.analysis_notice = None
                 st.rerun()
 
         # Footer
+        if get_result_store() is not None:
+            retention = ("Images are processed securely and not stored; the findings of each analysis are kept in "
+                         "this deployment's analysis history.")
+        else:
+            retention = "Images are processed securely and not stored permanently."
         st.markdown("---")
         st.markdown(
-            """
+            f"""
             <div style="text-align: center; padding: 20px; opacity: 0.7;">
-                🔒 <strong>Privacy Notice:</strong> Images are processed securely and not stored permanently.<br>
+                🔒 <strong>Privacy Notice:</strong> {retention}<br>
                 💡 <strong>Support:</strong> For technical support, visit <a href="https://www.anktechsol.com/" target="_blank">anktechsol.com</a>
             </div>
             """,
@@ -0,0 +1,151 @@
+"""
+Asyncio front-end for X-ray analysis.
+
+The pooled requests session stays the single transport; each call runs on a
+dedicated thread pool sized to the concurrency limit, so one event loop can fan
+out hundreds of studies while a semaphore bounds how many are on the wire.
+Results have exactly the same shape as the sync path because they come from
+the same xray_analysis / MedGemmaTestClient.analyze_xray code, including the
+clean_and_parse_json fallback.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from deadline import Deadline, DeadlineExceeded, error_result
+from admission import NORMAL
+from function import DEFAULT_MAX_TOKENS, analysis_cache, analysis_flights, uncached_xray_analysis, xray_analysis
+from preprocess import preprocessing_key
+from result_cache import image_digest
+
+DEFAULT_CONCURRENCY = 8
+
+
+def _timeout_result(seconds: float) -> Dict[str, Any]:
+    # The same "deadline" error the sync path returns, so is_stopped() recognizes it
+    return error_result(DeadlineExceeded(f"Deadline of {seconds:g}s exceeded"))
+
+
+class AsyncAnalyzer:
+    """Bounded-concurrency async wrapper around a blocking analyze callable"""
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY):
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._loop = None
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="medgemma-async")
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Semaphores belong to one loop; rebuild it if we are reused under a new asyncio.run()
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def run(self, fn, *args, deadline: Optional[float] = None, cancellable: bool = True, **kwargs):
+        """Run fn(*args, **kwargs) off-loop; deadline is seconds from now, covering queueing too.
+
+        Unless cancellable is False, fn gets the budget as deadline=Deadline. It
+        is cancelled when the awaiting task is cancelled or times out, so the
+        worker thread stops at its next check instead of finishing for nobody.
+        """
+        budget = Deadline(deadline)
+        if cancellable:
+            kwargs["deadline"] = budget
+        semaphore = self._get_semaphore()
+
+        async def bounded():
+            async with semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+        try:
+            return await asyncio.wait_for(bounded(), deadline)
+        except asyncio.TimeoutError:
+            budget.cancel()
+            return _timeout_result(deadline)
+        except asyncio.CancelledError:
+            budget.cancel()
+            raise
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def async_xray_analysis(image, max_tokens: int = DEFAULT_MAX_TOKENS, custom_prompt: Optional[str] = None,
+                              deadline: Optional[float] = None, analyzer: Optional[AsyncAnalyzer] = None,
+                              priority: int = NORMAL):
+    """Async counterpart of function.xray_analysis; cancel the awaiting task to abandon it"""
+    analyzer = analyzer or _default_analyzer()
+    return await analyzer.run(xray_analysis, image, max_tokens=max_tokens,
+                              custom_prompt=custom_prompt, deadline=deadline, priority=priority)
+
+
+def _coalesced_analysis(image_bytes: bytes, digest: str, max_tokens: int, custom_prompt: Optional[str],
+                        priority: int = NORMAL, deadline: Optional[Deadline] = None):
+    # The shared flight runs on the leading caller's budget; if that runs out
+    # the result is a "deadline" error, which waiting callers retry
+    return uncached_xray_analysis(image_bytes, digest, max_tokens, custom_prompt, deadline=deadline,
+                                  priority=priority)
+
+
+async def async_cached_xray_analysis(image_bytes: bytes, max_tokens: int = DEFAULT_MAX_TOKENS, custom_prompt: Optional[str] = None,
+                                     deadline: Optional[float] = None, analyzer: Optional[AsyncAnalyzer] = None,
+                                     priority: int = NORMAL):
+    """Async counterpart of function.cached_xray_analysis.
+
+    Tasks and threads asking for the same image and parameters at the same
+    time share one request. Cancelling or timing out one caller only stops
+    its own wait.
+    """
+    digest = image_digest(image_bytes)
+    key = analysis_cache.key(digest, max_tokens, custom_prompt, preprocessing_key())
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached
+    analyzer = analyzer or _default_analyzer()
+    flight = functools.partial(analyzer.run, _coalesced_analysis, image_bytes, digest, max_tokens, custom_prompt,
+                               priority, deadline=deadline)
+    try:
+        return await asyncio.wait_for(analysis_flights.do_async(key, flight), deadline)
+    except asyncio.TimeoutError:
+        return _timeout_result(deadline)
+
+
+_analyzer = None
+
+
+def _default_analyzer() -> AsyncAnalyzer:
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = AsyncAnalyzer()
+    return _analyzer
+
+
+class AsyncMedGemmaTestClient:
+    """Async counterpart of test.MedGemmaTestClient"""
+
+    def __init__(self, client=None, concurrency: int = DEFAULT_CONCURRENCY, **client_kwargs):
+        if client is None:
+            from test import MedGemmaTestClient
+            client = MedGemmaTestClient(**client_kwargs)
+        self.client = client
+        self.analyzer = AsyncAnalyzer(concurrency)
+
+    async def check_health(self) -> bool:
+        return await self.analyzer.run(self.client.check_health, cancellable=False)
+
+    async def analyze_xray(self, image_path: str, max_tokens: int = DEFAULT_MAX_TOKENS, custom_prompt: str = None,
+                           deadline: Optional[float] = 180) -> Optional[Dict[str, Any]]:
+        return await self.analyzer.run(self.client.analyze_xray, image_path, max_tokens=max_tokens,
+                                       custom_prompt=custom_prompt, deadline=deadline)
+
+    async def analyze_many(self, image_paths: Iterable[str], **kwargs) -> List[Optional[Dict[str, Any]]]:
+        """Analyze all images concurrently, preserving input order"""
+        return await asyncio.gather(*(self.analyze_xray(path, **kwargs) for path in image_paths))
+
+    def close(self):
+        self.analyzer.close()
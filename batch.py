@@ -0,0 +1,193 @@
+"""
+Parallel batch analysis for whole study folders.
+
+Image preparation (read, normalize, base64) is CPU-bound and runs in a process
+pool; uploads and inference are I/O-bound and run in a thread pool. Each image
+moves to the network stage as soon as it is prepared, so the two stages
+overlap. Finished images are appended to a JSONL manifest and skipped on the
+next run, making interrupted overnight batches resumable.
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from preprocess import normalize_image
+from upload import UPLOAD_MODE_BINARY
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+DEFAULT_MANIFEST_NAME = ".medgemma_manifest.jsonl"
+
+
+def find_images(directory: Optional[str] = None, pattern: Optional[str] = None) -> List[str]:
+    """Collect image paths from a directory and/or a glob pattern, sorted and de-duplicated"""
+    paths = set()
+    if directory:
+        for path in Path(directory).rglob("*"):
+            if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES:
+                paths.add(str(path))
+    if pattern:
+        base = Path(directory) if directory else Path(".")
+        paths.update(str(p) for p in base.glob(pattern) if p.is_file())
+    return sorted(paths)
+
+
+def prepare_image(image_path: str, preprocess: bool, max_edge: int, quality: int, upload_mode: str):
+    """Process-pool worker: read, normalize and encode one image"""
+    with open(image_path, "rb") as f:
+        image_data = f.read()
+    if preprocess:
+        image_data, _ = normalize_image(image_data, max_edge=max_edge, quality=quality)
+    if upload_mode == UPLOAD_MODE_BINARY:
+        return image_data
+    return base64.b64encode(image_data).decode("utf-8")
+
+
+class Manifest:
+    """Append-only JSONL record of finished images"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def completed(self) -> Set[str]:
+        done = set()
+        if not self.path.exists():
+            return done
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line from an interrupted run
+                if entry.get("status") == "ok":
+                    done.add(entry["image"])
+        return done
+
+    def record(self, entry: Dict[str, Any]):
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def run_batch(
+    client,
+    image_paths: Iterable[str],
+    manifest_path: str,
+    concurrency: int = 4,
+    prep_workers: Optional[int] = None,
+    max_tokens: int = 1024,
+    custom_prompt: Optional[str] = None,
+    timeout: int = 180,
+    save: bool = False,
+) -> Dict[str, Any]:
+    """Analyze many images with overlapping prep and network stages; returns a summary"""
+    manifest = Manifest(manifest_path)
+    done = manifest.completed()
+    image_paths = list(image_paths)
+    pending = [p for p in image_paths if str(Path(p).resolve()) not in done]
+    # Only images in this run count; the manifest may cover other folders too
+    skipped = len(image_paths) - len(pending)
+
+    print(f"\n📚 Batch: {len(pending)} images to analyze, {skipped} already done "
+          f"(manifest: {manifest_path}), concurrency={concurrency}")
+
+    succeeded = 0
+    failures: Dict[str, int] = {}
+    start = time.time()
+
+    def analyze(path: str, prepared):
+        t0 = time.time()
+        result = client.analyze_xray(path, max_tokens=max_tokens, custom_prompt=custom_prompt,
+                                     timeout=timeout, prepared=prepared)
+        return result, time.time() - t0
+
+    def finish(path: str, result, elapsed: float, error: Optional[str] = None):
+        nonlocal succeeded
+        ok = bool(result) and result.get("success") is not False and "error" not in result
+        entry = {"image": str(Path(path).resolve()), "status": "ok" if ok else "failed", "elapsed_s": round(elapsed, 3)}
+        if ok:
+            succeeded += 1
+            if save:
+                entry["output"] = client.save_result(result, path)
+        else:
+            reason = error or (result or {}).get("error_type") or ("no_response" if not result else "analysis_failed")
+            failures[reason] = failures.get(reason, 0) + 1
+            entry["error"] = reason
+        manifest.record(entry)
+
+    with ProcessPoolExecutor(max_workers=prep_workers) as prep_pool, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="medgemma-batch") as io_pool:
+        # Prepared bodies wait in memory for an upload slot, so only keep about
+        # two per upload worker in flight and feed more as results drain
+        window = max(2 * concurrency, prep_workers or os.cpu_count() or 1)
+        remaining = iter(pending)
+        prep_futures = {}
+        io_futures = {}
+        outstanding = set()
+
+        def feed():
+            while len(prep_futures) + len(io_futures) < window:
+                path = next(remaining, None)
+                if path is None:
+                    return
+                future = prep_pool.submit(prepare_image, path, client.preprocess, client.max_edge, client.quality,
+                                          client.upload_mode)
+                prep_futures[future] = path
+                outstanding.add(future)
+
+        feed()
+        while outstanding:
+            finished, outstanding = wait(outstanding, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in prep_futures:
+                    path = prep_futures.pop(future)
+                    try:
+                        prepared = future.result()
+                    except Exception as e:
+                        print(f"❌ Failed to prepare {path}: {e}")
+                        finish(path, None, 0.0, error="prepare_failed")
+                        continue
+                    io_future = io_pool.submit(analyze, path, prepared)
+                    io_futures[io_future] = path
+                    outstanding.add(io_future)
+                else:
+                    path = io_futures.pop(future)
+                    try:
+                        result, elapsed = future.result()
+                        finish(path, result, elapsed)
+                    except Exception as e:
+                        print(f"❌ Failed to analyze {path}: {e}")
+                        finish(path, None, 0.0, error="exception")
+            feed()
+
+    wall = time.time() - start
+    processed = len(pending)
+    summary = {
+        "processed": processed,
+        "succeeded": succeeded,
+        "failed": processed - succeeded,
+        "skipped": skipped,
+        "failures_by_type": failures,
+        "wall_s": round(wall, 2),
+        "images_per_s": round(processed / wall, 3) if wall > 0 else 0.0,
+    }
+
+    print("\n" + "=" * 60)
+    print("📦 BATCH SUMMARY")
+    print("=" * 60)
+    print(f"   • Processed: {processed} ({skipped} skipped from manifest)")
+    print(f"   • Succeeded: {succeeded}")
+    print(f"   • Failed: {summary['failed']}")
+    for reason, count in sorted(failures.items()):
+        print(f"      - {reason}: {count}")
+    print(f"   • Wall time: {wall:.1f}s ({summary['images_per_s']:.2f} images/sec)")
+    return summary
@@ -0,0 +1,164 @@
+"""
+Client-side micro-batching of analysis requests.
+
+The analyze endpoint takes one image per POST, so under load every image pays
+the request overhead and the GPU runs at batch size 1. When the endpoint
+advertises batch support, calls that arrive within `window` seconds of each
+other with the same parameters are collected (up to the advertised size),
+sent as one batched POST, and the results are handed back to the individual
+callers.
+
+Until the endpoint advertises batching, or for a while after it says it
+cannot take batched payloads, every call goes out on its own straight away. A call left
+alone in its window also goes out on its own, having waited only the window.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from deadline import Deadline
+import metrics
+
+# Resolves a caller's future when it should send its request by itself
+_SEND_ALONE = object()
+
+
+class BatchUnsupported(Exception):
+    """The endpoint did not accept a batched payload.
+
+    With pause=True the endpoint does not batch at all and batching stops for
+    retry_unsupported seconds; otherwise only this batch is sent one at a time.
+    """
+
+    def __init__(self, message: str, pause: bool = True):
+        super().__init__(message)
+        self.pause = pause
+
+
+class MicroBatcher:
+    """Groups concurrent calls with the same key into batches of up to capacity() items"""
+
+    def __init__(self, name: str, send_batch: Callable[[Hashable, List[Any]], List[Any]],
+                 capacity: Callable[[], int], window: float = 0.025, workers: int = 8,
+                 retry_unsupported: float = 300.0, max_wait: float = 600.0, poll: float = 0.1):
+        self.name = name
+        self.send_batch = send_batch
+        self.capacity = capacity
+        self.window = window
+        self.retry_unsupported = retry_unsupported
+        self.max_wait = max_wait
+        self.poll = poll
+        # key -> (time the batch opened, [(item, future), ...])
+        self._pending: Dict[Hashable, Tuple[float, List[Tuple[Any, Future]]]] = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"medgemma-{name}-batch")
+        self._thread: Optional[threading.Thread] = None
+        self._unsupported_until = 0.0
+        self.batches = 0
+        self.batched = 0
+        self.alone = 0
+
+    def size(self) -> int:
+        """Current batch size limit; 1 means calls are sent on their own"""
+        if self.window <= 0 or time.monotonic() < self._unsupported_until:
+            return 1
+        return max(1, int(self.capacity()))
+
+    def call(self, key: Hashable, item: Any, send_alone: Callable[[], Any], deadline: Optional[Deadline] = None,
+             timeout: Optional[float] = None) -> Any:
+        """The result for `item`, from a batch of calls sharing `key` or from send_alone().
+
+        Without a deadline the wait for a batch gives up after `timeout` seconds
+        (max_wait if None) and raises DeadlineExceeded.
+        """
+        size = self.size()
+        if size > 1:
+            if deadline is None:
+                deadline = Deadline(self.window + (timeout if timeout is not None else self.max_wait))
+            result = self._wait(self._enqueue(key, item, size), deadline)
+            if result is not _SEND_ALONE:
+                return result
+        with self._cond:
+            self.alone += 1
+        metrics.BATCH_CALLS.inc(group=self.name, mode="alone")
+        return send_alone()
+
+    def _enqueue(self, key: Hashable, item: Any, size: int) -> Future:
+        future = Future()
+        with self._cond:
+            self._start_locked()
+            _, waiting = self._pending.setdefault(key, (time.monotonic(), []))
+            waiting.append((item, future))
+            if len(waiting) >= size:
+                del self._pending[key]
+                self._executor.submit(self._send, key, waiting)
+            else:
+                self._cond.notify()
+        return future
+
+    def _wait(self, future: Future, deadline: Deadline) -> Any:
+        while True:
+            deadline.check("waiting for a batched analysis")
+            try:
+                return future.result(timeout=self.poll)
+            except FutureTimeout:
+                continue
+
+    def _start_locked(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"medgemma-{self.name}-batcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Closes batches whose window has passed; full batches are sent by _enqueue
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                for key in [key for key, (opened, _) in self._pending.items() if now - opened >= self.window]:
+                    _, waiting = self._pending.pop(key)
+                    self._executor.submit(self._send, key, waiting)
+                if self._pending:
+                    first = min(opened for opened, _ in self._pending.values())
+                    self._cond.wait(max(0.0, first + self.window - time.monotonic()))
+                else:
+                    self._cond.wait()
+
+    def _send(self, key: Hashable, waiting: List[Tuple[Any, Future]]):
+        futures = [future for _, future in waiting]
+        if len(waiting) == 1:
+            futures[0].set_result(_SEND_ALONE)
+            return
+        try:
+            results = self.send_batch(key, [item for item, _ in waiting])
+            if len(results) != len(waiting):
+                # The requests were already processed; resending them would run them twice
+                raise ValueError(f"{self.name} batch sender returned {len(results)} results for {len(waiting)} items")
+        except BatchUnsupported as e:
+            print(f"⚠️ Endpoint rejected a batch of {len(waiting)} ({e}); sending requests one at a time")
+            if e.pause:
+                self._unsupported_until = time.monotonic() + self.retry_unsupported
+            results = [_SEND_ALONE] * len(waiting)
+        except BaseException as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        else:
+            with self._cond:
+                self.batches += 1
+                self.batched += len(waiting)
+            metrics.BATCH_CALLS.inc(len(waiting), group=self.name, mode="batched")
+            metrics.BATCH_SIZE.observe(len(waiting), group=self.name)
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "batched": self.batched,
+                "alone": self.alone,
+                "mean_batch": round(self.batched / self.batches, 2) if self.batches else None,
+                "pending": sum(len(waiting) for _, waiting in self._pending.values()),
+            }
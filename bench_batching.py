@@ -0,0 +1,143 @@
+"""
+Benchmark the micro-batching dispatcher against a stub with batch-amortized latency.
+
+The stub runs one inference at a time (--gpu-slots 1), and a batch of n images
+costs 1 + batch_cost * (n - 1) times a single image. Concurrent clients call
+function.xray_analysis for a fixed duration in three modes, each in its own
+child process because function.py reads its configuration at import:
+
+    single    batching disabled (MEDGEMMA_BATCH_WINDOW=0)
+    batched   batching on, endpoint advertises max_batch_size
+    fallback  batching on, endpoint without batch support (should match single)
+
+    python bench_batching.py --concurrency 16 --duration 10
+    python bench_batching.py --latency lognormal:mu=-1.2,sigma=0.3 --batch-cost 0.25 --window 0.01
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from stub_server import ANALYZE_PATH, HEALTH_PATH, start_process
+
+MODES = ("single", "batched", "fallback")
+
+
+def run_mode(concurrency: int, duration: float):
+    """Child-process entry point: closed-loop xray_analysis calls, reported as JSON"""
+    import function
+    from bench_load import latency_summary
+
+    # Learn the endpoint's batch support before the clock starts
+    function.health_monitor.is_healthy()
+    image = b"\x89PNG\r\n\x1a\n" + bytes(16 * 1024)
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            result = function.xray_analysis(image)
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append((elapsed, bool(result) and result.get("success", True) is not False
+                                and not result.get("error")))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    ok = [elapsed for elapsed, success in samples if success]
+    print(json.dumps({
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "throughput_rps": round(len(ok) / wall, 3),
+        "latency": latency_summary(ok),
+        "batcher": function.batcher.stats(),
+        "advertised_batch": function.batch_capacity(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batching against a batch-capable stub")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (default: 16)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per mode (default: 10)")
+    parser.add_argument("--window", type=float, default=0.025, help="Batching window in seconds (default: 0.025)")
+    parser.add_argument("--max-batch", type=int, default=8, help="Batch size the stub advertises (default: 8)")
+    parser.add_argument("--batch-cost", type=float, default=0.15,
+                        help="Stub latency added per extra image in a batch, as a fraction (default: 0.15)")
+    parser.add_argument("--gpu-slots", type=int, default=1, help="Stub concurrent inferences (default: 1)")
+    parser.add_argument("--latency", type=str, default="fixed:value=0.25",
+                        help="Stub single-image latency distribution (default: %(default)s)")
+    parser.add_argument("--modes", type=str, default=",".join(MODES), help="Modes to run (default: %(default)s)")
+    parser.add_argument("--output", type=str, help="Write results JSON here (default: bench_batching_<timestamp>.json)")
+    parser.add_argument("--_child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        run_mode(args.concurrency, args.duration)
+        return
+
+    stub_args = ("--gpu-slots", str(args.gpu_slots), "--batch-cost", str(args.batch_cost))
+    stubs = {
+        "batching": start_process(latency=args.latency, extra_args=stub_args + ("--max-batch", str(args.max_batch))),
+        "plain": start_process(latency=args.latency, extra_args=stub_args),
+    }
+    print(f"🚀 {args.concurrency} clients x {args.duration:.0f}s per mode; stub latency {args.latency}, "
+          f"{args.gpu_slots} GPU slot(s), batch cost {args.batch_cost:g}\n")
+
+    results = {}
+    try:
+        for mode in args.modes.split(","):
+            _, base_url = stubs["plain" if mode == "fallback" else "batching"]
+            env = dict(
+                os.environ,
+                MEDGEMMA_ANALYZE_ENDPOINT=base_url + ANALYZE_PATH,
+                MEDGEMMA_HEALTH_ENDPOINT=base_url + HEALTH_PATH,
+                MEDGEMMA_BATCH_WINDOW="0" if mode == "single" else str(args.window),
+                MEDGEMMA_BATCH_MAX=str(args.max_batch),
+                # Measure the transport, not client-side pacing
+                MEDGEMMA_RATE="0",
+                MEDGEMMA_MAX_IN_FLIGHT=str(args.concurrency),
+                MEDGEMMA_MAX_WAIT="3600",
+            )
+            env.pop("MEDGEMMA_METRICS", None)
+            out = subprocess.run(
+                [sys.executable, __file__, "--concurrency", str(args.concurrency), "--duration", str(args.duration),
+                 "--_child"],
+                capture_output=True, text=True, check=True, env=env,
+            )
+            stats = results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+            lat, batcher = stats["latency"], stats["batcher"]
+            print(f"{mode:>9}: {stats['throughput_rps']:7.2f} req/s  p50 {lat['p50_ms']} ms  p99 {lat['p99_ms']} ms  "
+                  f"({stats['succeeded']}/{stats['requests']} ok, {batcher['batches']} batches, "
+                  f"mean batch {batcher['mean_batch'] or '-'}, {batcher['alone']} alone)")
+    finally:
+        for proc, _ in stubs.values():
+            proc.terminate()
+
+    if "single" in results and "batched" in results and results["single"]["throughput_rps"]:
+        speedup = results["batched"]["throughput_rps"] / results["single"]["throughput_rps"]
+        print(f"\n📈 Batching throughput: {speedup:.2f}x single requests")
+
+    output = args.output or f"bench_batching_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {key: value for key, value in vars(args).items() if key != "_child"},
+            "modes": results,
+        }, f, indent=2)
+    print(f"💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark for clean_and_parse_json.
+
+Compares the previous multi-regex cleaner with the single-pass extractor, both
+cold (memo cleared before every call) and memoized (a repeat parse of the same
+raw_response: function._repair_parsing tries it during the request, and the
+app's AnalysisResult.from_response repair tries it again if that failed).
+
+The built-in corpus reproduces the shapes of malformed MedGemma output seen in
+json_parsing errors: fenced with and without a language tag, a bare "json"
+prefix, prose around the object, backticks and braces inside strings, and
+truncated generations. Real outputs can be added from a cassette recorded with
+--record / MEDGEMMA_TRANSPORT=record:
+
+    python bench_json.py --cassette run.jsonl --repeat 2000
+"""
+
+import argparse
+import json
+import re
+import time
+from typing import List
+
+from function import clean_and_parse_json, json_span
+from stub_server import CANNED_ANALYSIS
+
+
+def legacy_clean_and_parse_json(raw_response):
+    """The cleaner as it was before the single-pass extractor, kept for comparison"""
+    try:
+        match = re.search(r'```(?:json)?\s*(.*?)\s*```', raw_response, re.DOTALL)
+        if match:
+            json_str = match.group(1).strip()
+        else:
+            json_str = raw_response
+            json_str = re.sub(r'```json\s*', '', json_str)
+            json_str = re.sub(r'```\s*', '', json_str)
+            json_str = re.sub(r'^json\s*', '', json_str, flags=re.MULTILINE)
+            json_str = json_str.strip()
+        json_str = json_str.replace('`', '').strip('\n\r\t ')
+        if not (json_str.startswith('{') or json_str.startswith('[')):
+            start_pos = min([pos for pos in [json_str.find('{'), json_str.find('[')] if pos != -1] or [len(json_str)])
+            if start_pos < len(json_str):
+                json_str = json_str[start_pos:]
+        return json.loads(json_str)
+    except Exception:
+        return None
+
+
+def builtin_corpus() -> List[str]:
+    body = json.dumps({"analysis": CANNED_ANALYSIS}, indent=2)
+    tricky = json.dumps({"analysis": dict(CANNED_ANALYSIS, technical_notes={
+        "image_quality": "Good", "artifacts_present": False,
+        "positioning_notes": "Marker {L} near `cassette` edge", "comments": "see \"AP\" view",
+    })}, indent=2)
+    return [
+        f"```json\n{body}\n```",
+        f"```\n{body}\n```",
+        f"json\n{body}",
+        f"Here is the structured analysis of the radiograph:\n\n```json\n{body}\n```\n\nLet me know if you need more detail.",
+        f"{body}\n\nNote: findings should be confirmed by a radiologist.",
+        f"```json\n{tricky}\n```",
+        f"Based on the image [PA view], the report is:\n{tricky}",
+        f"```json\n{body[: len(body) * 2 // 3]}",  # truncated at max_tokens
+        body,
+    ]
+
+
+def cassette_corpus(path: str) -> List[str]:
+    corpus = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                body = json.loads(json.loads(line).get("body") or "{}")
+            except json.JSONDecodeError:
+                continue
+            if isinstance(body, dict) and body.get("raw_response"):
+                corpus.append(body["raw_response"])
+    return corpus
+
+
+def time_per_call(fn, corpus: List[str], repeat: int, before_each=None) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for raw in corpus:
+            if before_each:
+                before_each()
+            fn(raw)
+    return (time.perf_counter() - start) / (repeat * len(corpus)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clean_and_parse_json")
+    parser.add_argument("--repeat", type=int, default=500, help="Passes over the corpus (default: 500)")
+    parser.add_argument("--cassette", type=str, help="Add raw_response strings from a recorded cassette")
+    args = parser.parse_args()
+
+    corpus = builtin_corpus()
+    if args.cassette:
+        corpus += cassette_corpus(args.cassette)
+
+    agree = sum(legacy_clean_and_parse_json(r) == clean_and_parse_json(r) for r in corpus)
+    recovered_legacy = sum(legacy_clean_and_parse_json(r) is not None for r in corpus)
+    recovered_new = sum(clean_and_parse_json(r) is not None for r in corpus)
+
+    legacy_us = time_per_call(legacy_clean_and_parse_json, corpus, args.repeat)
+    cold_us = time_per_call(clean_and_parse_json, corpus, args.repeat, before_each=json_span.cache_clear)
+    json_span.cache_clear()
+    warm_us = time_per_call(clean_and_parse_json, corpus, args.repeat)
+
+    print(f"📊 {len(corpus)} responses x {args.repeat} passes")
+    print(f"   • Parsed: legacy {recovered_legacy}/{len(corpus)}, single-pass {recovered_new}/{len(corpus)} "
+          f"(identical results on {agree})")
+    print(f"   • Legacy cleaner:        {legacy_us:8.1f} µs/call")
+    print(f"   • Single-pass (cold):    {cold_us:8.1f} µs/call  ({legacy_us / cold_us:.1f}x)")
+    print(f"   • Single-pass (memoized):{warm_us:8.1f} µs/call  ({legacy_us / warm_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
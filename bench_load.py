@@ -0,0 +1,308 @@
+"""
+Load-testing and latency benchmark for the analyze endpoint.
+
+Drives the analyzer client either open-loop at a fixed request rate or
+closed-loop at a fixed concurrency for a set duration, then reports latency
+percentiles, throughput, error rate and the cold-start vs warm split. Results
+are written as JSON so runs can be compared.
+
+Each request goes through function.py as the app sends it: admission control,
+circuit breaker, retries, preprocessing and JSON repair (the result cache is
+skipped). --raw times bare POSTs instead, to separate client overhead from the
+endpoint.
+
+    # Offline against the local stub with a latency distribution
+    python bench_load.py --stub --stub-latency lognormal:mu=-1,sigma=0.4 --concurrency 8 --duration 20
+
+    # Fixed arrival rate against a real deployment
+    python bench_load.py --endpoint https://...analyze-xray-endpoint.modal.run --image xray.jpg --rate 2
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from http_client import MedGemmaHTTPClient, set_client
+from transport import ReplayTransport
+from upload import DEFAULT_UPLOAD_MODE, UPLOAD_MODE_BINARY, UPLOAD_MODE_JSON, post_analysis
+
+# Replay matches on URL path, so any host works as long as the path matches
+DEFAULT_REPLAY_ENDPOINT = "http://replay/analyze-xray-endpoint"
+
+# A request is counted as a cold start if the server says so, or if it is the
+# first one sent after the client has been idle for longer than this
+COLD_IDLE_SECONDS = 300.0
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(latencies)
+    to_ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "count": len(values),
+        "p50_ms": to_ms(percentile(values, 50)),
+        "p90_ms": to_ms(percentile(values, 90)),
+        "p99_ms": to_ms(percentile(values, 99)),
+        "max_ms": to_ms(values[-1] if values else None),
+        "mean_ms": to_ms(sum(values) / len(values) if values else None),
+    }
+
+
+def reported_cold(resp=None, result=None) -> bool:
+    """True if the endpoint flagged a cold start, in the X-Cold-Start header or in model_info"""
+    if resp is not None and resp.headers.get("X-Cold-Start") == "1":
+        return True
+    model_info = result.get("model_info") if isinstance(result, dict) else None
+    return isinstance(model_info, dict) and bool(model_info.get("cold_start"))
+
+
+class LoadRunner:
+    """Issues analyze requests and records one sample per request.
+
+    With `analyze` set, each request is analyze() (a full client call returning
+    a result dict); otherwise it is a bare POST of `image` to `endpoint`.
+    """
+
+    def __init__(self, endpoint: str, image, max_tokens: int, timeout: float, upload_mode: str, pool_size: int,
+                 http=None, analyze=None):
+        self.endpoint = endpoint
+        self.image = image
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.upload_mode = upload_mode
+        self.http = http or MedGemmaHTTPClient(pool_maxsize=pool_size)
+        self.analyze = analyze
+        self.samples: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._last_activity = None
+
+    def one(self, scheduled: Optional[float] = None):
+        start = time.perf_counter()
+        with self._lock:
+            idle_cold = self._last_activity is None or start - self._last_activity > COLD_IDLE_SECONDS
+            self._last_activity = start
+        try:
+            # The cold flag comes back with the result: in the client path the
+            # POST may run on a batcher or hedge thread, not this one
+            ok, error, server_cold = self._send_raw() if self.analyze is None else self._send_analysis()
+        except Exception as e:
+            ok, error, server_cold = False, type(e).__name__, False
+        end = time.perf_counter()
+        sample = {
+            "start": start,
+            # Open-loop latency counts from the scheduled send time so a slow
+            # client cannot hide queueing (coordinated omission)
+            "latency": end - (scheduled if scheduled is not None else start),
+            "service_time": end - start,
+            "ok": ok,
+            "error": error,
+            "cold": server_cold or idle_cold,
+        }
+        with self._lock:
+            self.samples.append(sample)
+            self._last_activity = max(self._last_activity, end)
+
+    def _send_raw(self):
+        resp = post_analysis(self.http, self.endpoint, self.image, self.max_tokens,
+                             mode=self.upload_mode, timeout=self.timeout)
+        if resp.status_code != 200:
+            return False, f"http_{resp.status_code}", reported_cold(resp)
+        body = resp.json()
+        ok = body.get("success", True) is not False
+        return ok, None if ok else "analysis_failed", reported_cold(resp, body)
+
+    def _send_analysis(self):
+        result = self.analyze() or {}
+        cold = reported_cold(result=result)
+        ok = bool(result) and "error" not in result and result.get("success", True) is not False
+        if ok:
+            return True, None, cold
+        error = result.get("error_type") or ("analysis_failed" if "success" in result else "request_failed")
+        return False, error, cold
+
+    def run_concurrency(self, concurrency: int, duration: float):
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            while time.perf_counter() < deadline:
+                self.one()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def run_rate(self, rate: float, duration: float, max_workers: int):
+        interval = 1.0 / rate
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            i = 0
+            while True:
+                scheduled = start + i * interval
+                if scheduled - start >= duration:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.one, scheduled)
+                i += 1
+
+    def report(self, wall: float) -> Dict[str, Any]:
+        samples = self.samples
+        ok = [s for s in samples if s["ok"]]
+        errors: Dict[str, int] = {}
+        for s in samples:
+            if not s["ok"]:
+                errors[s["error"]] = errors.get(s["error"], 0) + 1
+        return {
+            "requests": len(samples),
+            "succeeded": len(ok),
+            "error_rate": round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+            "errors": errors,
+            "throughput_rps": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+            "wall_s": round(wall, 3),
+            "latency": latency_summary([s["latency"] for s in ok]),
+            "service_time": latency_summary([s["service_time"] for s in ok]),
+            "cold": latency_summary([s["latency"] for s in ok if s["cold"]]),
+            "warm": latency_summary([s["latency"] for s in ok if not s["cold"]]),
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    lat = report["latency"]
+    print("\n" + "=" * 60)
+    print("📈 LOAD TEST RESULTS")
+    print("=" * 60)
+    print(f"   • Requests: {report['requests']} ({report['succeeded']} ok, error rate {report['error_rate']:.2%})")
+    for name, count in sorted(report["errors"].items()):
+        print(f"      - {name}: {count}")
+    print(f"   • Throughput: {report['throughput_rps']:.2f} req/s over {report['wall_s']:.1f}s")
+    print(f"   • Latency: p50 {lat['p50_ms']} ms | p90 {lat['p90_ms']} ms | p99 {lat['p99_ms']} ms | max {lat['max_ms']} ms")
+    for label in ("cold", "warm"):
+        split = report[label]
+        if split["count"]:
+            print(f"   • {label.title()}: {split['count']} requests, p50 {split['p50_ms']} ms, max {split['max_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the MedGemma analyze endpoint")
+    parser.add_argument("--endpoint", type=str, help="Analyze endpoint URL (required unless --stub)")
+    parser.add_argument("--image", type=str, help="Image to send (default: small synthetic payload)")
+    parser.add_argument("--rate", type=float, help="Open-loop mode: requests per second")
+    parser.add_argument("--concurrency", type=int, default=4, help="Closed-loop mode: concurrent clients (default: 4)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run (default: 30)")
+    parser.add_argument("--max-tokens", type=int, default=1024)
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--upload-mode", type=str, choices=[UPLOAD_MODE_JSON, UPLOAD_MODE_BINARY], default=DEFAULT_UPLOAD_MODE)
+    parser.add_argument("--raw", action="store_true",
+                        help="Time bare POSTs instead of the full client path (no retries, breaker or preprocessing)")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send the image without normalizing it first")
+    parser.add_argument("--output", type=str, help="Write results JSON here (default: bench_load_<timestamp>.json)")
+    parser.add_argument("--replay", type=str, metavar="CASSETTE",
+                        help="Replay recorded exchanges at recorded speed instead of using the network")
+    parser.add_argument("--stub", action="store_true", help="Start a local stub endpoint and benchmark it")
+    parser.add_argument("--stub-latency", type=str, default="lognormal:mu=-1.2,sigma=0.4",
+                        help="Stub latency distribution (default: %(default)s)")
+    parser.add_argument("--stub-cold-start", type=float, default=0.0, help="Stub cold-start delay in seconds")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="Fraction of stub requests that fail")
+    args = parser.parse_args()
+
+    stub_proc = None
+    endpoint = args.endpoint
+    health_url = endpoint and endpoint.replace("analyze-xray-endpoint", "health-check")
+    if args.stub:
+        from stub_server import ANALYZE_PATH, HEALTH_PATH, start_process
+        stub_proc, base_url = start_process(latency=args.stub_latency, cold_start=args.stub_cold_start,
+                                            error_rate=args.stub_error_rate)
+        endpoint = base_url + ANALYZE_PATH
+        health_url = base_url + HEALTH_PATH
+    elif args.replay:
+        endpoint = endpoint or DEFAULT_REPLAY_ENDPOINT
+        health_url = endpoint.replace("analyze-xray-endpoint", "health-check")
+    elif not endpoint:
+        parser.error("--endpoint is required unless --stub or --replay is given")
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        image = b"\x89PNG\r\n\x1a\n" + bytes(16 * 1024)
+
+    mode = f"rate={args.rate}/s" if args.rate else f"concurrency={args.concurrency}"
+    print(f"🚀 Load test: {mode} for {args.duration:.0f}s against {endpoint}")
+
+    workers = max(args.concurrency, int(math.ceil((args.rate or 0) * args.timeout)) or 1)
+    workers = min(workers, 512)
+    http = ReplayTransport(args.replay, realtime=True) if args.replay else None
+    runner = LoadRunner(endpoint, image, args.max_tokens, args.timeout, args.upload_mode,
+                        pool_size=min(workers, 64), http=http)
+    quiet = contextlib.nullcontext()
+    if not args.raw:
+        # function.py reads its endpoints at import and sends through the shared client
+        os.environ["MEDGEMMA_ANALYZE_ENDPOINT"] = endpoint
+        os.environ["MEDGEMMA_HEALTH_ENDPOINT"] = health_url
+        import function
+        from deadline import Deadline
+        from result_cache import image_digest
+        set_client(runner.http)
+        digest = image_digest(image)
+        runner.analyze = lambda: function.uncached_xray_analysis(
+            image, digest, args.max_tokens, preprocess=not args.no_preprocess, upload_mode=args.upload_mode,
+            deadline=Deadline(args.timeout))
+        # The client logs every request; keep the report readable
+        quiet = contextlib.redirect_stdout(open(os.devnull, "w"))
+    start = time.perf_counter()
+    try:
+        with quiet:
+            if args.rate:
+                runner.run_rate(args.rate, args.duration, workers)
+            else:
+                runner.run_concurrency(args.concurrency, args.duration)
+    finally:
+        if stub_proc:
+            stub_proc.terminate()
+    report = runner.report(time.perf_counter() - start)
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "endpoint": endpoint,
+            "mode": "rate" if args.rate else "concurrency",
+            "rate": args.rate,
+            "concurrency": None if args.rate else args.concurrency,
+            "duration_s": args.duration,
+            "max_tokens": args.max_tokens,
+            "upload_mode": args.upload_mode,
+            "client_path": not args.raw,
+            "preprocess": not args.raw and not args.no_preprocess,
+            "payload_bytes": len(image),
+            "stub_latency": args.stub_latency if args.stub else None,
+            "replay": args.replay,
+        },
+        **report,
+    }
+    print_report(result)
+
+    output = args.output or f"bench_load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
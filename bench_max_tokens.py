@@ -0,0 +1,275 @@
+"""
+max_tokens sweep: latency vs completeness across a grid of generation budgets.
+
+Sends every image of a corpus at each max_tokens value in the grid and
+records, per request, the latency, the reported token usage, whether the
+endpoint returned a json_parsing error (and whether the client could repair
+it), and which report sections came back missing or cut off mid-section.
+It then recommends the smallest max_tokens whose complete-report rate meets
+--target, overall and per body part (as reported by the model at the
+largest budget). Apply the recommendation with MEDGEMMA_MAX_TOKENS.
+
+    # Offline against the stub, which truncates output at max_tokens
+    python bench_max_tokens.py --stub --grid 128,256,384,512,1024
+
+    # A real deployment with a folder of studies
+    python bench_max_tokens.py --endpoint https://...analyze-xray-endpoint.modal.run --dir studies/ --repeat 2
+"""
+
+import argparse
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from batch import find_images
+from bench_load import latency_summary
+from function import clean_and_parse_json
+from http_client import MedGemmaHTTPClient
+from models import AnalysisResult
+from preprocess import normalize_image
+from streaming import IncrementalJSONParser, SECTION_KEYS
+from upload import DEFAULT_UPLOAD_MODE, UPLOAD_MODE_BINARY, UPLOAD_MODE_JSON, post_analysis
+
+DEFAULT_GRID = "256,384,512,768,1024,1536"
+CURRENT_DEFAULT = 1024
+# model_info keys an endpoint might use for generated tokens; otherwise they are estimated from the text
+OUTPUT_TOKEN_KEYS = ("output_tokens", "generated_tokens", "completion_tokens")
+CHARS_PER_TOKEN = 4
+
+
+def section_status(raw_text: str):
+    """(complete, cut off) section names in model output that may have been truncated"""
+    parser = IncrementalJSONParser()
+    complete = [key for key, _ in parser.feed(raw_text)]
+    started = [key for key in SECTION_KEYS if re.search(rf'"{key}"\s*:', raw_text)]
+    return complete, [key for key in started if key not in complete]
+
+
+def measure(http, endpoint: str, image_name: str, image, max_tokens: int, timeout: float,
+            upload_mode: str) -> Dict[str, Any]:
+    """One analysis at one budget, reduced to what the sweep compares"""
+    sample: Dict[str, Any] = {"image": image_name, "max_tokens": max_tokens, "ok": False, "error": None,
+                              "json_error": False, "repaired": False, "complete": False,
+                              "missing": [], "truncated": [], "body_part": ""}
+    start = time.perf_counter()
+    try:
+        resp = post_analysis(http, endpoint, image, max_tokens, mode=upload_mode, timeout=timeout)
+        sample["latency"] = time.perf_counter() - start
+        resp.raise_for_status()
+        result = resp.json()
+    except Exception as e:
+        sample["latency"] = time.perf_counter() - start
+        sample["error"] = type(e).__name__
+        return sample
+
+    sample["ok"] = True
+    raw = result.get("raw_response") or ""
+    sample["json_error"] = result.get("error_type") == "json_parsing"
+    analysis = AnalysisResult.from_response(result, repair=clean_and_parse_json)
+    sample["repaired"] = analysis.repaired
+
+    present = {key for key, _ in analysis.sections()}
+    if raw and not analysis.repaired:
+        # Sections that did close before the cut-off still count
+        complete, sample["truncated"] = section_status(raw)
+        present.update(complete)
+    sample["missing"] = [key for key in SECTION_KEYS if key not in present and key not in sample["truncated"]]
+    sample["complete"] = len(present) == len(SECTION_KEYS)
+    if analysis.image_metadata is not None:
+        sample["body_part"] = analysis.image_metadata.body_part.lower()
+
+    model_info = result.get("model_info") or {}
+    sample["input_tokens"] = model_info.get("input_tokens")
+    reported = next((model_info[key] for key in OUTPUT_TOKEN_KEYS if model_info.get(key) is not None), None)
+    sample["output_tokens_estimated"] = reported is None
+    if reported is None:
+        text = raw or json.dumps(result.get("analysis") or {}, indent=2)
+        reported = -(-len(text) // CHARS_PER_TOKEN)
+    sample["output_tokens"] = reported
+    return sample
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Latency, token usage, parse-error and truncation rates for one max_tokens value"""
+    ok = [s for s in samples if s["ok"]]
+    count = len(ok) or 1
+    truncated: Dict[str, int] = {}
+    missing: Dict[str, int] = {}
+    for s in ok:
+        for key in s["truncated"]:
+            truncated[key] = truncated.get(key, 0) + 1
+        for key in s["missing"]:
+            missing[key] = missing.get(key, 0) + 1
+    mean = lambda key: round(sum(s[key] for s in ok if s.get(key) is not None) / count, 1) if ok else None
+    return {
+        "requests": len(samples),
+        "failed": len(samples) - len(ok),
+        "latency": latency_summary([s["latency"] for s in ok]),
+        "input_tokens_mean": mean("input_tokens"),
+        "output_tokens_mean": mean("output_tokens"),
+        "output_tokens_estimated": any(s["output_tokens_estimated"] for s in ok),
+        "json_error_rate": round(sum(s["json_error"] for s in ok) / count, 4),
+        "repaired_rate": round(sum(s["repaired"] for s in ok) / count, 4),
+        "complete_rate": round(sum(s["complete"] for s in ok) / count, 4),
+        "truncated_sections": truncated,
+        "missing_sections": missing,
+    }
+
+
+def recommend(by_budget: Dict[int, Dict[str, Any]], target: float) -> Dict[str, Any]:
+    """Smallest max_tokens meeting the complete-report target, else the most complete one"""
+    budgets = sorted(by_budget)
+    meeting = [b for b in budgets if by_budget[b]["complete_rate"] >= target]
+    if meeting:
+        choice, reason = meeting[0], f"smallest value with complete reports >= {target:.0%}"
+    else:
+        choice = max(budgets, key=lambda b: (by_budget[b]["complete_rate"], -b))
+        reason = f"no value reached {target:.0%} complete reports; most complete shown"
+    chosen = by_budget[choice]
+    out = {"max_tokens": choice, "reason": reason, "complete_rate": chosen["complete_rate"],
+           "p50_ms": chosen["latency"]["p50_ms"]}
+    baseline = by_budget.get(CURRENT_DEFAULT)
+    if baseline and baseline["latency"]["p50_ms"] and chosen["latency"]["p50_ms"]:
+        out["p50_change_vs_1024"] = round(chosen["latency"]["p50_ms"] / baseline["latency"]["p50_ms"] - 1, 3)
+    return out
+
+
+def build_report(samples: List[Dict[str, Any]], grid: List[int], target: float) -> Dict[str, Any]:
+    by_budget = {b: summarize([s for s in samples if s["max_tokens"] == b]) for b in grid}
+
+    # Body part per image from the most complete (largest budget) answer
+    body_parts: Dict[str, str] = {}
+    for s in sorted(samples, key=lambda s: -s["max_tokens"]):
+        if s["body_part"] and s["image"] not in body_parts:
+            body_parts[s["image"]] = s["body_part"]
+    per_body_part = {}
+    for part in sorted(set(body_parts.values())):
+        group = [s for s in samples if body_parts.get(s["image"]) == part]
+        group_by_budget = {b: summarize([s for s in group if s["max_tokens"] == b]) for b in grid}
+        per_body_part[part] = {
+            "images": sum(1 for p in body_parts.values() if p == part),
+            "recommendation": recommend(group_by_budget, target),
+            "complete_rate": {b: group_by_budget[b]["complete_rate"] for b in grid},
+        }
+
+    return {
+        "by_max_tokens": by_budget,
+        "recommendation": recommend(by_budget, target),
+        "by_body_part": per_body_part,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print("\n" + "=" * 60)
+    print("📈 MAX_TOKENS SWEEP")
+    print("=" * 60)
+    print(f"   {'max_tokens':>10} {'p50 ms':>9} {'p90 ms':>9} {'out tok':>8} {'json err':>9} {'complete':>9}  truncated")
+    for budget, row in report["by_max_tokens"].items():
+        truncated = ", ".join(f"{k}×{v}" for k, v in row["truncated_sections"].items()) or "-"
+        print(f"   {budget:>10} {row['latency']['p50_ms'] or '-':>9} {row['latency']['p90_ms'] or '-':>9} "
+              f"{row['output_tokens_mean'] or '-':>8} {row['json_error_rate']:>9.1%} {row['complete_rate']:>9.1%}  "
+              f"{truncated}")
+    rec = report["recommendation"]
+    print(f"\n🎯 Recommended max_tokens: {rec['max_tokens']} ({rec['reason']})")
+    if "p50_change_vs_1024" in rec:
+        print(f"   • p50 latency vs 1024: {rec['p50_change_vs_1024']:+.1%}")
+    for part, info in report["by_body_part"].items():
+        part_rec = info["recommendation"]
+        print(f"   • {part} ({info['images']} images): {part_rec['max_tokens']} "
+              f"({part_rec['complete_rate']:.0%} complete)")
+    print(f"   Apply with: MEDGEMMA_MAX_TOKENS={rec['max_tokens']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep max_tokens for the MedGemma analyze endpoint")
+    parser.add_argument("--endpoint", type=str, help="Analyze endpoint URL (required unless --stub)")
+    parser.add_argument("--dir", type=str, help="Corpus directory of JPG/PNG images")
+    parser.add_argument("--glob", type=str, help="Corpus glob pattern, relative to --dir if given")
+    parser.add_argument("--image", type=str, action="append", default=[], help="Image to include (repeatable)")
+    parser.add_argument("--grid", type=str, default=DEFAULT_GRID, help="Comma-separated max_tokens values (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="Requests per image per value (default: 1)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Concurrent requests; keep at 1 to avoid queueing skewing latency (default: 1)")
+    parser.add_argument("--target", type=float, default=0.95,
+                        help="Fraction of complete reports a recommendation must reach (default: 0.95)")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send images as-is instead of normalized")
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--upload-mode", type=str, choices=[UPLOAD_MODE_JSON, UPLOAD_MODE_BINARY], default=DEFAULT_UPLOAD_MODE)
+    parser.add_argument("--output", type=str, help="Write results JSON here (default: bench_max_tokens_<timestamp>.json)")
+    parser.add_argument("--stub", action="store_true", help="Start a local stub endpoint and sweep it")
+    parser.add_argument("--stub-latency", type=str, default="fixed:value=0.2",
+                        help="Stub prefill latency distribution (default: %(default)s)")
+    parser.add_argument("--stub-decode-delay", type=float, default=0.002,
+                        help="Stub seconds per generated token (default: %(default)s)")
+    args = parser.parse_args()
+
+    grid = sorted({int(v) for v in args.grid.split(",") if v.strip()})
+    stub_proc = None
+    endpoint = args.endpoint
+    if args.stub:
+        from stub_server import ANALYZE_PATH, start_process
+        stub_proc, base_url = start_process(latency=args.stub_latency,
+                                            extra_args=("--decode-delay", str(args.stub_decode_delay)))
+        endpoint = base_url + ANALYZE_PATH
+    elif not endpoint:
+        parser.error("--endpoint is required unless --stub is given")
+
+    paths = args.image + (find_images(args.dir, args.glob) if args.dir or args.glob else [])
+    images: Dict[str, Any] = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        images[path] = data if args.no_preprocess else normalize_image(data)[0]
+    if not images:
+        if not args.stub:
+            parser.error("give a corpus with --dir, --glob or --image")
+        images["synthetic"] = b"\x89PNG\r\n\x1a\n" + bytes(16 * 1024)
+
+    # Interleave budgets so drift in endpoint load affects every value alike
+    tasks = [(name, budget) for _ in range(args.repeat) for name in images for budget in grid]
+    print(f"🚀 Sweeping max_tokens {grid} over {len(images)} image(s), {len(tasks)} requests against {endpoint}")
+
+    http = MedGemmaHTTPClient(pool_maxsize=max(1, args.concurrency))
+    samples: List[Optional[Dict[str, Any]]] = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            futures = [pool.submit(measure, http, endpoint, name, images[name], budget, args.timeout, args.upload_mode)
+                       for name, budget in tasks]
+            for done, future in enumerate(futures, 1):
+                samples.append(future.result())
+                if done % 10 == 0 or done == len(futures):
+                    print(f"   … {done}/{len(futures)}")
+    finally:
+        if stub_proc:
+            stub_proc.terminate()
+
+    report = build_report(samples, grid, args.target)
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "endpoint": endpoint,
+            "grid": grid,
+            "images": len(images),
+            "repeat": args.repeat,
+            "concurrency": args.concurrency,
+            "target": args.target,
+            "upload_mode": args.upload_mode,
+            "stub_latency": args.stub_latency if args.stub else None,
+            "stub_decode_delay": args.stub_decode_delay if args.stub else None,
+        },
+        **report,
+        "samples": samples,
+    }
+    print_report(result)
+
+    output = args.output or f"bench_max_tokens_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
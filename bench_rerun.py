@@ -0,0 +1,106 @@
+"""
+Rerun-time benchmark for the Streamlit app.
+
+Every widget interaction re-executes app.py top to bottom, so the cost of a
+rerun with results on screen is what users feel on each click. This drives
+the real app through streamlit.testing against a local stub: it uploads
+synthetic full-size X-rays, runs the analysis once, then times repeated
+reruns of the results page.
+
+    python bench_rerun.py --views 3 --size 3000 --reruns 30
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from bench_load import latency_summary
+from stub_server import ANALYZE_PATH, HEALTH_PATH, start_in_thread
+
+
+def synthetic_xrays(count: int, size: int, directory: str) -> List[str]:
+    """Noisy grayscale PNGs, so neither PNG nor JPEG can compress them away"""
+    from PIL import Image
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"view{i + 1}.png")
+        Image.frombytes("L", (size, size), os.urandom(size * size)).save(path)
+        paths.append(path)
+    return paths
+
+
+def _app_with_uploads(image_paths, app_path):
+    """Script run by AppTest: app.py with st.file_uploader returning fixed files"""
+    import io
+    import os
+    import streamlit as st
+
+    def upload(path):
+        with open(path, "rb") as f:
+            body = io.BytesIO(f.read())
+        body.name = os.path.basename(path)
+        body.file_id = path
+        return body
+
+    uploads = [upload(path) for path in image_paths]
+    st.file_uploader = lambda *a, **k: uploads if k.get("accept_multiple_files") else uploads[0]
+    exec(compile(open(app_path).read(), app_path, "exec"), {"__name__": "__main__"})
+
+
+def run(views: int, size: int, reruns: int, timeout: float = 120.0):
+    from streamlit.testing.v1 import AppTest
+
+    stub = start_in_thread()
+    os.environ["MEDGEMMA_ANALYZE_ENDPOINT"] = stub.base_url + ANALYZE_PATH
+    os.environ["MEDGEMMA_HEALTH_ENDPOINT"] = stub.base_url + HEALTH_PATH
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = synthetic_xrays(views, size, tmp)
+        at = AppTest.from_function(_app_with_uploads, args=(paths, app_path), default_timeout=timeout)
+
+        start = time.perf_counter()
+        at.run()
+        first_render = time.perf_counter() - start
+
+        at.button[0].click().run()
+        deadline = time.monotonic() + timeout
+        while not any(b.label.startswith("🆕") for b in at.button):
+            if time.monotonic() > deadline or at.exception:
+                raise RuntimeError(f"analysis did not finish: {at.exception}")
+            time.sleep(0.2)
+            at.run()
+
+        samples = []
+        for _ in range(reruns):
+            start = time.perf_counter()
+            at.run()
+            samples.append(time.perf_counter() - start)
+    stub.shutdown()
+
+    return {
+        "views": views,
+        "image_size": size,
+        "first_render_ms": round(first_render * 1000, 2),
+        "rerun": latency_summary(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time Streamlit reruns of the results page")
+    parser.add_argument("--views", type=int, default=3, help="Images uploaded as one study (default: 3)")
+    parser.add_argument("--size", type=int, default=3000, help="Edge of each synthetic image in pixels (default: 3000)")
+    parser.add_argument("--reruns", type=int, default=30, help="Timed reruns with results on screen (default: 30)")
+    args = parser.parse_args()
+
+    report = run(args.views, args.size, args.reruns)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
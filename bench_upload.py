@@ -0,0 +1,99 @@
+"""
+Compare peak memory and wall time of the JSON and binary upload modes.
+
+Each mode runs in its own child process against a local stub endpoint, so peak
+RSS (ru_maxrss) reflects only the copies that mode keeps alive.
+
+    python bench_upload.py --size-mb 50 --repeat 3
+    python bench_upload.py --image big_xray.png
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from stub_server import ANALYZE_PATH, start_process
+
+
+def run_mode(mode: str, image_path: str, url: str, repeat: int):
+    """Child-process entry point: upload the image `repeat` times and report"""
+    from http_client import MedGemmaHTTPClient
+    from upload import open_image_body, post_analysis, UPLOAD_MODE_BINARY
+
+    http = MedGemmaHTTPClient()
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if mode == UPLOAD_MODE_BINARY:
+            with open_image_body(image_path) as body:
+                resp = post_analysis(http, url, body, mode=mode)
+        else:
+            with open(image_path, "rb") as f:
+                image_data = f.read()
+            resp = post_analysis(http, url, image_data, mode=mode)
+            del image_data
+        resp.raise_for_status()
+        timings.append(time.perf_counter() - start)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "mode": mode,
+        "wall_s_mean": sum(timings) / len(timings),
+        "wall_s_min": min(timings),
+        "peak_rss_mb": peak_kb / 1024,
+        "peak_rss_delta_mb": (peak_kb - baseline_kb) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON vs binary upload modes")
+    parser.add_argument("--image", type=str, help="Image file to upload (default: synthetic file)")
+    parser.add_argument("--size-mb", type=float, default=50, help="Size of the synthetic file (default: 50)")
+    parser.add_argument("--repeat", type=int, default=3, help="Uploads per mode (default: 3)")
+    parser.add_argument("--_child", nargs=3, metavar=("MODE", "IMAGE", "URL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        mode, image_path, url = args._child
+        run_mode(mode, image_path, url, args.repeat)
+        return
+
+    tmp = None
+    image_path = args.image
+    if not image_path:
+        tmp = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+        # Write in chunks so the parent's peak RSS, which children inherit, stays small
+        for _ in range(int(args.size_mb)):
+            tmp.write(os.urandom(1024 * 1024))
+        tmp.close()
+        image_path = tmp.name
+
+    # The stub runs in its own process so its buffers never count against a child's RSS
+    server, base_url = start_process()
+    url = base_url + ANALYZE_PATH
+    size_mb = os.path.getsize(image_path) / (1024 * 1024)
+    print(f"📦 Uploading {size_mb:.1f} MB x{args.repeat} per mode to {url}\n")
+
+    try:
+        for mode in ("json", "binary"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--repeat", str(args.repeat), "--_child", mode, image_path, url],
+                capture_output=True, text=True, check=True,
+            )
+            stats = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{mode:>7}: wall {stats['wall_s_mean']:.3f}s (min {stats['wall_s_min']:.3f}s)  "
+                  f"peak RSS {stats['peak_rss_mb']:.1f} MB (+{stats['peak_rss_delta_mb']:.1f} MB)")
+    finally:
+        server.terminate()
+        if tmp:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+End-to-end deadline budgets and cooperative cancellation.
+
+A Deadline is created once per analysis and handed down through encoding, the
+health check, the POST (and its retries) and parsing. Each stage asks for
+what is left of the budget instead of using its own flat timeout, and checks
+whether the caller has cancelled before starting. requests cannot be
+interrupted from another thread, so a request already on the wire runs until
+its budget-derived timeout.
+"""
+
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class DeadlineExceeded(Exception):
+    """The analysis ran out of its time budget"""
+
+
+class Cancelled(Exception):
+    """The caller abandoned the analysis"""
+
+
+class Deadline:
+    """A time budget plus a cancellation flag, shared by every stage of one analysis"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def restart(self):
+        """Start the budget clock from now, e.g. when a queued job begins running"""
+        self.expires_at = None if self.seconds is None else time.monotonic() + self.seconds
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None for an unbounded budget"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self, stage: str = ""):
+        """Raise if the caller cancelled or the budget is spent"""
+        where = f" before {stage}" if stage else ""
+        if self.cancelled:
+            raise Cancelled(f"Analysis cancelled{where}")
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded{where}")
+
+    def timeout(self, connect: float = 10.0) -> Optional[Tuple[float, float]]:
+        """(connect, read) timeout for requests that fits in the remaining budget"""
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        remaining = max(remaining, 0.001)
+        return (min(connect, remaining), remaining)
+
+    def can_afford(self, seconds: float) -> bool:
+        remaining = self.remaining()
+        return not self.cancelled and (remaining is None or remaining > seconds)
+
+
+def error_result(exc: Exception):
+    """The {"error": ...} dict returned when a deadline stops an analysis"""
+    error_type = "cancelled" if isinstance(exc, Cancelled) else "deadline"
+    return {"error": str(exc), "error_type": error_type}
+
+
+def is_stopped(result) -> bool:
+    """True for an error_result, i.e. an analysis its caller abandoned rather than one that failed"""
+    return isinstance(result, dict) and result.get("error_type") in ("cancelled", "deadline")
@@ -1,100 +1,540 @@
+import os
 import re
+import time
+import functools
 import requests
 import json
+from http_client import get_client
+from health import CircuitBreaker, HealthMonitor, HALF_OPEN
+from result_cache import AnalysisCache, image_digest
+from preprocess import normalize_image, describe, preprocessing_key
+from upload import BATCH_REJECTED_STATUSES, BATCH_UNSUPPORTED_STATUSES, post_analysis, post_batch_analysis
+from retry import policy_from_env
+from streaming import IncrementalJSONParser, SECTION_KEYS, iter_sse_data
+from deadline import Cancelled, Deadline, DeadlineExceeded, error_result, is_stopped
+from singleflight import SingleFlight
+from admission import Busy, NORMAL, busy_result, controller_from_env
+from keepwarm import keepwarm_from_env
+from batching import BatchUnsupported, MicroBatcher
+import metrics
 
-ANALYZE_ENDPOINT = 'https://satyammishra0402--medgemma-xray-analyzer-analyze-xray-endpoint.modal.run'
-HEALTH_ENDPOINT = 'https://satyammishra0402--medgemma-xray-analyzer-health-check.modal.run'
+ANALYZE_ENDPOINT = os.environ.get(
+    'MEDGEMMA_ANALYZE_ENDPOINT',
+    'https://satyammishra0402--medgemma-xray-analyzer-analyze-xray-endpoint.modal.run',
+)
+HEALTH_ENDPOINT = os.environ.get(
+    'MEDGEMMA_HEALTH_ENDPOINT',
+    'https://satyammishra0402--medgemma-xray-analyzer-health-check.modal.run',
+)
 
-def modelhealthy():
+# Generation budget per analysis; see bench_max_tokens.py for choosing it
+DEFAULT_MAX_TOKENS = int(os.environ.get("MEDGEMMA_MAX_TOKENS", "1024"))
+# Micro-batching: how long to collect concurrent analyses, and the most per POST
+BATCH_WINDOW = float(os.environ.get("MEDGEMMA_BATCH_WINDOW", "0.025"))
+BATCH_MAX = int(os.environ.get("MEDGEMMA_BATCH_MAX", "8"))
+
+# Capabilities advertised by the health check, e.g. max_batch_size
+endpoint_features = {}
+
+def modelhealthy(timeout=15):
+    healthy = False
     try:
-        response = requests.get(HEALTH_ENDPOINT.strip())
-        status = response.json()
-        if status['status'] == 'healthy':
-            return True
-        else:
-            return False    
+        with metrics.timer("health"):
+            response = get_client().get(HEALTH_ENDPOINT.strip(), timeout=timeout)
+            healthy = read_health(response)
     except Exception as e:
         print(f"❌ problem in modelhealthy: {e}")
-        return False
+    metrics.HEALTH_CHECKS.inc(healthy=str(healthy).lower())
+    return healthy
 
 
-def clean_and_parse_json(raw_response):
-    """Clean and parse JSON from markdown or raw string"""
+def read_health(response):
+    """Whether a health-check response says healthy; also records the features it advertises"""
+    status = response.json()
+    healthy = status['status'] == 'healthy'
+    endpoint_features["max_batch_size"] = int(status.get("max_batch_size") or 1)
+    return healthy
+
+
+metrics.start_exporter()
+
+
+# Polls while analyses are running and stops after MEDGEMMA_HEALTH_IDLE quiet seconds
+health_monitor = HealthMonitor(modelhealthy, idle_timeout=float(os.environ.get("MEDGEMMA_HEALTH_IDLE", "300")))
+breaker = CircuitBreaker()
+analysis_cache = AnalysisCache(disk_dir=os.environ.get("MEDGEMMA_CACHE_DIR"))
+retry_policy = policy_from_env()
+# Paces and bounds requests to the endpoint across every caller in this process
+admission = controller_from_env()
+# Identical analyses already in flight are shared instead of re-sent
+analysis_flights = SingleFlight("analysis", abandoned=is_stopped)
+# Prewarm and business-hours keep-warm pings against HEALTH_ENDPOINT; they
+# stand in for the monitor's own probes, so the two never double up
+keep_warm = keepwarm_from_env(HEALTH_ENDPOINT, on_response=lambda response: health_monitor.record(read_health(response)))
+
+
+def batch_capacity():
+    """Analyses per batched POST: what the endpoint advertises, capped at MEDGEMMA_BATCH_MAX; 1 disables batching"""
+    return max(1, min(BATCH_MAX, endpoint_features.get("max_batch_size", 1)))
+
+
+def _admit(deadline=None):
+    """Circuit-breaker gate shared by the buffered and streaming paths; returns an error dict or None"""
+    health_monitor.start()
+    if not breaker.allow_request():
+        return {
+            "error": f"model is not working (retry in {breaker.retry_after():.0f}s)",
+            "error_type": "circuit_open",
+        }
+    # Only the half-open trial pays for a probe; a closed breaker trusts the
+    # background monitor and goes straight to the endpoint.
+    if breaker.state == HALF_OPEN:
+        remaining = deadline.remaining() if deadline is not None else None
+        probe_timeout = None if remaining is None else max(0.001, min(15, remaining))
+        if not health_monitor.is_healthy(timeout=probe_timeout):
+            breaker.record_failure()
+            return {"error": "model is not working", "error_type": "circuit_open"}
+    return None
+
+
+def _acquire_slot(priority, deadline):
+    """Admission-control slot for one endpoint request, or the error dict to return instead"""
     try:
-        # Method 1: Try to extract content between ```json and ```
-        json_pattern = r'```(?:json)?\s*(.*?)\s*```'
-        match = re.search(json_pattern, raw_response, re.DOTALL)
-        
-        if match:
-            json_str = match.group(1).strip()
+        return admission.acquire(priority, deadline)
+    except Busy as e:
+        print(f'🚦 {e}')
+        return busy_result(e)
+    except (Cancelled, DeadlineExceeded) as e:
+        return error_result(e)
+
+
+def _request_timeout(timeout, deadline):
+    """Per-attempt timeout: what is left of the deadline, else the caller's flat timeout"""
+    if deadline is not None and deadline.remaining() is not None:
+        return deadline.timeout()
+    return timeout
+
+
+def _rewind(image):
+    """Rewind a file body so a retried or hedged attempt resends it from the start"""
+    if hasattr(image, "seek"):
+        image.seek(0)
+
+
+# Where a JSON document may begin
+_JSON_START = re.compile(r'[{\[]')
+# Characters that matter when walking brackets: brackets, quotes and escapes
+_JSON_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+_json_decoder = json.JSONDecoder()
+MAX_JSON_CANDIDATES = 8
+
+
+def _bracket_span_end(text, start):
+    """Index just past the bracket that closes the one at `start`, or None if unbalanced"""
+    depth = 0
+    in_string = False
+    escaped_pos = -1
+    for match in _JSON_STRUCTURAL.finditer(text, start):
+        pos = match.start()
+        if pos == escaped_pos:
+            continue
+        ch = text[pos]
+        if ch == '\\':
+            if in_string:
+                escaped_pos = pos + 1
+        elif ch == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif ch in '{[':
+            depth += 1
         else:
-            # Method 2: More aggressive cleaning
-            json_str = raw_response
-            # Remove various markdown patterns
-            json_str = re.sub(r'```json\s*', '', json_str)
-            json_str = re.sub(r'```\s*', '', json_str)
-            json_str = re.sub(r'^json\s*', '', json_str, flags=re.MULTILINE)
-            json_str = json_str.strip()
-        
-        # Additional cleaning - remove any remaining backticks
-        json_str = json_str.replace('`', '').strip('\n\r\t ')
-        
-        # Ensure it starts with { or [
-        if not (json_str.startswith('{') or json_str.startswith('[')):
-            # Try to find the first { or [
-            start_pos = min([pos for pos in [json_str.find('{'), json_str.find('[')] if pos != -1] or [len(json_str)])
-            if start_pos < len(json_str):
-                json_str = json_str[start_pos:]
-        
-        # Parse the cleaned JSON
-        return json.loads(json_str)
-        
-    except json.JSONDecodeError as e:
-        error_pos = getattr(e, 'pos', 0)
-        if error_pos < len(raw_response):
-            problematic_part = raw_response[max(0, error_pos-20):error_pos+20]
-            # print(f"Problem around: '{problematic_part}'")
-        # print(f"First 100 chars of cleaned string: {json_str[:100] if 'json_str' in locals() else 'N/A'}")
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+    return None
+
+
+@functools.lru_cache(maxsize=256)
+def json_span(raw_response):
+    """(start, end) of the first JSON object or array in model output, or None.
+
+    Decodes from the first { or [ in a single pass, ignoring any prose or
+    markdown fence around it, so a ``` inside a JSON string is just text.
+    Memoized per response string.
+    """
+    pos = 0
+    for _ in range(MAX_JSON_CANDIDATES):
+        match = _JSON_START.search(raw_response, pos)
+        if not match:
+            return None
+        start = match.start()
+        try:
+            _, end = _json_decoder.raw_decode(raw_response, start)
+            return start, end
+        except json.JSONDecodeError:
+            # Skip the whole malformed candidate rather than retrying on one
+            # of its nested objects; a truncated document has nothing after it
+            end = _bracket_span_end(raw_response, start)
+            if end is None:
+                return None
+            pos = end
+    return None
+
+
+def extract_json(raw_response):
+    """(parsed, (start, end)) for the first JSON document in model output, or None.
+
+    The span is memoized; the document is decoded afresh on every call, so
+    callers get their own object to modify.
+    """
+    span = json_span(raw_response)
+    if span is None:
         return None
+    return _json_decoder.raw_decode(raw_response, span[0])[0], span
+
+
+def clean_and_parse_json(raw_response):
+    """Clean and parse JSON from markdown or raw string"""
+    try:
+        with metrics.timer("parse"):
+            extracted = extract_json(raw_response)
+        return extracted[0] if extracted else None
     except Exception as e:
         print(f"Unexpected error in clean_and_parse_json: {e}")
         return None
 
-def xray_analysis(image_b64):
-    if modelhealthy():
+@metrics.counted("buffered")
+def xray_analysis(image, max_tokens=DEFAULT_MAX_TOKENS, custom_prompt=None, upload_mode=None, timeout=None, deadline=None,
+                  priority=NORMAL):
+    """Analyze an image given as a base64 string, raw bytes, an open file or an mmap.
+
+    Raw bodies are streamed as binary when upload_mode (or MEDGEMMA_UPLOAD_MODE)
+    is "binary"; everything else goes out as the JSON payload. A deadline.Deadline
+    bounds admission, the health probe, every POST attempt and parsing, and lets
+    the caller cancel; it takes precedence over `timeout`. Requests wait for
+    admission control by `priority` (admission.INTERACTIVE, NORMAL or BATCH) and
+    get an error_type "busy" result when the wait would be too long. When the
+    endpoint advertises batching, non-file images arriving together with the same
+    parameters are sent as one batched JSON POST (see batching.py).
+    """
+    def send_alone():
+        slot = _acquire_slot(priority, deadline)
+        if isinstance(slot, dict):
+            return slot
+        with slot:
+            return _send_analysis(image, max_tokens, custom_prompt, upload_mode, timeout, deadline)
+
+    # File bodies are streamed on their own; anything else may share a batched POST
+    if hasattr(image, "read"):
+        return send_alone()
+    try:
+        return batcher.call((max_tokens, custom_prompt), (image, priority, deadline, timeout), send_alone, deadline,
+                            timeout)
+    except (Cancelled, DeadlineExceeded) as e:
+        return error_result(e)
+
+
+def _send_analysis(image, max_tokens, custom_prompt, upload_mode, timeout, deadline):
+    def attempt():
+        if deadline is not None:
+            deadline.check("upload")
+        _rewind(image)
+        return post_analysis(get_client(), ANALYZE_ENDPOINT, image, max_tokens, custom_prompt, upload_mode,
+                             timeout=_request_timeout(timeout, deadline))
+
+    # A file body cannot be read by two requests at once, so only byte
+    # payloads are hedged
+    return _call_endpoint(attempt, not hasattr(image, "read"), deadline, _read_analysis)
+
+
+def _send_batch(key, items):
+    """MicroBatcher sender: one batched POST for (image, priority, deadline, timeout) items; one result per item"""
+    max_tokens, custom_prompt = key
+    images = [item[0] for item in items]
+    # The batch is bounded by its most patient caller's deadline or timeout;
+    # callers with shorter ones stop waiting for it on their own
+    bounds = [deadline.remaining() if deadline is not None else timeout for _, _, deadline, timeout in items]
+    if None in bounds:
+        deadline = timeout = None
+    elif all(item[2] is not None for item in items):
+        deadline, timeout = Deadline(max(bounds)), None
+    else:
+        deadline, timeout = None, max(bounds)
+    slot = _acquire_slot(min(item[1] for item in items), deadline)
+    if isinstance(slot, dict):
+        return [dict(slot) for _ in items]
+    with slot:
+        def attempt():
+            return post_batch_analysis(get_client(), ANALYZE_ENDPOINT, images, max_tokens, custom_prompt,
+                                       timeout=_request_timeout(timeout, deadline))
+
+        # A hedge would repeat the whole batch on the GPU just when the endpoint is slow
+        results = _call_endpoint(attempt, False, deadline,
+                                 lambda resp, started, deadline: _read_batch(resp, started, deadline, len(items)))
+    return [dict(results) for _ in items] if isinstance(results, dict) else results
+
+
+def _read_analysis(resp, started, deadline):
+    resp.raise_for_status()
+    breaker.record_success()
+    response_data = resp.json()
+    metrics.record_request(time.perf_counter() - started, response_data.get("model_info"))
+    return _repair_parsing(response_data, deadline)
+
+
+def _read_batch(resp, started, deadline, count):
+    if resp.status_code in BATCH_UNSUPPORTED_STATUSES + BATCH_REJECTED_STATUSES:
+        breaker.record_success()
+        raise BatchUnsupported(f"status {resp.status_code}", pause=resp.status_code in BATCH_UNSUPPORTED_STATUSES)
+    resp.raise_for_status()
+    breaker.record_success()
+    response_data = resp.json()
+    results = response_data.get("results") if isinstance(response_data, dict) else None
+    # The images were analyzed; a reply we cannot split is an error for each
+    # caller rather than a reason to run them all again
+    if not isinstance(results, list) or len(results) != count:
+        print(f'❌ Malformed batch response: expected {count} results')
+        return [{"error": f"Malformed batch response: expected {count} results", "error_type": "batch_response"}
+                for _ in range(count)]
+    first = results[0] if isinstance(results[0], dict) else {}
+    metrics.record_request(time.perf_counter() - started, first.get("model_info"))
+    return [_repair_parsing(result, deadline) if isinstance(result, dict) else {"error": "Empty response"}
+            for result in results]
+
+
+def _repair_parsing(response_data, deadline):
+    """Recover the analysis client-side when the endpoint reports a json_parsing error"""
+    if not response_data.get("success", True) and response_data.get("error_type") == "json_parsing":
+        raw_response = response_data.get("raw_response", "")
+        if raw_response:
+            if deadline is not None:
+                deadline.check("parsing")
+            # Use the improved cleaning function
+            parsed_data = clean_and_parse_json(raw_response)
+            metrics.JSON_REPAIRS.inc(outcome="repaired" if parsed_data else "failed")
+            if parsed_data:
+                return parsed_data
+            else:
+                # If cleaning failed, return original response with error info
+                print(f'❌ Failed to clean and parse raw_response')
+    return response_data
+
+
+def _call_endpoint(attempt, allow_hedge, deadline, read):
+    """Admit, send attempt() with retries and return read(resp, started, deadline); failures become error dicts"""
+    rejected = _admit(deadline)
+    if rejected:
+        return rejected
+
+    try:
+        started = time.perf_counter()
+        resp = retry_policy.call(attempt, allow_hedge=allow_hedge, deadline=deadline)
+        return read(resp, started, deadline)
+
+    except BatchUnsupported:
+        raise
+    except Exception as e:
+        return _endpoint_error(e, deadline, "xray_analysis")
+
+
+def _endpoint_error(e, deadline, caller):
+    """Error dict for an exception from an analysis request, updating the circuit breaker"""
+    if isinstance(e, (Cancelled, DeadlineExceeded)):
+        breaker.release()
+        print(f'⏹️ {caller} stopped: {e}')
+        return error_result(e)
+    if isinstance(e, requests.exceptions.RequestException):
+        if isinstance(e, requests.exceptions.Timeout) and deadline is not None and deadline.expired:
+            # Our own budget ran out; that says nothing about the endpoint's health
+            breaker.release()
+            print(f'⏹️ {caller} stopped: deadline of {deadline.seconds:g}s exceeded')
+            return error_result(DeadlineExceeded(f"Deadline of {deadline.seconds:g}s exceeded"))
+        status = getattr(e.response, "status_code", None)
+        if status is None or status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        print(f'❌ HTTP request error in {caller}: {e}')
+        return {"error": f"HTTP request failed: {str(e)}"}
+    if isinstance(e, json.JSONDecodeError):
+        print(f'❌ JSON decode error in {caller}: {e}')
+        return {"error": f"JSON decode failed: {str(e)}"}
+    breaker.record_failure()
+    print(f'❌ Unexpected error in {caller}: {e}')
+    return {"error": f"Unexpected error: {str(e)}"}
+
+
+# Concurrent buffered analyses with the same parameters share a POST when the
+# endpoint advertises batching (max_batch_size in its health check)
+batcher = MicroBatcher("analysis", _send_batch, batch_capacity, window=BATCH_WINDOW)
+
+
+def cached_xray_analysis(image_bytes, max_tokens=DEFAULT_MAX_TOKENS, custom_prompt=None, preprocess=True, upload_mode=None,
+                         deadline=None, priority=NORMAL):
+    """xray_analysis behind the content-addressed result cache.
+
+    Concurrent calls for the same image and parameters share one request.
+    """
+    digest = image_digest(image_bytes)
+    key = analysis_cache.key(digest, max_tokens, custom_prompt, preprocessing_key(preprocess))
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        return analysis_flights.do(
+            key,
+            lambda: uncached_xray_analysis(image_bytes, digest, max_tokens, custom_prompt, preprocess, upload_mode,
+                                           deadline, priority),
+            deadline,
+        )
+    except (Cancelled, DeadlineExceeded) as e:
+        return error_result(e)
+
+
+def uncached_xray_analysis(image_bytes, digest, max_tokens=DEFAULT_MAX_TOKENS, custom_prompt=None, preprocess=True,
+                           upload_mode=None, deadline=None, priority=NORMAL):
+    """The cache-miss path: normalize, analyze and store the result under `digest`"""
+    if preprocess:
         try:
-            payload = {
-                "image": image_b64,
-                "max_tokens": 1024,
-            }
-            
-            resp = requests.post(ANALYZE_ENDPOINT, json=payload)
-            resp.raise_for_status()
-            response_data = resp.json()
-            
-            # Check if the response indicates a JSON parsing error
-            if not response_data.get("success", True) and response_data.get("error_type") == "json_parsing":
-                raw_response = response_data.get("raw_response", "")
-                if raw_response:
-                    # Use the improved cleaning function
-                    parsed_data = clean_and_parse_json(raw_response)
-                    if parsed_data:
-                        return parsed_data
-                    else:
-                        # If cleaning failed, return original response with error info
-                        print(f'❌ Failed to clean and parse raw_response')
-                        return response_data
-                        
-            return response_data
-            
-        except requests.exceptions.RequestException as e:
-            print(f'❌ HTTP request error in xray_analysis: {e}')
-            return {"error": f"HTTP request failed: {str(e)}"}
-        except json.JSONDecodeError as e:
-            print(f'❌ JSON decode error in xray_analysis: {e}')
-            return {"error": f"JSON decode failed: {str(e)}"}
-        except Exception as e:
-            print(f'❌ Unexpected error in xray_analysis: {e}')
-            return {"error": f"Unexpected error: {str(e)}"}
+            if deadline is not None:
+                deadline.check("encoding")
+        except (Cancelled, DeadlineExceeded) as e:
+            return error_result(e)
+        with metrics.timer("encode"):
+            image_bytes, stats = normalize_image(image_bytes)
+        print(f"🗜️ Image normalized: {describe(stats)}")
+    result = xray_analysis(image_bytes, max_tokens=max_tokens, custom_prompt=custom_prompt, upload_mode=upload_mode,
+                           deadline=deadline, priority=priority)
+    analysis_cache.put(digest, max_tokens, custom_prompt, result, preprocessing_key(preprocess))
+    return result
+
+
+def stream_xray_analysis(image_bytes, max_tokens=DEFAULT_MAX_TOKENS, custom_prompt=None, preprocess=True, upload_mode=None,
+                         deadline=None, priority=NORMAL):
+    """Streaming variant of cached_xray_analysis.
+
+    Yields ("section", name, value) as each top-level analysis section finishes
+    generating, then ("result", result) with the same shape cached_xray_analysis
+    returns. Endpoints that answer with plain JSON instead of server-sent events
+    are handled too; their sections simply arrive all at once.
+    """
+    digest = image_digest(image_bytes)
+    key = analysis_cache.key(digest, max_tokens, custom_prompt, preprocessing_key(preprocess))
+    result = analysis_cache.get(key)
+    flight = None
+    if result is None:
+        flight, leader = analysis_flights.acquire(key)
+        if not leader:
+            # An identical analysis is already in flight: wait for it instead of
+            # re-sending; its sections then arrive all at once, like a cache hit
+            try:
+                result = analysis_flights.wait(flight, deadline)
+            except (Cancelled, DeadlineExceeded) as e:
+                result = error_result(e)
+            else:
+                if is_stopped(result):
+                    result = None  # its caller gave up; stream our own
+                else:
+                    analysis_flights.count_shared()
+            flight = None
+    if result is None:
+        try:
+            slot = _acquire_slot(priority, deadline)
+            if isinstance(slot, dict):
+                result = slot
+            else:
+                with slot:
+                    result = yield from _stream_from_endpoint(image_bytes, max_tokens, custom_prompt, preprocess,
+                                                              upload_mode, deadline)
+        except BaseException:
+            # Our consumer went away mid-stream; callers waiting on us retry
+            if flight is not None:
+                analysis_flights.resolve(key, flight, error_result(Cancelled("Shared analysis was abandoned")))
+            raise
+        metrics.ANALYSES.inc(path="stream")
+        metrics.record_outcome(result)
+        analysis_cache.put(digest, max_tokens, custom_prompt, result, preprocessing_key(preprocess))
+        if flight is not None:
+            analysis_flights.resolve(key, flight, result)
     else:
-        return {"error": "model is not working"}
\ No newline at end of file
+        for name in SECTION_KEYS:
+            if name in (result.get("analysis") or {}):
+                yield "section", name, result["analysis"][name]
+    yield "result", result
+
+
+def _stream_from_endpoint(image_bytes, max_tokens, custom_prompt, preprocess, upload_mode, deadline):
+    rejected = _admit(deadline)
+    if rejected:
+        return rejected
+
+    def check(stage):
+        if deadline is not None:
+            deadline.check(stage)
+
+    try:
+        if preprocess:
+            check("encoding")
+            with metrics.timer("encode"):
+                image_bytes, stats = normalize_image(image_bytes)
+            print(f"🗜️ Image normalized: {describe(stats)}")
+
+        def attempt():
+            check("upload")
+            return post_analysis(get_client(), ANALYZE_ENDPOINT, image_bytes, max_tokens, custom_prompt,
+                                 upload_mode, stream=True, timeout=_request_timeout(None, deadline))
+
+        # Streams are retried but never hedged: a duplicate would double the token traffic
+        started = time.perf_counter()
+        resp = retry_policy.call(attempt, allow_hedge=False, deadline=deadline)
+
+        if "text/event-stream" not in resp.headers.get("Content-Type", ""):
+            # Endpoint does not stream; fall back to the buffered response
+            result = _read_analysis(resp, started, deadline)
+            analysis = result.get("analysis") or {}
+            for name in SECTION_KEYS:
+                if name in analysis:
+                    yield "section", name, analysis[name]
+            return result
+
+        resp.raise_for_status()
+        breaker.record_success()
+        parser = IncrementalJSONParser()
+        model_info = {}
+        try:
+            for data in iter_sse_data(resp.iter_lines(decode_unicode=True)):
+                check("the next token")
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                if event.get("token"):
+                    for name, value in parser.feed(event["token"]):
+                        yield "section", name, value
+                if event.get("done"):
+                    model_info = event.get("model_info") or {}
+                    break
+        finally:
+            resp.close()
+
+        metrics.record_request(time.perf_counter() - started, model_info)
+        check("parsing")
+        with metrics.timer("parse"):
+            analysis = parser.result()
+        if analysis is None:
+            analysis = clean_and_parse_json(parser.text)
+            metrics.JSON_REPAIRS.inc(outcome="repaired" if analysis is not None else "failed")
+        if analysis is None:
+            return {
+                "success": False,
+                "error": "Failed to parse streamed model output",
+                "error_type": "json_parsing",
+                "raw_response": parser.text,
+                "model_info": model_info,
+            }
+        if "analysis" in analysis:
+            analysis = analysis["analysis"]
+        return {"success": True, "analysis": analysis, "model_info": model_info}
+
+    except Exception as e:
+        return _endpoint_error(e, deadline, "stream_xray_analysis")
@@ -0,0 +1,153 @@
+"""
+Cached endpoint health and a circuit breaker for the analyze endpoint.
+
+The health probe runs on a background thread and its result is cached for a
+TTL, so analysis calls never wait on it while the endpoint is behaving. The
+thread stops once no analysis has used it for a while, so an idle app does not
+keep a scale-to-zero endpoint awake, and the next analysis starts it again. The
+circuit breaker is driven by real analyze outcomes: after enough consecutive
+failures it opens and calls fail fast until a cool-down passes, then a single
+half-open trial decides whether to close it again.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around the analyze endpoint"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a call may go through; claims the half-open trial slot"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = HALF_OPEN
+            # Half-open: let exactly one trial through
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a half-open trial slot whose call was abandoned without an outcome"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker will allow a half-open trial"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+
+class HealthMonitor:
+    """Background health prober with a TTL-cached status; stops after idle_timeout seconds without start()"""
+
+    def __init__(self, probe: Callable[[], bool], ttl: float = 60.0, interval: float = 30.0,
+                 idle_timeout: Optional[float] = 300.0):
+        self.probe = probe
+        self.ttl = ttl
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self._healthy: Optional[bool] = None
+        self._checked_at = 0.0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _refresh(self, timeout: Optional[float] = None) -> bool:
+        healthy = bool(self.probe() if timeout is None else self.probe(timeout=timeout))
+        self.record(healthy)
+        return healthy
+
+    def record(self, healthy: bool):
+        """Cache a status learned elsewhere, e.g. from a keep-warm ping, in place of the next probe"""
+        with self._lock:
+            self._healthy = healthy
+            self._checked_at = time.monotonic()
+
+    def cached(self) -> Optional[bool]:
+        """Last known status, or None if it has never been checked or has expired"""
+        with self._lock:
+            if self._healthy is None or time.monotonic() - self._checked_at > self.ttl:
+                return None
+            return self._healthy
+
+    def is_healthy(self, timeout: Optional[float] = None) -> bool:
+        """Cached status, probing synchronously (within `timeout`) only when the cache is stale"""
+        status = self.cached()
+        if status is None:
+            status = self._refresh(timeout)
+        return status
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if self.idle_timeout is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                    # Nobody is analyzing; the next start() brings the prober back
+                    self._thread = None
+                    return
+                due = self._checked_at + self.interval - time.monotonic()
+            if due > 0:
+                # A recent probe or recorded ping already answered
+                self._stop.wait(due)
+                continue
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"❌ problem in health monitor: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start the background prober, or keep it running; call on every use"""
+        with self._lock:
+            self._last_used = time.monotonic()
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="medgemma-health", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
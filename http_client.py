@@ -0,0 +1,127 @@
+"""
+Pooled HTTP client for the MedGemma Modal endpoints.
+
+A single requests.Session is shared by the health check and the analyze call so
+repeated analyses reuse warm keep-alive connections instead of paying a fresh
+TCP + TLS handshake every time.
+"""
+
+import os
+import threading
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import EmptyPoolError
+
+DEFAULT_POOL_CONNECTIONS = int(os.environ.get("MEDGEMMA_POOL_CONNECTIONS", "4"))
+DEFAULT_POOL_MAXSIZE = int(os.environ.get("MEDGEMMA_POOL_MAXSIZE", "16"))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("MEDGEMMA_CONNECT_TIMEOUT", "10"))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("MEDGEMMA_READ_TIMEOUT", "180"))
+DEFAULT_POOL_TIMEOUT = float(os.environ.get("MEDGEMMA_POOL_TIMEOUT", "30"))
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def _bounded_pool(pool_class, pool_timeout: float):
+    class BoundedPool(pool_class):
+        def _get_conn(self, timeout=None):
+            return super()._get_conn(pool_timeout if timeout is None else timeout)
+    return BoundedPool
+
+
+class BoundedPoolAdapter(HTTPAdapter):
+    """Blocking-pool HTTPAdapter that waits at most pool_timeout seconds for a free connection.
+
+    requests never passes a pool timeout to urllib3, so a plain blocking pool
+    waits forever once every connection is stuck. Running out of time raises
+    requests.exceptions.ConnectTimeout.
+    """
+
+    __attrs__ = HTTPAdapter.__attrs__ + ["pool_timeout"]
+
+    def __init__(self, pool_timeout: float = DEFAULT_POOL_TIMEOUT, **kwargs):
+        self.pool_timeout = pool_timeout
+        super().__init__(pool_block=True, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: _bounded_pool(pool_class, self.pool_timeout)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def send(self, request, *args, **kwargs):
+        try:
+            return super().send(request, *args, **kwargs)
+        except EmptyPoolError as e:
+            raise requests.exceptions.ConnectTimeout(
+                f"No pooled connection free within {self.pool_timeout:g}s", request=request) from e
+
+
+class MedGemmaHTTPClient:
+    """Thread-safe keep-alive client wrapping a pooled requests.Session"""
+
+    def __init__(
+        self,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        pool_timeout: float = DEFAULT_POOL_TIMEOUT,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({"Connection": "keep-alive"})
+        # A blocking pool keeps us from opening throwaway sockets when every
+        # pooled connection is busy; callers wait up to pool_timeout for a warm one.
+        adapter = BoundedPoolAdapter(
+            pool_timeout=pool_timeout,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _timeout(self, timeout: Optional[Timeout]) -> Tuple[float, float]:
+        if timeout is None:
+            return (self.connect_timeout, self.read_timeout)
+        if isinstance(timeout, tuple):
+            return timeout
+        return (min(self.connect_timeout, timeout), timeout)
+
+    def get(self, url: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        return self.session.get(url, timeout=self._timeout(timeout), **kwargs)
+
+    def post(self, url: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        return self.session.post(url, timeout=self._timeout(timeout), **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> MedGemmaHTTPClient:
+    """Return the process-wide shared client, creating it on first use.
+
+    MEDGEMMA_TRANSPORT=record|replay swaps in a cassette transport (see transport.py).
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                from transport import wrap_from_env
+                _default_client = wrap_from_env(MedGemmaHTTPClient())
+    return _default_client
+
+
+def set_client(client) -> None:
+    """Replace the process-wide client, e.g. with a RecordingTransport or ReplayTransport"""
+    global _default_client
+    with _default_lock:
+        _default_client = client
@@ -0,0 +1,173 @@
+"""
+Process-wide background analysis jobs.
+
+Streamlit runs each session's script on its own thread, so an inline analysis
+freezes that session until inference finishes. JobPool runs analyses on a
+bounded set of worker threads shared by every session instead, and hands back
+a Job that the UI can poll for its queue position, an ETA and any sections
+that have already been generated.
+
+The pool is capped twice: `workers` bounds concurrent requests to the
+endpoint and `max_queued` bounds the backlog, so one server process degrades
+with a clear "queue full" message rather than unbounded threads.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from deadline import Deadline
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+DEFAULT_WORKERS = int(os.environ.get("MEDGEMMA_JOB_WORKERS", "4"))
+DEFAULT_MAX_QUEUED = int(os.environ.get("MEDGEMMA_JOB_QUEUE", "32"))
+
+
+class QueueFull(Exception):
+    """The pool's backlog is at capacity"""
+
+
+class Job:
+    """Handle for one submitted analysis"""
+
+    def __init__(self, job_id: int, budget: Optional[float] = None):
+        self.id = job_id
+        self.status = QUEUED
+        self.deadline = Deadline(budget)
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events: List[Any] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+        self._pool: Optional["JobPool"] = None
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def emit(self, event):
+        """Publish a progress event (e.g. a finished report section) to pollers"""
+        self.events.append(event)
+
+    def cancel(self):
+        """Cancel the job; a queued job leaves the queue, a running request is abandoned at its next check"""
+        self.deadline.cancel()
+        if self._pool is not None:
+            self._pool._withdraw(self)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def elapsed(self) -> float:
+        end = self.finished_at or time.monotonic()
+        return end - (self.started_at or self.submitted_at)
+
+
+class JobPool:
+    """Bounded worker pool with FIFO queue positions and an ETA estimate"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queued: int = DEFAULT_MAX_QUEUED,
+                 initial_estimate: float = 30.0):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medgemma-job")
+        self._queued: deque = deque()
+        self._running = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Exponentially weighted mean of completed job durations
+        self._mean_duration = initial_estimate
+        self.completed = 0
+
+    def submit(self, fn: Callable[[Job], Dict[str, Any]], budget: Optional[float] = None) -> Job:
+        """Queue fn(job) and return its handle; raises QueueFull when the backlog is at capacity"""
+        with self._lock:
+            if len(self._queued) >= self.max_queued:
+                raise QueueFull(f"{len(self._queued)} analyses already waiting")
+            job = Job(next(self._ids), budget)
+            job._pool = self
+            self._queued.append(job)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _withdraw(self, job: Job):
+        # A cancelled job frees its queue place at once; _run then skips it
+        with self._lock:
+            try:
+                self._queued.remove(job)
+            except ValueError:
+                return
+            job.status = CANCELLED
+            job.finished_at = time.monotonic()
+        job._done.set()
+
+    def _run(self, job: Job, fn: Callable[[Job], Dict[str, Any]]):
+        with self._lock:
+            try:
+                self._queued.remove(job)
+            except ValueError:
+                return  # withdrawn while queued
+            self._running += 1
+        job.started_at = time.monotonic()
+        try:
+            if job.deadline.cancelled:
+                job.status = CANCELLED
+                return
+            # The budget covers the analysis itself, not time spent waiting in the queue
+            job.deadline.restart()
+            job.status = RUNNING
+            job.result = fn(job)
+            job.status = CANCELLED if job.deadline.cancelled else DONE
+        except BaseException as e:
+            job.error = e
+            job.status = DONE
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                self._running -= 1
+                if job.status == DONE:
+                    self.completed += 1
+                    self._mean_duration += 0.2 * (job.elapsed() - self._mean_duration)
+            job._done.set()
+
+    def position(self, job: Job) -> int:
+        """Jobs ahead of this one in the queue; 0 once it is running"""
+        with self._lock:
+            try:
+                return self._queued.index(job)
+            except ValueError:
+                return 0
+
+    def eta(self, job: Job) -> float:
+        """Rough seconds until the job finishes, from the mean job duration"""
+        if job.done:
+            return 0.0
+        with self._lock:
+            mean = self._mean_duration
+            try:
+                ahead = self._queued.index(job)
+            except ValueError:
+                return max(0.0, mean - job.elapsed())
+        # Each full round of `workers` jobs ahead costs one mean duration; the
+        # round already running is on average half done
+        return (ahead // self.workers + 0.5) * mean + mean
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": len(self._queued),
+                "completed": self.completed,
+                "mean_duration": round(self._mean_duration, 2),
+            }
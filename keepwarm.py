@@ -0,0 +1,293 @@
+"""
+Cold-start prewarming and a business-hours keep-warm scheduler.
+
+A Modal deployment scales to zero when idle, so the first analysis after a
+quiet spell waits through a container cold start. Two remedies, both pinging
+HEALTH_ENDPOINT:
+
+    * prewarm(): one ping when the app starts or a user opens the upload page,
+      so the container boots while they pick a file. Repeated calls within
+      `min_spacing` seconds share the last ping.
+    * KeepWarm.start(): ping every `interval` seconds inside business hours,
+      and sleep outside them, so the container never idles out while people
+      are working but is allowed to scale down overnight.
+
+Every ping records its latency as cold or warm (the X-Cold-Start header
+if the endpoint sends one, otherwise latency over `cold_threshold`), to the
+medgemma_warmup_seconds histogram and optionally to a JSON-lines log. The
+log's report shows how often pings still found a cold container, which
+is the signal for tuning `interval` against cost.
+
+    MEDGEMMA_KEEPWARM=1                       # run the scheduler in the app
+    MEDGEMMA_KEEPWARM_HOURS="mon-fri 08:00-18:00"
+    MEDGEMMA_KEEPWARM_INTERVAL=240            # seconds between pings
+    MEDGEMMA_KEEPWARM_LOG=keepwarm.jsonl
+    MEDGEMMA_PREWARM=0                        # disable prewarm on page open
+
+    python keepwarm.py --hours "mon-fri 08:00-18:00" --interval 240 --log keepwarm.jsonl
+    python keepwarm.py --report keepwarm.jsonl
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from http_client import get_client
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULT_HOURS = "mon-fri 08:00-18:00"
+DEFAULT_INTERVAL = 240.0
+COLD_THRESHOLD = 5.0
+PING_TIMEOUT = 180.0
+
+WARMUP_SECONDS = metrics.REGISTRY.histogram("medgemma_warmup_seconds", "Keep-warm and prewarm ping latency",
+                                            ("state", "trigger"))
+
+
+class BusinessHours:
+    """Weekly window such as "mon-fri 08:00-18:00", "08:00-20:00" (every day) or "always", in local time.
+
+    A window may cross midnight ("mon-fri 22:00-06:00"); the days are the ones it opens on.
+    """
+
+    def __init__(self, spec: str = DEFAULT_HOURS):
+        self.spec = spec.strip().lower()
+        self.always = self.spec in ("always", "24/7", "")
+        self.days = set(range(7))
+        self.start = self.end = 0
+        if self.always:
+            return
+        match = re.fullmatch(r"(?:([a-z,\-]+)\s+)?(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})", self.spec)
+        if not match:
+            raise ValueError(f"Unrecognized business hours: {spec!r}")
+        days, h1, m1, h2, m2 = match.groups()
+        if days:
+            self.days = set()
+            for part in days.split(","):
+                first, _, last = part.partition("-")
+                i, j = DAYS.index(first[:3]), DAYS.index((last or first)[:3])
+                self.days.update(range(i, j + 1) if i <= j else list(range(i, 7)) + list(range(0, j + 1)))
+        self.start = int(h1) * 60 + int(m1)
+        self.end = int(h2) * 60 + int(m2)
+
+    def contains(self, when: Optional[datetime] = None) -> bool:
+        if self.always:
+            return True
+        when = when or datetime.now()
+        minute = when.hour * 60 + when.minute
+        if self.start <= self.end:
+            return when.weekday() in self.days and self.start <= minute < self.end
+        # Overnight: the evening part belongs to today, the early hours to yesterday's window
+        if minute >= self.start:
+            return when.weekday() in self.days
+        return minute < self.end and (when.weekday() - 1) % 7 in self.days
+
+    def seconds_until_open(self, when: Optional[datetime] = None) -> float:
+        """0 inside the window, else seconds until it next opens"""
+        when = when or datetime.now()
+        if self.contains(when):
+            return 0.0
+        midnight = when.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(8):
+            day = midnight + timedelta(days=offset)
+            opens = day + timedelta(minutes=self.start)
+            if day.weekday() in self.days and opens > when:
+                return (opens - when).total_seconds()
+        return 24 * 3600.0
+
+
+class KeepWarm:
+    """Pings a health URL on a business-hours schedule and on demand, recording cold vs warm latency"""
+
+    def __init__(self, health_url: str, interval: float = DEFAULT_INTERVAL, hours: Optional[BusinessHours] = None,
+                 cold_threshold: float = COLD_THRESHOLD, min_spacing: float = 60.0, log_path: Optional[str] = None,
+                 http=None, on_response: Optional[Callable[[Any], None]] = None):
+        self.health_url = health_url.strip()
+        self.interval = interval
+        self.hours = hours or BusinessHours()
+        self.cold_threshold = cold_threshold
+        self.min_spacing = min_spacing
+        self.log_path = log_path
+        self.http = http
+        # Called with every health response, so other health consumers need not ping too
+        self.on_response = on_response
+        self.samples: List[Dict[str, Any]] = []
+        self._last_ping = 0.0
+        self._pinging = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def ping(self, trigger: str = "manual") -> Dict[str, Any]:
+        """One timed health ping; returns the recorded sample"""
+        started = time.perf_counter()
+        ok, cold_header = False, None
+        try:
+            response = (self.http or get_client()).get(self.health_url, timeout=PING_TIMEOUT)
+            ok = response.status_code == 200
+            cold_header = response.headers.get("X-Cold-Start")
+            if self.on_response is not None:
+                self.on_response(response)
+        except Exception as e:
+            print(f"❌ problem in keep-warm ping: {e}")
+        latency = time.perf_counter() - started
+        cold = cold_header == "1" if cold_header is not None else latency > self.cold_threshold
+        sample = {"ts": round(time.time(), 3), "trigger": trigger, "latency": round(latency, 4),
+                  "state": "cold" if cold else "warm", "ok": ok}
+        WARMUP_SECONDS.observe(latency, state=sample["state"], trigger=trigger)
+        with self._lock:
+            self.samples.append(sample)
+            del self.samples[:-1000]
+            self._last_ping = time.monotonic()
+        if self.log_path:
+            try:
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(sample) + "\n")
+            except OSError as e:
+                print(f"❌ problem writing keep-warm log: {e}")
+        if cold:
+            print(f"🔥 Endpoint was cold ({trigger} ping took {latency:.1f}s)")
+        return sample
+
+    def _claim(self, spacing: float) -> bool:
+        """Reserve the next ping unless one is running or one finished within `spacing` seconds"""
+        with self._lock:
+            if self._pinging or time.monotonic() - self._last_ping < spacing:
+                return False
+            self._pinging = True
+            return True
+
+    def _ping_claimed(self, trigger: str):
+        try:
+            self.ping(trigger)
+        finally:
+            with self._lock:
+                self._pinging = False
+
+    def prewarm(self, trigger: str = "prewarm") -> bool:
+        """Ping in the background unless a ping is running or one finished within min_spacing; True if started"""
+        if not self._claim(self.min_spacing):
+            return False
+        threading.Thread(target=self._ping_claimed, args=(trigger,), name="medgemma-prewarm", daemon=True).start()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            closed_for = self.hours.seconds_until_open()
+            if closed_for > 0:
+                # Re-check at least hourly so clock changes and DST are picked up
+                self._stop.wait(min(closed_for, 3600.0))
+                continue
+            # A recent prewarm counts as this round's ping
+            if self._claim(self.interval):
+                self._ping_claimed("schedule")
+            with self._lock:
+                due = self._last_ping + self.interval - time.monotonic()
+            self._stop.wait(max(due, 1.0))
+
+    def start(self):
+        """Start the scheduler thread; safe to call more than once"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="medgemma-keepwarm", daemon=True)
+            self._thread.start()
+        print(f"♨️ Keep-warm every {self.interval:g}s during {self.hours.spec}")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self.samples)
+        return summarize(samples)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ping counts and latency percentiles by cold/warm state, and the cold rate by trigger"""
+    report: Dict[str, Any] = {"pings": len(samples)}
+    for state in ("cold", "warm"):
+        latencies = [s["latency"] for s in samples if s["state"] == state]
+        report[state] = {"count": len(latencies), "p50": _percentile(latencies, 0.5),
+                         "p95": _percentile(latencies, 0.95), "max": max(latencies) if latencies else None}
+    by_trigger: Dict[str, List[int]] = {}
+    for s in samples:
+        counts = by_trigger.setdefault(s["trigger"], [0, 0])
+        counts[0] += 1
+        counts[1] += s["state"] == "cold"
+    report["cold_rate"] = {trigger: round(cold / total, 3) for trigger, (total, cold) in by_trigger.items()}
+    return report
+
+
+def keepwarm_from_env(health_url: str, **kwargs) -> KeepWarm:
+    """KeepWarm configured by the MEDGEMMA_KEEPWARM_* variables; kwargs go to KeepWarm"""
+    return KeepWarm(
+        health_url,
+        interval=float(os.environ.get("MEDGEMMA_KEEPWARM_INTERVAL", DEFAULT_INTERVAL)),
+        hours=BusinessHours(os.environ.get("MEDGEMMA_KEEPWARM_HOURS", DEFAULT_HOURS)),
+        cold_threshold=float(os.environ.get("MEDGEMMA_COLD_THRESHOLD", COLD_THRESHOLD)),
+        log_path=os.environ.get("MEDGEMMA_KEEPWARM_LOG") or None,
+        **kwargs,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the MedGemma endpoint warm during business hours")
+    parser.add_argument("--health-url", type=str,
+                        help="Health endpoint to ping (default: MEDGEMMA_HEALTH_ENDPOINT or the deployed URL)")
+    parser.add_argument("--hours", type=str, default=os.environ.get("MEDGEMMA_KEEPWARM_HOURS", DEFAULT_HOURS),
+                        help='Window such as "mon-fri 08:00-18:00" or "always" (default: %(default)s)')
+    parser.add_argument("--interval", type=float,
+                        default=float(os.environ.get("MEDGEMMA_KEEPWARM_INTERVAL", DEFAULT_INTERVAL)),
+                        help="Seconds between pings inside the window (default: %(default)s)")
+    parser.add_argument("--cold-threshold", type=float, default=COLD_THRESHOLD,
+                        help="Pings slower than this count as cold starts (default: %(default)s)")
+    parser.add_argument("--log", type=str, default=os.environ.get("MEDGEMMA_KEEPWARM_LOG"),
+                        help="Append every ping to this JSON-lines file")
+    parser.add_argument("--once", action="store_true", help="Send one ping and exit")
+    parser.add_argument("--report", type=str, metavar="LOG", help="Summarize a keep-warm log and exit")
+    args = parser.parse_args()
+
+    if args.report:
+        with open(args.report) as f:
+            samples = [json.loads(line) for line in f if line.strip()]
+        print(json.dumps(summarize(samples), indent=2))
+        return 0
+
+    health_url = args.health_url
+    if not health_url:
+        from function import HEALTH_ENDPOINT
+        health_url = HEALTH_ENDPOINT
+    keeper = KeepWarm(health_url, interval=args.interval, hours=BusinessHours(args.hours),
+                      cold_threshold=args.cold_threshold, log_path=args.log)
+    if args.once:
+        print(json.dumps(keeper.ping("manual")))
+        return 0
+    metrics.start_exporter()
+    keeper.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        keeper.stop()
+        print(json.dumps(keeper.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
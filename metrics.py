@@ -0,0 +1,336 @@
+"""
+Counters, histograms and per-stage timers for the analysis pipeline.
+
+Metrics are rendered in the Prometheus text exposition format and exported
+one of two ways, chosen with MEDGEMMA_METRICS:
+
+    MEDGEMMA_METRICS=http:9464              # serve /metrics on 127.0.0.1:9464
+    MEDGEMMA_METRICS=file:medgemma.prom     # rewrite the file every 15s and at exit
+
+With MEDGEMMA_METRICS unset nothing is recorded: every inc/observe returns
+on its first line and timer() hands back a shared no-op context manager, so
+the instrumented code pays one attribute check per call.
+"""
+
+import atexit
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "Registry", name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class _Timer:
+    """Context manager observing its elapsed wall time into a histogram"""
+
+    __slots__ = ("histogram", "labels", "start", "elapsed")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+    elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values, in seconds by default"""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def time(self, **labels):
+        """`with histogram.time(stage="parse"):` records the block's duration"""
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return int(sum(counts[:-1])) if counts else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The set of metrics rendered together"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(self, name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(self, name, help_text, labelnames, buckets=buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Write the exposition atomically, for the node_exporter textfile collector"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+EXPORTER = os.environ.get("MEDGEMMA_METRICS", "")
+REGISTRY = Registry(enabled=bool(EXPORTER))
+
+# Pipeline metrics. Stages: encode, health, admission (queueing before the POST),
+# request (the POST round trip), inference and network (request split by
+# server-reported inference time), parse
+STAGE_SECONDS = REGISTRY.histogram("medgemma_stage_seconds", "Time spent per analysis pipeline stage", ("stage",))
+ANALYSES = REGISTRY.counter("medgemma_analyses_total", "Analyses sent to the endpoint", ("path",))
+FAILURES = REGISTRY.counter("medgemma_analysis_failures_total", "Failed analyses by error_type", ("error_type",))
+JSON_REPAIRS = REGISTRY.counter("medgemma_json_repairs_total",
+                                "Client-side repairs of unparseable model output", ("outcome",))
+CACHE_LOOKUPS = REGISTRY.counter("medgemma_cache_lookups_total", "Result cache lookups", ("result",))
+HEALTH_CHECKS = REGISTRY.counter("medgemma_health_checks_total", "Health probes by outcome", ("healthy",))
+ADMISSIONS = REGISTRY.counter("medgemma_admissions_total", "Admission control decisions by outcome", ("outcome",))
+SINGLEFLIGHT = REGISTRY.counter("medgemma_singleflight_calls_total",
+                                "Coalesced calls by role; role=shared are upstream calls saved", ("group", "role"))
+BATCH_CALLS = REGISTRY.counter("medgemma_batching_calls_total",
+                               "Calls sent in a micro-batch (mode=batched) or on their own", ("group", "mode"))
+BATCH_SIZE = REGISTRY.histogram("medgemma_batch_size", "Items per micro-batched request", ("group",),
+                                buckets=(2, 4, 8, 16, 32))
+
+# model_info keys an endpoint may use to report server-side inference seconds
+INFERENCE_TIME_KEYS = ("inference_time", "generation_time", "processing_time")
+
+
+def timer(stage: str):
+    """Time one pipeline stage: `with metrics.timer("encode"): ...`"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def record_request(elapsed: float, model_info: Optional[dict] = None):
+    """Record a POST round trip, split into inference and network when the server reports it"""
+    if not REGISTRY.enabled:
+        return
+    STAGE_SECONDS.observe(elapsed, stage="request")
+    for key in INFERENCE_TIME_KEYS:
+        inference = (model_info or {}).get(key)
+        if isinstance(inference, (int, float)):
+            STAGE_SECONDS.observe(inference, stage="inference")
+            STAGE_SECONDS.observe(max(0.0, elapsed - inference), stage="network")
+            break
+
+
+def record_outcome(result: Optional[dict]):
+    """Count a failed analysis under its error_type"""
+    if not REGISTRY.enabled or not result:
+        return
+    if "error" in result or result.get("success") is False:
+        FAILURES.inc(error_type=result.get("error_type") or "unknown")
+
+
+def counted(path: str):
+    """Decorator counting calls of an analysis function and failures in its result dict"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return fn(*args, **kwargs)
+            ANALYSES.inc(path=path)
+            result = fn(*args, **kwargs)
+            record_outcome(result)
+            return result
+        return wrapper
+    return decorate
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="medgemma-metrics", daemon=True).start()
+    print(f"📈 Metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def start_file_dumper(path: str, interval: float = 15.0):
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                REGISTRY.dump(path)
+            except OSError as e:
+                print(f"❌ problem writing metrics to {path}: {e}")
+
+    threading.Thread(target=loop, name="medgemma-metrics-dump", daemon=True).start()
+    atexit.register(REGISTRY.dump, path)
+
+
+def start_exporter(spec: str = EXPORTER):
+    """Start the exporter described by a MEDGEMMA_METRICS value; safe to call more than once"""
+    global _started
+    with _start_lock:
+        if _started or not spec:
+            return
+        _started = True
+    kind, _, target = spec.partition(":")
+    if kind == "http":
+        host, _, port = target.rpartition(":")
+        try:
+            start_http_server(int(port), host or "127.0.0.1")
+        except OSError as e:
+            # Another Streamlit/CLI process already owns the port
+            print(f"❌ problem starting metrics server: {e}")
+    elif kind == "file":
+        start_file_dumper(target, float(os.environ.get("MEDGEMMA_METRICS_INTERVAL", "15")))
+    else:
+        print(f"❌ Unknown MEDGEMMA_METRICS exporter: {spec}")
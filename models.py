@@ -0,0 +1,329 @@
+"""
+Typed model of an X-ray analysis, parsed once per response.
+
+The endpoint returns loosely structured JSON written by the model: sections
+may be missing, lists may arrive as a single string, booleans as "yes", and
+absent values as the string "None". AnalysisResult.from_response validates
+and normalizes all of that in one pass, so renderers read plain attributes
+instead of repeating .get() chains with defaults.
+
+Every class is a frozen, slotted dataclass: no per-instance __dict__, cheap
+to pickle into st.cache_data / session state, and raw_response is dropped
+once it has been parsed.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+UNKNOWN = "Unknown"
+
+_TRUE_STRINGS = {"true", "yes", "y", "1", "present", "involved"}
+_ABSENT_STRINGS = {"", "none", "null", "n/a"}
+
+
+def _text(value: Any) -> str:
+    """A display string; None and "None"-like placeholders become empty"""
+    if value is None or isinstance(value, (dict, list)):
+        return ""
+    text = str(value).strip()
+    return "" if text.lower() in _ABSENT_STRINGS else text
+
+
+def _flag(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE_STRINGS
+    return bool(value)
+
+
+def _texts(value: Any) -> Tuple[str, ...]:
+    """A tuple of non-empty strings from a list or a single string"""
+    if isinstance(value, (list, tuple)):
+        return tuple(text for text in map(_text, value) if text)
+    text = _text(value)
+    return (text,) if text else ()
+
+
+def _records(value: Any) -> Tuple[Dict[str, Any], ...]:
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        return ()
+    return tuple(item for item in value if isinstance(item, dict))
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Section:
+    """Shared serialization for the section dataclasses"""
+
+    __slots__ = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The response-schema dict for this section"""
+        out = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if isinstance(value, tuple):
+                value = [item.to_dict() if isinstance(item, _Section) else item for item in value]
+            out[f.name] = value
+        return out
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """(field name, value) pairs, in schema order"""
+        for f in fields(self):
+            yield f.name, getattr(self, f.name)
+
+
+@dataclass(frozen=True, slots=True)
+class ImageMetadata(_Section):
+    body_part: str = ""
+    view_type: str = ""
+    side: str = ""
+    side_marker: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ImageMetadata":
+        return cls(
+            body_part=_text(data.get("body_part")),
+            view_type=_text(data.get("view_type")),
+            side=_text(data.get("side")),
+            side_marker=_text(data.get("side_marker")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Anatomy(_Section):
+    bones_identified: Tuple[str, ...] = ()
+    joints_in_view: Tuple[str, ...] = ()
+    soft_tissues_evaluated: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Anatomy":
+        return cls(
+            bones_identified=_texts(data.get("bones_identified")),
+            joints_in_view=_texts(data.get("joints_in_view")),
+            soft_tissues_evaluated=_flag(data.get("soft_tissues_evaluated")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Fracture(_Section):
+    bone_name: str = UNKNOWN
+    location_on_bone: str = UNKNOWN
+    type_of_fracture: str = UNKNOWN
+    displacement: str = UNKNOWN
+    angulation: str = ""
+    involves_joint_surface: bool = False
+    open_fracture: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Fracture":
+        return cls(
+            bone_name=_text(data.get("bone_name")) or UNKNOWN,
+            location_on_bone=_text(data.get("location_on_bone")) or UNKNOWN,
+            type_of_fracture=_text(data.get("type_of_fracture")) or UNKNOWN,
+            displacement=_text(data.get("displacement")) or UNKNOWN,
+            angulation=_text(data.get("angulation")),
+            involves_joint_surface=_flag(data.get("involves_joint_surface")),
+            open_fracture=_flag(data.get("open_fracture")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Abnormality(_Section):
+    type: str = UNKNOWN
+    description: str = ""
+    location: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Abnormality":
+        return cls(
+            type=_text(data.get("type")) or UNKNOWN,
+            description=_text(data.get("description")),
+            location=_text(data.get("location")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Findings(_Section):
+    fracture_detected: bool = False
+    fracture_details: Tuple[Fracture, ...] = ()
+    other_abnormalities: Tuple[Abnormality, ...] = ()
+    bone_density: str = ""
+    degenerative_changes: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Findings":
+        fractures = tuple(Fracture.from_dict(item) for item in _records(data.get("fracture_details")))
+        return cls(
+            fracture_detected=_flag(data.get("fracture_detected")),
+            fracture_details=fractures,
+            other_abnormalities=tuple(Abnormality.from_dict(item) for item in _records(data.get("other_abnormalities"))),
+            bone_density=_text(data.get("bone_density")),
+            degenerative_changes=_texts(data.get("degenerative_changes")),
+        )
+
+    @property
+    def fractures_unflagged(self) -> bool:
+        """The model listed fracture details but did not flag a fracture"""
+        return bool(self.fracture_details) and not self.fracture_detected
+
+
+@dataclass(frozen=True, slots=True)
+class ClinicalAssessment(_Section):
+    severity_level: str = UNKNOWN
+    urgency: str = UNKNOWN
+    differential_diagnosis: Tuple[str, ...] = ()
+    recommendations: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ClinicalAssessment":
+        return cls(
+            severity_level=_text(data.get("severity_level")) or UNKNOWN,
+            urgency=_text(data.get("urgency")) or UNKNOWN,
+            differential_diagnosis=_texts(data.get("differential_diagnosis")),
+            recommendations=_texts(data.get("recommendations")),
+        )
+
+    @property
+    def urgency_icon(self) -> str:
+        return {"emergent": "🚨", "urgent": "⚠️", "routine": "✅"}.get(self.urgency.lower(), "")
+
+
+@dataclass(frozen=True, slots=True)
+class TechnicalNotes(_Section):
+    image_quality: str = UNKNOWN
+    artifacts_present: bool = False
+    positioning_notes: str = ""
+    comments: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TechnicalNotes":
+        return cls(
+            image_quality=_text(data.get("image_quality")) or UNKNOWN,
+            artifacts_present=_flag(data.get("artifacts_present")),
+            positioning_notes=_text(data.get("positioning_notes")),
+            comments=_text(data.get("comments")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ModelInfo(_Section):
+    model_id: str = UNKNOWN
+    max_tokens: Optional[int] = None
+    input_tokens: Optional[int] = None
+    device: str = UNKNOWN
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelInfo":
+        return cls(
+            model_id=_text(data.get("model_id")) or UNKNOWN,
+            max_tokens=_int(data.get("max_tokens")),
+            input_tokens=_int(data.get("input_tokens")),
+            device=_text(data.get("device")) or UNKNOWN,
+        )
+
+
+# Response key -> section type, in report order
+SECTION_TYPES = {
+    "image_metadata": ImageMetadata,
+    "anatomy": Anatomy,
+    "findings": Findings,
+    "clinical_assessment": ClinicalAssessment,
+    "technical_notes": TechnicalNotes,
+}
+
+
+def parse_section(key: str, value: Any):
+    """Parse one top-level section, e.g. as it arrives from a stream; None if unusable"""
+    section_type = SECTION_TYPES.get(key)
+    if section_type is None or not isinstance(value, dict) or not value:
+        return None
+    return section_type.from_dict(value)
+
+
+@dataclass(frozen=True, slots=True)
+class AnalysisResult:
+    """One analysis response: its sections, model info and outcome"""
+
+    image_metadata: Optional[ImageMetadata] = None
+    anatomy: Optional[Anatomy] = None
+    findings: Optional[Findings] = None
+    clinical_assessment: Optional[ClinicalAssessment] = None
+    technical_notes: Optional[TechnicalNotes] = None
+    model_info: Optional[ModelInfo] = None
+    success: bool = True
+    repaired: bool = False
+    error: str = ""
+    error_type: str = ""
+    problems: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_response(cls, result: Optional[Dict[str, Any]],
+                      repair: Optional[Callable[[str], Any]] = None) -> "AnalysisResult":
+        """Validate a response dict (or bare analysis dict) into the model.
+
+        `repair` (e.g. function.clean_and_parse_json) recovers the analysis
+        from raw_response when the endpoint could not parse the model output.
+        """
+        if not isinstance(result, dict):
+            return cls(success=False, error="Empty response", error_type="empty")
+
+        data, repaired = result, False
+        if result.get("raw_response") and repair is not None:
+            cleaned = repair(result["raw_response"])
+            if isinstance(cleaned, dict):
+                data, repaired = cleaned, True
+
+        analysis = data.get("analysis")
+        if not isinstance(analysis, dict):
+            analysis = data if any(key in data for key in SECTION_TYPES) else {}
+
+        sections, problems = {}, []
+        for key in SECTION_TYPES:
+            value = analysis.get(key)
+            if value is None:
+                continue
+            section = parse_section(key, value)
+            if section is None and value:
+                problems.append(f"{key}: expected an object, got {type(value).__name__}")
+            sections[key] = section
+
+        model_info = result.get("model_info") or data.get("model_info")
+        return cls(
+            **sections,
+            model_info=ModelInfo.from_dict(model_info) if isinstance(model_info, dict) else None,
+            success=result.get("success") is not False,
+            repaired=repaired,
+            error=_text(result.get("error")),
+            error_type=_text(result.get("error_type")),
+            problems=tuple(problems),
+        )
+
+    @property
+    def ok(self) -> bool:
+        """True for a successful analysis (the cases worth caching)"""
+        return self.success and not self.error
+
+    def sections(self) -> Iterator[Tuple[str, _Section]]:
+        """(response key, section) for each section present, in report order"""
+        for key in SECTION_TYPES:
+            section = getattr(self, key)
+            if section is not None:
+                yield key, section
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The response-schema dict, without raw_response"""
+        out: Dict[str, Any] = {"success": self.success}
+        if self.error:
+            out["error"] = self.error
+            out["error_type"] = self.error_type
+        out["analysis"] = {key: section.to_dict() for key, section in self.sections()}
+        if self.model_info is not None:
+            out["model_info"] = self.model_info.to_dict()
+        return out
@@ -0,0 +1,115 @@
+"""
+Client-side image normalization before base64 encoding.
+
+Radiographs are uploaded at full detector resolution, but the model only looks
+at a few hundred pixels per side. Downscaling, converting to 8-bit grayscale,
+cropping uniform borders and re-encoding as JPEG shrinks the payload by an
+order of magnitude, which cuts both upload time and endpoint decode time.
+"""
+
+import io
+import os
+import time
+from typing import Any, Dict, Tuple
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+except ImportError:  # Pillow ships with streamlit; the CLI can run without it
+    Image = None
+
+DEFAULT_MAX_EDGE = int(os.environ.get("MEDGEMMA_MAX_EDGE", "1024"))
+DEFAULT_QUALITY = int(os.environ.get("MEDGEMMA_JPEG_QUALITY", "85"))
+BORDER_TOLERANCE = 8
+# Modes with more than 8 bits per pixel, e.g. 16-bit radiograph PNG/DICOM exports
+HIGH_BIT_DEPTH_MODES = ("I", "I;16", "I;16B", "I;16L", "I;16N", "F")
+
+
+def preprocessing_key(enabled: bool = True, max_edge: int = DEFAULT_MAX_EDGE, quality: int = DEFAULT_QUALITY) -> str:
+    """Cache-key tag for the normalization settings: "<max_edge>:<quality>", or "raw" when disabled"""
+    return f"{max_edge}:{quality}" if enabled else "raw"
+
+
+def _to_grayscale(img: "Image.Image") -> "Image.Image":
+    """8-bit grayscale; 16-bit and float images are rescaled over their value range, not clipped at 255"""
+    if img.mode not in HIGH_BIT_DEPTH_MODES:
+        return img.convert("L")
+    img = img.convert("F")
+    low, high = img.getextrema()
+    scale = 255.0 / (high - low) if high > low else 0.0
+    return img.point(lambda v: (v - low) * scale).convert("L")
+
+
+def _crop_uniform_border(img: "Image.Image") -> "Image.Image":
+    """Trim rows/columns that match the corner colour (collimation bars, padding)"""
+    background = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, background)
+    # Ignore noise below the tolerance so near-black borders still crop
+    diff = diff.point(lambda p: 255 if p > BORDER_TOLERANCE else 0)
+    bbox = diff.getbbox()
+    if bbox and bbox != (0, 0) + img.size:
+        return img.crop(bbox)
+    return img
+
+
+def normalize_image(
+    image_bytes: bytes,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    quality: int = DEFAULT_QUALITY,
+    crop_borders: bool = True,
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Downscale, grayscale, crop and re-encode an image.
+
+    Returns the bytes to send and a stats dict with the original and final
+    sizes, bytes saved and milliseconds spent. The original bytes are returned
+    untouched if Pillow is unavailable, decoding fails, or the result would be
+    larger than the input.
+    """
+    start = time.perf_counter()
+    stats = {
+        "original_bytes": len(image_bytes),
+        "final_bytes": len(image_bytes),
+        "bytes_saved": 0,
+        "elapsed_ms": 0.0,
+        "applied": False,
+    }
+    if Image is None:
+        return image_bytes, stats
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img = ImageOps.exif_transpose(img)
+            img = _to_grayscale(img)
+            if crop_borders:
+                img = _crop_uniform_border(img)
+            if max(img.size) > max_edge:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            normalized = out.getvalue()
+            stats["size"] = img.size
+    except Exception as e:
+        print(f"⚠️ Image normalization skipped: {e}")
+        stats["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        return image_bytes, stats
+
+    stats["elapsed_ms"] = (time.perf_counter() - start) * 1000
+    if len(normalized) >= len(image_bytes):
+        return image_bytes, stats
+
+    stats.update(
+        final_bytes=len(normalized),
+        bytes_saved=len(image_bytes) - len(normalized),
+        applied=True,
+    )
+    return normalized, stats
+
+
+def describe(stats: Dict[str, Any]) -> str:
+    """One-line human summary of normalize_image stats"""
+    if not stats.get("applied"):
+        return f"sent as-is ({stats['original_bytes'] / 1024:.0f} KB, {stats['elapsed_ms']:.0f} ms)"
+    return (
+        f"{stats['original_bytes'] / 1024:.0f} KB -> {stats['final_bytes'] / 1024:.0f} KB "
+        f"(saved {stats['bytes_saved'] / 1024:.0f} KB in {stats['elapsed_ms']:.0f} ms)"
+    )
@@ -0,0 +1,199 @@
+"""
+Opt-in CPU and memory profiling of individual analyses.
+
+    python test.py --image xray.png --profile profiles/ --profile-collapsed
+    MEDGEMMA_PROFILE=profiles/ streamlit run app.py
+
+Each profiled analysis writes, under the output directory:
+
+    <stamp>-<label>.prof        cProfile stats (snakeviz, pstats, gprof2dot)
+    <stamp>-<label>.txt         top functions by cumulative time, and memory peak
+    <stamp>-<label>.mem.txt     allocations live at the traced-memory peak
+    <stamp>-<label>.collapsed   flamegraph.pl / speedscope stacks (optional)
+
+The memory report is taken at the peak rather than at the end, because the
+interesting allocations, such as the copies of a large upload made while it
+is decoded, resized and base64-encoded, are already freed by the time the
+analysis returns. A sampler thread snapshots tracemalloc whenever traced
+memory climbs past the previous high-water mark. tracemalloc only sees
+Python allocations, so Pillow's decoded pixel buffers are not counted; the
+bytes objects holding the upload, the JPEG and the base64 text are.
+
+cProfile only sees the thread that enabled it, and tracemalloc is
+process-wide. So profiled analyses run one at a time.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional
+
+TRACEMALLOC_FRAMES = 25
+# Take a new peak snapshot only once memory has grown this much past the last one
+PEAK_STEP_BYTES = 1024 * 1024
+MAX_STACK_DEPTH = 64
+
+_session_lock = threading.Lock()
+
+
+def _func_label(func) -> str:
+    filename, lineno, name = func
+    if filename == "~":
+        return name  # built-in, e.g. <built-in method builtins.sorted>
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def collapsed_stacks(stats: pstats.Stats) -> List[str]:
+    """Flamegraph "a;b;c <microseconds>" lines reconstructed from cProfile's call graph.
+
+    cProfile keeps caller->callee edges, not whole stacks, so a function's
+    self time is split across the paths that reach it in proportion to the
+    time each incoming edge accounts for.
+    """
+    entries = stats.stats
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    totals: Dict[str, float] = defaultdict(float)
+
+    def walk(func, path, on_path, scale):
+        _, _, self_time, cumulative, _ = entries[func]
+        path = path + (_func_label(func),)
+        if self_time * scale > 0:
+            totals[";".join(path)] += self_time * scale
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            callee_total = entries[callee][3]
+            share = scale * edge_time / callee_total if callee_total else 0.0
+            # Recursion and paths worth under a microsecond add nothing visible
+            if callee in on_path or share * callee_total < 1e-6:
+                continue
+            walk(callee, path, on_path | {callee}, share)
+
+    for root in roots:
+        walk(root, (), frozenset([root]), 1.0)
+    return [f"{stack} {int(seconds * 1e6)}" for stack, seconds in sorted(totals.items()) if seconds >= 1e-6]
+
+
+class _PeakSampler:
+    """Snapshot tracemalloc each time traced memory reaches a new high"""
+
+    def __init__(self, baseline: int, interval: float = 0.005):
+        self.interval = interval
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_bytes = baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="medgemma-peak-sampler", daemon=True)
+
+    def _take(self, current: int):
+        self.snapshot = tracemalloc.take_snapshot()
+        self.snapshot_bytes = current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            current, _ = tracemalloc.get_traced_memory()
+            if current >= self.snapshot_bytes + PEAK_STEP_BYTES:
+                self._take(current)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        # The final state may be the peak (or nothing grew past the first step)
+        current, _ = tracemalloc.get_traced_memory()
+        if self.snapshot is None or current > self.snapshot_bytes:
+            self._take(current)
+
+
+class Profiler:
+    """Writes CPU and memory profiles of labelled code blocks to a directory"""
+
+    def __init__(self, output_dir, collapsed: bool = False, top: int = 30):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.collapsed = collapsed
+        self.top = top
+
+    def _stem(self, label: str) -> Path:
+        safe = re.sub(r"[^A-Za-z0-9._-]+", "_", label)[:80] or "analysis"
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        return self.output_dir / f"{stamp}-{safe}"
+
+    @contextmanager
+    def profile(self, label: str = "analysis"):
+        """Profile the enclosed block as one analysis"""
+        with _session_lock:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            sampler = _PeakSampler(baseline)
+            sampler.start()
+            cpu = cProfile.Profile()
+            wall_start = time.perf_counter()
+            cpu.enable()
+            try:
+                yield
+            finally:
+                cpu.disable()
+                wall = time.perf_counter() - wall_start
+                sampler.stop()
+                _, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+                self._write(self._stem(label), label, cpu, wall, baseline, peak, sampler)
+
+    def _write(self, stem: Path, label: str, cpu: cProfile.Profile, wall: float,
+               baseline: int, peak: int, sampler: _PeakSampler):
+        cpu.dump_stats(f"{stem}.prof")
+        summary = io.StringIO()
+        stats = pstats.Stats(cpu, stream=summary)
+        summary.write(f"Profile of {label}\n")
+        summary.write(f"Wall time: {wall:.3f}s\n")
+        summary.write(f"Traced memory peak: {(peak - baseline) / 1e6:.1f} MB above {baseline / 1e6:.1f} MB baseline\n\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        Path(f"{stem}.txt").write_text(summary.getvalue(), encoding="utf-8")
+
+        if sampler.snapshot is not None:
+            snapshot = sampler.snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ))
+            lines = [f"Allocations live at the {sampler.snapshot_bytes / 1e6:.1f} MB peak of {label}", ""]
+            for stat in snapshot.statistics("traceback")[:self.top]:
+                lines.append(f"{stat.size / 1e6:8.2f} MB in {stat.count} blocks")
+                lines.extend(f"    {line}" for line in stat.traceback.format(limit=8, most_recent_first=True))
+                lines.append("")
+            Path(f"{stem}.mem.txt").write_text("\n".join(lines), encoding="utf-8")
+
+        if self.collapsed:
+            Path(f"{stem}.collapsed").write_text("\n".join(collapsed_stacks(stats)) + "\n", encoding="utf-8")
+        print(f"🧪 Profile written: {stem}.txt (wall {wall:.2f}s, memory peak +{(peak - baseline) / 1e6:.1f} MB)")
+
+
+def profiler_from_env() -> Optional[Profiler]:
+    """Profiler configured by MEDGEMMA_PROFILE (output dir) and MEDGEMMA_PROFILE_COLLAPSED"""
+    output_dir = os.environ.get("MEDGEMMA_PROFILE")
+    if not output_dir:
+        return None
+    return Profiler(output_dir, collapsed=os.environ.get("MEDGEMMA_PROFILE_COLLAPSED", "") not in ("", "0"))
+
+
+def maybe_profile(profiler: Optional[Profiler], label: str):
+    """profiler.profile(label), or a no-op when profiling is off"""
+    return profiler.profile(label) if profiler is not None else nullcontext()
@@ -0,0 +1,174 @@
+"""
+Content-addressed cache for X-ray analysis results.
+
+Entries are keyed by the SHA-256 of the image bytes together with max_tokens,
+the prompt, the preprocessing settings and the model id reported in
+model_info, so re-uploads of the same film skip inference while a redeployed
+model or a different downscale never serves stale answers.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from metrics import CACHE_LOOKUPS
+
+DEFAULT_PROMPT_KEY = "default"
+RAW_IMAGE_KEY = "raw"
+UNKNOWN_MODEL = "unknown"
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """SHA-256 hex digest of raw image bytes"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def file_digest(path) -> str:
+    """SHA-256 hex digest of a file, streamed from disk"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_cacheable(result: Optional[Dict[str, Any]]) -> bool:
+    """Only successful analyses are worth keeping"""
+    return bool(result) and "error" not in result and result.get("success", True) is not False
+
+
+class AnalysisCache:
+    """In-memory LRU tier with an optional size-bounded on-disk tier"""
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.model_id = UNKNOWN_MODEL
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            # Reuse the last model id seen so disk entries hit from a fresh process
+            try:
+                self.model_id = (self.disk_dir / "MODEL_ID").read_text().strip() or UNKNOWN_MODEL
+            except OSError:
+                pass
+
+    def key(self, digest: str, max_tokens: int, prompt: Optional[str] = None, preprocessing: str = RAW_IMAGE_KEY) -> str:
+        """Cache key for an image digest under the current model id; see preprocess.preprocessing_key"""
+        parts = [digest, str(max_tokens), prompt or DEFAULT_PROMPT_KEY, preprocessing, self.model_id]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(result="hit")
+                return result
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            CACHE_LOOKUPS.inc(result="disk_hit")
+            self._remember(key, result)
+        return result
+
+    def put(self, digest: str, max_tokens: int, prompt: Optional[str], result: Dict[str, Any],
+            preprocessing: str = RAW_IMAGE_KEY) -> Optional[str]:
+        """Store a successful result; learns the model id from its model_info"""
+        if not is_cacheable(result):
+            return None
+        model_id = (result.get("model_info") or {}).get("model_id")
+        if model_id and model_id != self.model_id:
+            self.model_id = model_id
+            if self.disk_dir:
+                try:
+                    (self.disk_dir / "MODEL_ID").write_text(model_id)
+                except OSError:
+                    pass
+        key = self.key(digest, max_tokens, prompt, preprocessing)
+        with self._lock:
+            self._remember(key, result)
+        self._write_disk(key, result)
+        return key
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        path = self.disk_dir / f"{key}.json"
+        try:
+            with open(path, "r") as f:
+                result = json.load(f)
+            os.utime(path)  # mark as recently used for eviction
+            return result
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write_disk(self, key: str, result: Dict[str, Any]):
+        if not self.disk_dir:
+            return
+        try:
+            tmp = self.disk_dir / f"{key}.json.tmp"
+            with open(tmp, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp, self.disk_dir / f"{key}.json")
+            self._evict_disk()
+        except OSError as e:
+            print(f"❌ Failed to write analysis cache entry: {e}")
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for path in self.disk_dir.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        # Oldest first until we are back under budget
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._memory),
+            }
@@ -0,0 +1,308 @@
+"""
+Local SQLite history of every analysis.
+
+Each analysis becomes one row with the image hash, timestamp, latency, token
+counts and the key findings as indexed columns, plus the parsed result as
+JSON. Writes are queued and committed in batches by a background thread, so
+recording an analysis never waits on the disk.
+
+    python result_store.py --today --urgency emergent --fracture
+    python result_store.py --since 2026-10-01 --body-part wrist --json
+    python result_store.py --digest 3fa2... --with-result
+
+MEDGEMMA_RESULT_STORE sets the database path (default: medgemma_results.db);
+set it to "off" to disable recording.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+from models import AnalysisResult
+
+DEFAULT_STORE_PATH = "medgemma_results.db"
+DISABLED_VALUES = ("", "0", "off", "none")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id                INTEGER PRIMARY KEY,
+    created_at        REAL NOT NULL,
+    image_digest      TEXT,
+    image_name        TEXT,
+    source            TEXT,
+    latency_s         REAL,
+    input_tokens      INTEGER,
+    max_tokens        INTEGER,
+    model_id          TEXT,
+    success           INTEGER NOT NULL,
+    error_type        TEXT,
+    fracture_detected INTEGER,
+    body_part         TEXT,
+    view_type         TEXT,
+    severity          TEXT,
+    urgency           TEXT,
+    result_json       TEXT
+);
+CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses (created_at);
+CREATE INDEX IF NOT EXISTS analyses_digest ON analyses (image_digest);
+CREATE INDEX IF NOT EXISTS analyses_fracture ON analyses (fracture_detected, created_at);
+CREATE INDEX IF NOT EXISTS analyses_body_part ON analyses (body_part, created_at);
+CREATE INDEX IF NOT EXISTS analyses_urgency ON analyses (urgency, created_at);
+"""
+
+COLUMNS = ("created_at", "image_digest", "image_name", "source", "latency_s", "input_tokens", "max_tokens",
+           "model_id", "success", "error_type", "fracture_detected", "body_part", "view_type", "severity",
+           "urgency", "result_json")
+SUMMARY_COLUMNS = ("id",) + COLUMNS[:-1]
+
+Timestamp = Union[float, datetime, str, None]
+
+
+def _key(value: str) -> Optional[str]:
+    """Indexed text columns are stored lower-case so filters are exact index lookups"""
+    return (value.strip().lower() or None) if value else None
+
+
+def _timestamp(value: Timestamp) -> Optional[float]:
+    """Unix time from a number, a datetime or an ISO 8601 string (local time if naive)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def start_of_today() -> float:
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+class ResultStore:
+    """SQLite table of analyses, written in batches from a background thread"""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, batch_size: int = 64, flush_interval: float = 1.0):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # One connection shared by the writer and queries; _db_lock serializes it
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.written = 0
+        self._writer = threading.Thread(target=self._run, name="medgemma-result-store", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, result: Union[AnalysisResult, Dict[str, Any], None], digest: Optional[str] = None,
+               image_name: Optional[str] = None, latency: Optional[float] = None, source: str = "cli",
+               max_tokens: Optional[int] = None, created_at: Optional[float] = None):
+        """Queue one analysis (a response dict or a parsed AnalysisResult) for the next batch"""
+        if result is None or self._closed:
+            return
+        analysis = result if isinstance(result, AnalysisResult) else AnalysisResult.from_response(result)
+        metadata, findings = analysis.image_metadata, analysis.findings
+        assessment, model_info = analysis.clinical_assessment, analysis.model_info
+        row = (
+            created_at if created_at is not None else time.time(),
+            digest,
+            image_name,
+            source,
+            latency,
+            model_info.input_tokens if model_info else None,
+            max_tokens if max_tokens is not None else model_info.max_tokens if model_info else None,
+            model_info.model_id if model_info else None,
+            int(analysis.ok),
+            analysis.error_type or None,
+            int(findings.fracture_detected) if findings else None,
+            _key(metadata.body_part) if metadata else None,
+            _key(metadata.view_type) if metadata else None,
+            _key(assessment.severity_level) if assessment else None,
+            _key(assessment.urgency) if assessment else None,
+            json.dumps(analysis.to_dict(), separators=(",", ":")),
+        )
+        with self._pending_lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Commit every queued row in one transaction; returns the number written"""
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        try:
+            with self._db_lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows
+                )
+                self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"❌ Failed to write {len(rows)} analyses to {self.path}: {e}")
+            with self._db_lock:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+            return 0
+        self.written += len(rows)
+        return len(rows)
+
+    def query(self, since: Timestamp = None, until: Timestamp = None, fracture: Optional[bool] = None,
+              body_part: Optional[str] = None, urgency: Optional[str] = None, severity: Optional[str] = None,
+              digest: Optional[str] = None, source: Optional[str] = None, limit: Optional[int] = 100,
+              with_result: bool = False) -> List[Dict[str, Any]]:
+        """Matching analyses, newest first"""
+        where, params = self._where(since, until, fracture, body_part, urgency, severity, digest, source)
+        columns = ", ".join(SUMMARY_COLUMNS + (("result_json",) if with_result else ()))
+        sql = f"SELECT {columns} FROM analyses{where} ORDER BY created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_dict(row) for row in rows]
+
+    def count(self, since: Timestamp = None, until: Timestamp = None, fracture: Optional[bool] = None,
+              body_part: Optional[str] = None, urgency: Optional[str] = None, severity: Optional[str] = None,
+              digest: Optional[str] = None, source: Optional[str] = None) -> int:
+        where, params = self._where(since, until, fracture, body_part, urgency, severity, digest, source)
+        self.flush()
+        with self._db_lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM analyses{where}", params).fetchone()[0]
+
+    @staticmethod
+    def _where(since, until, fracture, body_part, urgency, severity, digest, source):
+        clauses, params = [], []
+        for column, value in (("body_part", _key(body_part)), ("urgency", _key(urgency)),
+                              ("severity", _key(severity)), ("image_digest", digest), ("source", source)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if fracture is not None:
+            clauses.append("fracture_detected = ?")
+            params.append(int(fracture))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(_timestamp(until))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    @staticmethod
+    def _row_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        out = dict(row)
+        out["created_at"] = datetime.fromtimestamp(out["created_at"]).isoformat(timespec="seconds")
+        out["success"] = bool(out["success"])
+        if out["fracture_detected"] is not None:
+            out["fracture_detected"] = bool(out["fracture_detected"])
+        if "result_json" in out:
+            out["result"] = json.loads(out.pop("result_json") or "null")
+        return out
+
+    def close(self):
+        """Write anything still queued and close the database"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+def open_store(path: Optional[str]) -> Optional[ResultStore]:
+    """ResultStore at `path`, or None when recording is disabled ("off")"""
+    if path is None or path.strip().lower() in DISABLED_VALUES:
+        return None
+    return ResultStore(path)
+
+
+def store_from_env(default: str = DEFAULT_STORE_PATH) -> Optional[ResultStore]:
+    """ResultStore at MEDGEMMA_RESULT_STORE (or `default`), or None when set to "off" """
+    return open_store(os.environ.get("MEDGEMMA_RESULT_STORE", default))
+
+
+def format_row(row: Dict[str, Any]) -> str:
+    fracture = {True: "🚨 fracture", False: "no fracture", None: "—"}[row["fracture_detected"]]
+    status = "✅" if row["success"] else f"❌ {row['error_type'] or 'failed'}"
+    latency = f"{row['latency_s']:.1f}s" if row["latency_s"] is not None else "—"
+    return (f"{row['created_at']}  {status}  {row['image_name'] or (row['image_digest'] or '?')[:12]}  "
+            f"{row['body_part'] or '—'} / {row['view_type'] or '—'}  {fracture}  "
+            f"{row['severity'] or '—'} / {row['urgency'] or '—'}  {latency}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local history of X-ray analyses")
+    parser.add_argument("--db", type=str, default=os.environ.get("MEDGEMMA_RESULT_STORE", DEFAULT_STORE_PATH),
+                        help="SQLite database (default: $MEDGEMMA_RESULT_STORE or %(default)s)")
+    when = parser.add_mutually_exclusive_group()
+    when.add_argument("--today", action="store_true", help="Only analyses since local midnight")
+    when.add_argument("--hours", type=float, help="Only analyses from the last N hours")
+    when.add_argument("--since", type=str, help="Only analyses at or after this ISO date/time")
+    parser.add_argument("--until", type=str, help="Only analyses before this ISO date/time")
+    fracture = parser.add_mutually_exclusive_group()
+    fracture.add_argument("--fracture", dest="fracture", action="store_true", default=None,
+                          help="Only analyses with a fracture detected")
+    fracture.add_argument("--no-fracture", dest="fracture", action="store_false",
+                          help="Only analyses without a fracture")
+    parser.add_argument("--body-part", type=str, help="e.g. wrist")
+    parser.add_argument("--urgency", type=str, help="routine, urgent or emergent")
+    parser.add_argument("--severity", type=str, help="e.g. mild, moderate, severe")
+    parser.add_argument("--digest", type=str, help="SHA-256 of the image")
+    parser.add_argument("--source", type=str, choices=["cli", "app"], help="Where the analysis was run")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum rows, newest first (default: 50)")
+    parser.add_argument("--count", action="store_true", help="Print only the number of matches")
+    parser.add_argument("--json", action="store_true", help="Print matches as JSON")
+    parser.add_argument("--with-result", action="store_true", help="Include the stored analysis in --json output")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ No result store at {args.db}")
+        return 1
+    since = start_of_today() if args.today else time.time() - args.hours * 3600 if args.hours else args.since
+    filters = dict(since=since, until=args.until, fracture=args.fracture, body_part=args.body_part,
+                   urgency=args.urgency, severity=args.severity, digest=args.digest, source=args.source)
+
+    store = ResultStore(args.db)
+    if args.count:
+        print(store.count(**filters))
+    else:
+        start = time.perf_counter()
+        rows = store.query(limit=args.limit, with_result=args.with_result and args.json, **filters)
+        elapsed = time.perf_counter() - start
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            for row in rows:
+                print(format_row(row))
+            print(f"🔎 {len(rows)} analyses in {elapsed * 1000:.1f} ms")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Retry policy with exponential backoff, jitter and optional request hedging.
+
+Only failures that a second attempt can fix are retried: timeouts, connection
+errors, 5xx responses and 429s. A 503 is usually a Modal container still
+starting, so its Retry-After header is honoured when present.
+
+With hedging enabled, if the first attempt has not answered by the p95 of
+recently observed latencies, a second identical request is sent and whichever
+succeeds first wins. This trims the tail at the cost of a few duplicate
+inferences; RetryMetrics shows how often the hedge actually won.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+import requests
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+
+
+class LatencyTracker:
+    """Rolling window of successful request latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < 10:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RetryMetrics:
+    """Counters describing what the retry policy did"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.retries = 0
+        self.giveups = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "giveups": self.giveups,
+                "hedges_sent": self.hedges_sent,
+                "hedges_won": self.hedges_won,
+                "hedge_win_rate": round(self.hedges_won / self.hedges_sent, 3) if self.hedges_sent else 0.0,
+            }
+
+
+class RetryPolicy:
+    """Run a request callable with retries, backoff and optional hedging.
+
+    `attempt` is a zero-argument callable returning a requests.Response. It is
+    called again for each retry (and concurrently for a hedge), so it must be
+    safe to repeat.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 10.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_default_delay: float = 30.0,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_default_delay = hedge_default_delay
+        self.latencies = LatencyTracker()
+        self.metrics = RetryMetrics()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="medgemma-hedge") if hedge else None
+
+    @staticmethod
+    def is_retryable(response=None, exc: Optional[BaseException] = None) -> bool:
+        if exc is not None:
+            return isinstance(exc, RETRYABLE_EXCEPTIONS)
+        return response is not None and response.status_code in RETRYABLE_STATUSES
+
+    def backoff(self, attempt: int, response=None) -> float:
+        """Full-jitter exponential backoff; honours Retry-After on 429/503"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def hedge_delay(self) -> float:
+        return self.latencies.quantile(self.hedge_quantile) or self.hedge_default_delay
+
+    def _timed(self, attempt: Callable):
+        start = time.perf_counter()
+        self.metrics.incr("attempts")
+        response = attempt()
+        if response.status_code < 400:
+            self.latencies.observe(time.perf_counter() - start)
+        return response
+
+    def _hedged(self, attempt: Callable):
+        """Primary request plus a hedge after the p95 delay; first good answer wins"""
+        primary = self._hedge_pool.submit(self._timed, attempt)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        self.metrics.incr("hedges_sent")
+        hedge = self._hedge_pool.submit(self._timed, attempt)
+        pending = {primary, hedge}
+        first_error = None
+        # A retryable response held back while the other request may still do better
+        fallback = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                if self.is_retryable(response) and pending:
+                    if fallback is not None:
+                        fallback.close()
+                    fallback = response
+                    continue  # give the other request a chance
+                if fallback is not None:
+                    fallback.close()
+                if future is hedge:
+                    self.metrics.incr("hedges_won")
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return response
+        # The other request failed outright; the retryable answer still lets
+        # call() back off (honouring Retry-After) instead of raising
+        if fallback is not None:
+            return fallback
+        raise first_error
+
+    def call(self, attempt: Callable, allow_hedge: bool = True, deadline=None):
+        """Return the first non-retryable response; re-raise or return the last failure.
+
+        With a deadline, no retry is started that the remaining budget cannot cover.
+        """
+        for n in range(self.max_attempts):
+            response = None
+            try:
+                if self.hedge and allow_hedge:
+                    response = self._hedged(attempt)
+                else:
+                    response = self._timed(attempt)
+                if not self.is_retryable(response):
+                    return response
+                failure = None
+            except Exception as e:
+                if not self.is_retryable(exc=e):
+                    raise
+                failure = e
+
+            delay = self.backoff(n, response)
+            if n == self.max_attempts - 1 or (deadline is not None and not deadline.can_afford(delay)):
+                self.metrics.incr("giveups")
+                if failure is not None:
+                    raise failure
+                return response
+
+            reason = f"status {response.status_code}" if response is not None else type(failure).__name__
+            print(f"🔁 Retrying analysis in {delay:.1f}s after {reason} (attempt {n + 2}/{self.max_attempts})")
+            if response is not None:
+                response.close()
+            self.metrics.incr("retries")
+            time.sleep(delay)
+
+
+def _close_response(future):
+    try:
+        future.result().close()
+    except Exception:
+        pass
+
+
+def policy_from_env() -> RetryPolicy:
+    """RetryPolicy configured by MEDGEMMA_RETRIES and MEDGEMMA_HEDGE"""
+    return RetryPolicy(
+        max_attempts=1 + int(os.environ.get("MEDGEMMA_RETRIES", "2")),
+        hedge=os.environ.get("MEDGEMMA_HEDGE", "") not in ("", "0"),
+    )
@@ -0,0 +1,146 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+When two callers ask for the same key while a call for it is already running,
+the second caller does not start its own: it waits for the first and gets
+the same result (or exception). Keys for analyses are the result-cache key,
+i.e. image hash, max_tokens, prompt and model, so a double-clicked
+"Analyze" or two users uploading the same film cost one inference.
+
+A flight is a concurrent.futures.Future, so threads block on it and asyncio
+tasks await it (asyncio.wrap_future), and a thread and a task can share one
+flight. Nothing is remembered once a flight lands; repeat calls after that
+are the result cache's job.
+
+A flight whose leader was cancelled or ran out of its own deadline says
+nothing about the followers' requests, so followers retry such results
+(see `abandoned`) rather than inherit them.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from deadline import Deadline
+import metrics
+
+LEADER = "leader"
+SHARED = "shared"
+
+
+class SingleFlight:
+    """Group of keyed calls where concurrent callers of one key share a single execution"""
+
+    def __init__(self, name: str, abandoned: Optional[Callable[[Any], bool]] = None, poll: float = 0.1):
+        self.name = name
+        self.abandoned = abandoned or (lambda result: False)
+        self.poll = poll
+        self._flights: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def acquire(self, key: Hashable) -> Tuple[Future, bool]:
+        """The flight for `key` and whether the caller leads it (and must resolve it)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Future()
+            self.leaders += 1
+        metrics.SINGLEFLIGHT.inc(group=self.name, role=LEADER)
+        return flight, True
+
+    def count_shared(self):
+        """Record a caller served by another caller's flight: one upstream call saved"""
+        with self._lock:
+            self.shared += 1
+        metrics.SINGLEFLIGHT.inc(group=self.name, role=SHARED)
+
+    def resolve(self, key: Hashable, flight: Future, result: Any = None, error: Optional[BaseException] = None):
+        """Land a flight; later callers of `key` start a new one"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+
+    def wait(self, flight: Future, deadline: Optional[Deadline] = None) -> Any:
+        """Block until a flight lands, giving up if the caller's own deadline stops first"""
+        while True:
+            if deadline is not None:
+                deadline.check("waiting for an identical analysis")
+            try:
+                return flight.result(timeout=self.poll if deadline is not None else None)
+            except FutureTimeout:
+                continue
+
+    def do(self, key: Hashable, fn: Callable[[], Any], deadline: Optional[Deadline] = None) -> Any:
+        """fn(), or the result of an identical call already in flight"""
+        while True:
+            flight, leader = self.acquire(key)
+            if leader:
+                return self._lead(key, flight, fn)
+            result = self.wait(flight, deadline)
+            if not self.abandoned(result):
+                self.count_shared()
+                return result
+
+    def _lead(self, key: Hashable, flight: Future, fn: Callable[[], Any]) -> Any:
+        try:
+            result = fn()
+        except BaseException as e:
+            self.resolve(key, flight, error=e)
+            raise
+        self.resolve(key, flight, result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any], executor=None) -> Any:
+        """Async do(): a blocking fn runs on `executor`, a coroutine function on its own task.
+
+        The flight runs to completion even if the awaiting task is cancelled, so
+        other callers sharing it still get their result.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            flight, leader = self.acquire(key)
+            if leader:
+                if asyncio.iscoroutinefunction(fn):
+                    task = loop.create_task(fn())
+                    task.add_done_callback(functools.partial(self._resolve_from_task, key, flight))
+                else:
+                    loop.run_in_executor(executor, self._lead_quietly, key, flight, fn)
+            result = await asyncio.shield(asyncio.wrap_future(flight))
+            if leader:
+                return result
+            if not self.abandoned(result):
+                self.count_shared()
+                return result
+
+    def _lead_quietly(self, key: Hashable, flight: Future, fn: Callable[[], Any]):
+        # The outcome reaches every caller through the flight
+        try:
+            self._lead(key, flight, fn)
+        except BaseException:
+            pass
+
+    def _resolve_from_task(self, key: Hashable, flight: Future, task: "asyncio.Task"):
+        if task.cancelled():
+            self.resolve(key, flight, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self.resolve(key, flight, error=task.exception())
+        else:
+            self.resolve(key, flight, task.result())
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> Dict[str, int]:
+        """`shared` counts calls that did not go upstream because they joined a flight"""
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._flights)}
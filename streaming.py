@@ -0,0 +1,129 @@
+"""
+Incremental parsing of streamed model output.
+
+The analyze endpoint can stream generated tokens as server-sent events. The
+model writes one JSON document whose top-level sections (image_metadata,
+anatomy, findings, clinical_assessment, technical_notes) complete one after
+another, so each section can be rendered as soon as its closing brace arrives
+instead of after the whole generation.
+"""
+
+import json
+import re
+from typing import Any, Iterator, List, Optional, Tuple
+
+SECTION_KEYS = (
+    "image_metadata",
+    "anatomy",
+    "findings",
+    "clinical_assessment",
+    "technical_notes",
+)
+
+# The key immediately before a container that is being opened
+_KEY_BEFORE = re.compile(r'"(\w+)"\s*:\s*$')
+_KEY_LOOKBEHIND = 64
+
+
+class IncrementalJSONParser:
+    """Feed text chunks; yields (section_name, value) as each section closes.
+
+    Scanning is linear in the total text: every character is looked at once,
+    tracking string/escape state and the stack of open containers. Chunks are
+    kept in a list and only joined when a section closes or `text` is read.
+    Prose or a ``` fence before the first { is skipped.
+    """
+
+    def __init__(self, sections=SECTION_KEYS):
+        self.sections = set(sections)
+        self.completed: List[str] = []
+        self._chunks: List[str] = []
+        self._length = 0
+        # The last _KEY_LOOKBEHIND characters before the chunk being scanned
+        self._tail = ""
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+        self._stack: List[Tuple[int, Optional[str]]] = []
+        self._root_end: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        """True once the outermost JSON value has closed"""
+        return self._root_end is not None
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk: str) -> Iterator[Tuple[str, Any]]:
+        self._chunks.append(chunk)
+        # window[i] is the character at absolute position offset + i
+        window = self._tail + chunk
+        offset = self._length - len(self._tail)
+        self._length += len(chunk)
+        self._tail = window[-_KEY_LOOKBEHIND:]
+        for i in range(len(window) - len(chunk), len(window)):
+            if self.done:
+                break
+            ch = window[i]
+            pos = offset + i
+            if not self._started:
+                if ch != "{":
+                    continue
+                self._started = True
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                key = _KEY_BEFORE.search(window, max(0, i - _KEY_LOOKBEHIND), i)
+                self._stack.append((pos, key.group(1) if key else None))
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                start, key = self._stack.pop()
+                if not self._stack:
+                    self._root_end = pos + 1
+                elif key in self.sections and key not in self.completed:
+                    try:
+                        value = json.loads(self.text[start:pos + 1])
+                    except json.JSONDecodeError:
+                        continue
+                    self.completed.append(key)
+                    yield key, value
+
+    def result(self) -> Optional[Any]:
+        """The full parsed document, once it has closed"""
+        if not self.done:
+            return None
+        text = self.text
+        start = text.index("{")
+        try:
+            return json.loads(text[start:self._root_end])
+        except json.JSONDecodeError:
+            return None
+
+
+def iter_sse_data(lines: Iterator[str]) -> Iterator[str]:
+    """Yield the data payload of each server-sent event"""
+    buffer = []
+    for line in lines:
+        if line is None:
+            continue
+        if line == "":
+            if buffer:
+                yield "\n".join(buffer)
+                buffer = []
+        elif line.startswith("data:"):
+            buffer.append(line[5:].lstrip(" "))
+    if buffer:
+        yield "\n".join(buffer)
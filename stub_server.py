@@ -0,0 +1,424 @@
+"""
+Local stand-in for the MedGemma Modal endpoints.
+
+Serves the health check and the analyze endpoint with a canned analysis so the
+clients and benchmarks can run without network access. Accepts both the JSON
+payload and the binary upload mode (Content-Length or chunked bodies). Requests
+with "stream": true (or ?stream=1 / Accept: text/event-stream) get the output
+as server-sent token events.
+
+Inference latency is drawn from a configurable distribution (plus, with
+--decode-delay, a per-token cost), output is cut off at the request's
+max_tokens like a real generation, and a container cold start can be
+simulated after an idle period:
+
+    python stub_server.py --port 8787
+    python stub_server.py --latency lognormal:mu=0.7,sigma=0.3 --cold-start 8 --idle-timeout 60
+    python test.py --endpoint http://127.0.0.1:8787/analyze-xray-endpoint --image xray.jpg
+
+With --max-batch the stub also takes {"images": [...]} payloads, advertising
+max_batch_size in its health check. --batch-cost sets how far a batch
+amortizes latency, and --gpu-slots limits concurrent inferences so that
+unbatched requests queue the way they would on one GPU:
+
+    python stub_server.py --latency fixed:value=0.3 --gpu-slots 1 --max-batch 8 --batch-cost 0.15
+"""
+
+import argparse
+import contextlib
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+ANALYZE_PATH = "/analyze-xray-endpoint"
+HEALTH_PATH = "/health-check"
+STUB_MODEL_ID = "google/medgemma-4b-it"
+
+CANNED_ANALYSIS = {
+    "image_metadata": {
+        "body_part": "Wrist",
+        "view_type": "PA",
+        "side": "Left",
+        "side_marker": "L",
+    },
+    "anatomy": {
+        "bones_identified": ["Radius", "Ulna", "Scaphoid", "Lunate", "Capitate"],
+        "joints_in_view": ["Radiocarpal joint", "Distal radioulnar joint"],
+        "soft_tissues_evaluated": True,
+    },
+    "findings": {
+        "fracture_detected": True,
+        "fracture_details": [
+            {
+                "bone_name": "Radius",
+                "location_on_bone": "Distal metaphysis",
+                "type_of_fracture": "Transverse",
+                "displacement": "Minimal dorsal displacement",
+                "angulation": "10 degrees dorsal",
+                "involves_joint_surface": False,
+                "open_fracture": False,
+            }
+        ],
+        "other_abnormalities": [
+            {"type": "Soft tissue swelling", "description": "Mild dorsal swelling", "location": "Distal forearm"}
+        ],
+        "bone_density": "Normal",
+        "degenerative_changes": [],
+    },
+    "clinical_assessment": {
+        "severity_level": "moderate",
+        "urgency": "urgent",
+        "differential_diagnosis": ["Colles fracture", "Smith fracture"],
+        "recommendations": ["Orthopedic referral", "Cast immobilization", "Follow-up radiograph in 1 week"],
+    },
+    "technical_notes": {
+        "image_quality": "Good",
+        "artifacts_present": False,
+        "positioning_notes": "Adequate PA positioning",
+        "comments": "",
+    },
+}
+
+
+# What the model "generates": the canned analysis as a fenced JSON block, at
+# roughly four characters per token
+CANNED_TEXT = "```json\n" + json.dumps(CANNED_ANALYSIS, indent=2) + "\n```"
+CHARS_PER_TOKEN = 4
+CANNED_TOKENS = -(-len(CANNED_TEXT) // CHARS_PER_TOKEN)
+
+
+def canned_result(max_tokens: int = 1024, input_tokens: int = 812) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "analysis": CANNED_ANALYSIS,
+        "model_info": {
+            "model_id": STUB_MODEL_ID,
+            "max_tokens": max_tokens,
+            "input_tokens": input_tokens,
+            "device": "stub",
+        },
+    }
+
+
+class LatencyModel:
+    """Inference delay in seconds drawn from a named distribution.
+
+    Specs look like "fixed:value=1.5", "uniform:low=0.5,high=2",
+    "normal:mean=1,stddev=0.2", "lognormal:mu=0,sigma=0.5" or "exponential:mean=1".
+    """
+
+    def __init__(self, spec: str = "fixed:value=0", seed: int = None):
+        self.spec = spec
+        name, _, params = spec.partition(":")
+        self.name = name
+        self.params = {}
+        for part in filter(None, params.split(",")):
+            key, _, value = part.partition("=")
+            self.params[key.strip()] = float(value)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.sample()  # validate the spec up front
+
+    def sample(self) -> float:
+        p = self.params
+        with self._lock:
+            if self.name == "fixed":
+                value = p.get("value", 0.0)
+            elif self.name == "uniform":
+                value = self._random.uniform(p.get("low", 0.0), p.get("high", 1.0))
+            elif self.name == "normal":
+                value = self._random.gauss(p.get("mean", 1.0), p.get("stddev", 0.1))
+            elif self.name == "lognormal":
+                value = self._random.lognormvariate(p.get("mu", 0.0), p.get("sigma", 0.5))
+            elif self.name == "exponential":
+                value = self._random.expovariate(1.0 / p.get("mean", 1.0))
+            else:
+                raise ValueError(f"Unknown latency distribution: {self.name}")
+        return max(0.0, value)
+
+
+class ColdStartModel:
+    """Adds a one-off delay to the first request after the container has idled"""
+
+    def __init__(self, delay: float = 0.0, idle_timeout: float = 300.0):
+        self.delay = delay
+        self.idle_timeout = idle_timeout
+        self._last_request = None
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """Return True if this request lands on a cold container"""
+        if self.delay <= 0:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            cold = self._last_request is None or now - self._last_request > self.idle_timeout
+            # The idle clock starts once the container has finished booting
+            self._last_request = now + self.delay if cold else now
+        return cold
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any], cold: bool = False):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if cold:
+            self.send_header("X-Cold-Start", "1")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self, keep: bool) -> bytes:
+        """Read (or just drain) the request body, honouring chunked encoding"""
+        chunks = []
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if keep:
+                    chunks.append(chunk)
+        else:
+            remaining = int(self.headers.get("Content-Length", "0"))
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 1 << 16))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if keep:
+                    chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _stream_tokens(self, max_tokens: int, cold: bool = False):
+        """Stream the canned analysis as server-sent token events"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        # Generation stops at max_tokens, mid-JSON if the budget is too small
+        text = CANNED_TEXT[:max_tokens * CHARS_PER_TOKEN]
+        tokens = [text[i:i + 8] for i in range(0, len(text), 8)]
+        started = time.monotonic()
+        time.sleep(self.server.latency.sample())  # prefill / time to first token
+        for token in tokens:
+            self.wfile.write(f"data: {json.dumps({'token': token})}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+        final = {"done": True, "model_info": canned_result(max_tokens)["model_info"]}
+        final["model_info"]["inference_time"] = round(time.monotonic() - started, 4)
+        if cold:
+            final["model_info"]["cold_start"] = True
+        self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.startswith(HEALTH_PATH):
+            # The health check runs on the same container, so it pays (and ends) a cold start too
+            cold = self.server.cold_start.check()
+            if cold:
+                time.sleep(self.server.cold_start.delay)
+            status = {"status": "healthy", "model": STUB_MODEL_ID, "version": "stub", "model_type": "stub"}
+            if self.server.max_batch > 1:
+                status["max_batch_size"] = self.server.max_batch
+            self._send_json(200, status, cold)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self.path.startswith(ANALYZE_PATH):
+            self._read_body(keep=False)
+            self._send_json(404, {"error": "not found"})
+            return
+
+        content_type = self.headers.get("Content-Type", "")
+        max_tokens = 1024
+        images = None
+        stream = "stream=1" in self.path or "text/event-stream" in self.headers.get("Accept", "")
+        if content_type.startswith("application/json"):
+            try:
+                payload = json.loads(self._read_body(keep=True) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"success": False, "error": "invalid JSON"})
+                return
+            max_tokens = int(payload.get("max_tokens", max_tokens))
+            stream = stream or bool(payload.get("stream"))
+            images = payload.get("images")
+        else:
+            self._read_body(keep=False)
+
+        cold = self.server.cold_start.check()
+        if stream:
+            if cold:
+                time.sleep(self.server.cold_start.delay)
+            self._stream_tokens(max_tokens, cold)
+            return
+
+        batch_size = 1
+        if images is not None:
+            if self.server.max_batch <= 1:
+                self._send_json(415, {"success": False, "error": "batched payloads are not supported"}, cold)
+                return
+            if not isinstance(images, list) or not 0 < len(images) <= self.server.max_batch:
+                self._send_json(413, {"success": False, "error": f"batch must hold 1-{self.server.max_batch} images"},
+                                cold)
+                return
+            batch_size = len(images)
+
+        if cold:
+            time.sleep(self.server.cold_start.delay)
+        generated = min(max_tokens, CANNED_TOKENS)
+        delay = self.server.latency.sample() + generated * self.server.decode_delay
+        # Each extra image in a batch adds only a fraction of a lone image's time
+        delay *= 1 + self.server.batch_cost * (batch_size - 1)
+        with self.server.gpu:
+            time.sleep(delay)
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self._send_json(503, {"success": False, "error": "simulated failure"}, cold)
+            return
+        if images is not None:
+            results = [self._result(max_tokens, generated, delay, cold) for _ in images]
+            self._send_json(200, {"success": True, "results": results, "batch_size": batch_size}, cold)
+        else:
+            self._send_json(200, self._result(max_tokens, generated, delay, cold), cold)
+
+    @staticmethod
+    def _result(max_tokens: int, generated: int, delay: float, cold: bool = False) -> Dict[str, Any]:
+        if generated < CANNED_TOKENS:
+            # Output cut off at max_tokens: the endpoint cannot parse it either
+            result = {
+                "success": False,
+                "error": "Failed to parse model output as JSON",
+                "error_type": "json_parsing",
+                "raw_response": CANNED_TEXT[:generated * CHARS_PER_TOKEN],
+                "model_info": canned_result(max_tokens)["model_info"],
+            }
+        else:
+            result = canned_result(max_tokens)
+        result["model_info"]["inference_time"] = round(delay, 4)
+        if cold:
+            # Also in the body, so it survives client code that only returns the parsed result
+            result["model_info"]["cold_start"] = True
+        return result
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    verbose: bool = False,
+    latency: str = "fixed:value=0",
+    cold_start: float = 0.0,
+    idle_timeout: float = 300.0,
+    error_rate: float = 0.0,
+    token_delay: float = 0.01,
+    decode_delay: float = 0.0,
+    max_batch: int = 0,
+    batch_cost: float = 0.15,
+    gpu_slots: int = 0,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.latency = LatencyModel(latency)
+    server.cold_start = ColdStartModel(cold_start, idle_timeout)
+    server.error_rate = error_rate
+    server.token_delay = token_delay
+    server.decode_delay = decode_delay
+    server.max_batch = max_batch
+    server.batch_cost = batch_cost
+    # Concurrent inferences the simulated GPU runs; 0 is unlimited
+    server.gpu = threading.BoundedSemaphore(gpu_slots) if gpu_slots > 0 else contextlib.nullcontext()
+    return server
+
+
+def start_in_thread(**kwargs) -> ThreadingHTTPServer:
+    """Start a stub server on a background thread; returns it with .base_url set"""
+    server = make_server(**kwargs)
+    host, port = server.server_address[:2]
+    server.base_url = f"http://{host}:{port}"
+    threading.Thread(target=server.serve_forever, name="medgemma-stub", daemon=True).start()
+    return server
+
+
+def start_process(latency: str = "fixed:value=0", cold_start: float = 0.0,
+                  idle_timeout: float = 300.0, error_rate: float = 0.0, extra_args=()):
+    """Run the stub in a separate process; returns (Popen, base_url) once it answers"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    cmd = [
+        sys.executable, str(Path(__file__).resolve()), "--port", str(port),
+        "--latency", latency, "--cold-start", str(cold_start),
+        "--idle-timeout", str(idle_timeout), "--error-rate", str(error_rate),
+        *extra_args,
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + HEALTH_PATH, timeout=1)
+            return proc, base_url
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError("stub server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the MedGemma endpoints")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    parser.add_argument("--latency", type=str, default="fixed:value=0",
+                        help="Inference latency distribution, e.g. lognormal:mu=0.7,sigma=0.3 (default: %(default)s)")
+    parser.add_argument("--cold-start", type=float, default=0.0,
+                        help="Extra seconds for the first request after an idle period (default: 0)")
+    parser.add_argument("--idle-timeout", type=float, default=300.0,
+                        help="Idle seconds before the simulated container goes cold (default: 300)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of analyze requests answered with 503 (default: 0)")
+    parser.add_argument("--token-delay", type=float, default=0.01,
+                        help="Seconds between streamed token events (default: 0.01)")
+    parser.add_argument("--decode-delay", type=float, default=0.0,
+                        help="Extra seconds per generated token for buffered responses (default: 0)")
+    parser.add_argument("--max-batch", type=int, default=0,
+                        help="Accept batched {\"images\": [...]} payloads of up to this many images and advertise it "
+                             "in the health check (default: 0, no batching)")
+    parser.add_argument("--batch-cost", type=float, default=0.15,
+                        help="Each extra image in a batch adds this fraction of one image's latency (default: 0.15)")
+    parser.add_argument("--gpu-slots", type=int, default=0,
+                        help="Inferences that can run at once; others queue (default: 0, unlimited)")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.verbose, args.latency,
+                         args.cold_start, args.idle_timeout, args.error_rate, args.token_delay, args.decode_delay,
+                         args.max_batch, args.batch_cost, args.gpu_slots)
+    print(f"🧪 Stub MedGemma endpoint on http://{args.host}:{args.port}{ANALYZE_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -9,18 +9,61 @@ import requests
 import time
 import argparse
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
+import os
 import sys
+from contextlib import nullcontext
+from http_client import MedGemmaHTTPClient
+from retry import RetryPolicy
+from deadline import Cancelled, Deadline, DeadlineExceeded
+import metrics
+from profiling import Profiler, maybe_profile
+from transport import RecordingTransport, ReplayTransport, wrap_from_env
+from result_cache import AnalysisCache, file_digest
+from models import AnalysisResult, UNKNOWN
+from result_store import ResultStore, DEFAULT_STORE_PATH, open_store
+from preprocess import normalize_image, describe, preprocessing_key, DEFAULT_MAX_EDGE, DEFAULT_QUALITY
+from batch import find_images, run_batch, DEFAULT_MANIFEST_NAME
+from upload import post_analysis, open_image_body, DEFAULT_UPLOAD_MODE, UPLOAD_MODE_BINARY, UPLOAD_MODE_JSON
 
 # Update with your actual endpoint URLs after deployment
-DEFAULT_ENDPOINT = "https://satyammishra0402--medgemma-xray-analyzer-analyze-xray-endpoint.modal.run"
-HEALTH_ENDPOINT = "https://satyammishra0402--medgemma-xray-analyzer-health-check.modal.run"
+DEFAULT_ENDPOINT = os.environ.get(
+    "MEDGEMMA_ANALYZE_ENDPOINT",
+    "https://satyammishra0402--medgemma-xray-analyzer-analyze-xray-endpoint.modal.run"
+)
+HEALTH_ENDPOINT = os.environ.get(
+    "MEDGEMMA_HEALTH_ENDPOINT",
+    "https://satyammishra0402--medgemma-xray-analyzer-health-check.modal.run"
+)
 
 class MedGemmaTestClient:
     """Test client for MedGemma-4B-IT X-ray analyzer"""
     
-    def __init__(self, endpoint_url: str = DEFAULT_ENDPOINT):
+    def __init__(
+        self,
+        endpoint_url: str = DEFAULT_ENDPOINT,
+        http: Optional[MedGemmaHTTPClient] = None,
+        cache: Optional[AnalysisCache] = None,
+        preprocess: bool = True,
+        max_edge: int = DEFAULT_MAX_EDGE,
+        quality: int = DEFAULT_QUALITY,
+        upload_mode: str = DEFAULT_UPLOAD_MODE,
+        retry_policy: Optional[RetryPolicy] = None,
+        profiler: Optional[Profiler] = None,
+        store: Optional[ResultStore] = None
+    ):
         self.endpoint_url = endpoint_url
+        self.http = http or wrap_from_env(MedGemmaHTTPClient())
+        self.cache = cache
+        self.preprocess = preprocess
+        self.max_edge = max_edge
+        self.quality = quality
+        # Part of the cache key: the same file under other settings is another request
+        self.preprocessing = preprocessing_key(preprocess, max_edge, quality)
+        self.upload_mode = upload_mode
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.profiler = profiler
+        self.store = store
         self.health_url = endpoint_url.replace("analyze-xray-endpoint", "health-check")
         
         print(f"Using endpoint: {self.endpoint_url}")
@@ -30,7 +73,7 @@ class MedGemmaTestClient:
         """Check if the service is healthy"""
         try:
             print("Checking service health...")
-            response = requests.get(self.health_url, timeout=15)
+            response = self.http.get(self.health_url, timeout=15)
             if response.status_code == 200:
                 data = response.json()
                 print(f"✅ Service is healthy!")
@@ -46,8 +89,8 @@ class MedGemmaTestClient:
             print(f"❌ Health check error: {str(e)}")
             return False
     
-    def encode_image(self, image_path: str) -> Optional[str]:
-        """Encode image file to base64"""
+    def load_image(self, image_path: str) -> Optional[bytes]:
+        """Read an image file and apply client-side normalization"""
         try:
             path = Path(image_path)
             
@@ -60,65 +103,126 @@ class MedGemmaTestClient:
             if file_size_mb > 10:
                 print(f"⚠️ Warning: Large image file ({file_size_mb:.2f} MB)")
             
-            # Read and encode image
             with open(path, 'rb') as f:
                 image_data = f.read()
-                
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
             
-            print(f"✅ Image encoded successfully ({file_size_mb:.2f} MB)")
-            return image_base64
+            if self.preprocess:
+                image_data, stats = normalize_image(image_data, max_edge=self.max_edge, quality=self.quality)
+                print(f"🗜️ Image normalized: {describe(stats)}")
+            
+            return image_data
             
         except Exception as e:
-            print(f"❌ Error encoding image: {str(e)}")
+            print(f"❌ Error reading image: {str(e)}")
             return None
     
+    def encode_image(self, image_path: str) -> Optional[str]:
+        """Encode image file to base64"""
+        with metrics.timer("encode"):
+            image_data = self.load_image(image_path)
+            if image_data is None:
+                return None
+            image_base64 = base64.b64encode(image_data).decode('utf-8')
+        print(f"✅ Image encoded successfully ({len(image_base64) / (1024 * 1024):.2f} MB)")
+        return image_base64
+    
+    def image_body(self, image_path: str, prepared: Optional[Union[str, bytes]] = None):
+        """Context manager yielding the request body for the configured upload mode"""
+        if prepared is not None:
+            return nullcontext(prepared)
+        if self.upload_mode != UPLOAD_MODE_BINARY:
+            return nullcontext(self.encode_image(image_path))
+        if not self.preprocess and Path(image_path).exists():
+            # Stream straight from the page cache; no copy of the file in memory
+            return open_image_body(image_path)
+        return nullcontext(self.load_image(image_path))
+    
     def analyze_xray(
         self, 
         image_path: str,
         max_tokens: int = 1024,      # Reduced default for faster response
         custom_prompt: str = None,   # New parameter for custom prompts
-        timeout: int = 180           # 3 minute timeout
+        timeout: int = 180,          # 3 minute timeout
+        prepared: Optional[Union[str, bytes]] = None,  # body already built by a batch worker
+        deadline: Optional[Deadline] = None  # shared budget; defaults to `timeout` from now
     ) -> Optional[Dict[str, Any]]:
-        """Send X-ray image for analysis"""
+        """Send X-ray image for analysis.
+
+        `timeout` is an end-to-end budget covering encoding, every retry and the
+        response, not a per-request socket timeout.
+        """
+        # Hashed once, for both the cache key and the history row
+        digest = None
+        if (self.cache is not None or self.store is not None) and Path(image_path).exists():
+            digest = file_digest(image_path)
+        
+        started = time.perf_counter()
+        with maybe_profile(self.profiler, Path(image_path).name):
+            result = self._analyze_xray(image_path, max_tokens, custom_prompt, timeout, prepared, deadline, digest)
+        if self.store is not None:
+            self.store.record(result, digest=digest, image_name=str(image_path),
+                              latency=time.perf_counter() - started, source="cli", max_tokens=max_tokens)
+        return result
+    
+    def _analyze_xray(self, image_path, max_tokens, custom_prompt, timeout, prepared, deadline, digest):
+        if deadline is None:
+            deadline = Deadline(timeout)
         
         print(f"\n🔬 Analyzing X-ray image: {image_path}")
         print(f"   Parameters: max_tokens={max_tokens}, timeout={timeout}s")
         
-        # Encode image
-        image_base64 = self.encode_image(image_path)
-        if not image_base64:
-            return None
-        
-        # Prepare request
-        request_data = {
-            "image": image_base64,
-            "max_tokens": max_tokens
-        }
+        # Serve repeat analyses of the same film from the cache
+        if self.cache is not None and digest is not None:
+            cached = self.cache.get(self.cache.key(digest, max_tokens, custom_prompt, self.preprocessing))
+            if cached is not None:
+                print(f"⚡ Cache hit ({self.cache.stats()['hits']} hits / {self.cache.stats()['misses']} misses)")
+                return cached
         
         if custom_prompt:
-            request_data["custom_prompt"] = custom_prompt
             print(f"   Using custom prompt: {custom_prompt[:100]}...")
         
-        # Send request
-        print(f"\n📤 Sending request...")
         start_time = time.time()
         
         try:
-            response = requests.post(
-                self.endpoint_url,
-                json=request_data,
-                timeout=timeout
-            )
+            deadline.check("encoding")
+            with self.image_body(image_path, prepared) as image:
+                if image is None:
+                    return None
+                
+                # Send request
+                print(f"\n📤 Sending request ({self.upload_mode} upload)...")
+                
+                def attempt():
+                    deadline.check("upload")
+                    if hasattr(image, "seek"):
+                        image.seek(0)
+                    return post_analysis(
+                        self.http,
+                        self.endpoint_url,
+                        image,
+                        max_tokens=max_tokens,
+                        custom_prompt=custom_prompt,
+                        mode=self.upload_mode,
+                        timeout=deadline.timeout()
+                    )
+                
+                metrics.ANALYSES.inc(path="cli")
+                request_started = time.perf_counter()
+                response = self.retry_policy.call(attempt, allow_hedge=not hasattr(image, "read"),
+                                                  deadline=deadline)
             
             elapsed_time = time.time() - start_time
             print(f"⏱️ Response received in {elapsed_time:.2f} seconds")
             
             if response.status_code == 200:
                 result = response.json()
+                metrics.record_request(time.perf_counter() - request_started, result.get("model_info"))
+                metrics.record_outcome(result)
                 
                 if result.get("success"):
                     print("✅ Analysis successful!")
+                    if self.cache is not None and digest is not None:
+                        self.cache.put(digest, max_tokens, custom_prompt, result, self.preprocessing)
                     return result
                 else:
                     print(f"❌ Analysis failed: {result.get('error', 'Unknown error')}")
@@ -130,15 +234,22 @@ class MedGemmaTestClient:
                     
                     return result
             else:
+                metrics.FAILURES.inc(error_type=f"http_{response.status_code}")
                 print(f"❌ Request failed with status code: {response.status_code}")
                 print(f"   Response: {response.text[:300]}")
                 return None
                 
+        except (Cancelled, DeadlineExceeded) as e:
+            metrics.FAILURES.inc(error_type="cancelled" if isinstance(e, Cancelled) else "deadline")
+            print(f"⏹️ {e} after {time.time() - start_time:.2f} seconds")
+            return None
         except requests.exceptions.Timeout:
-            print(f"❌ Request timed out after {elapsed_time:.2f} seconds")
+            metrics.FAILURES.inc(error_type="timeout")
+            print(f"❌ Request timed out after {time.time() - start_time:.2f} seconds")
             print("   Try reducing max_tokens or check if the service is overloaded")
             return None
         except Exception as e:
+            metrics.FAILURES.inc(error_type="request")
             print(f"❌ Request error: {str(e)}")
             return None
     
@@ -149,131 +260,126 @@ class MedGemmaTestClient:
             print("\n❌ No successful analysis to display")
             return
         
-        analysis = result.get("analysis", {})
+        analysis = AnalysisResult.from_response(result)
         
         print("\n" + "="*60)
         print("📊 MEDGEMMA X-RAY ANALYSIS REPORT")
         print("="*60)
         
         # Image Metadata
-        metadata = analysis.get("image_metadata", {})
+        metadata = analysis.image_metadata
         if metadata:
             print("\n📷 IMAGE METADATA:")
-            print(f"   • Body Part: {metadata.get('body_part', 'Unknown')}")
-            print(f"   • View Type: {metadata.get('view_type', 'Unknown')}")
-            print(f"   • Side: {metadata.get('side', 'Unknown')}")
-            if metadata.get('side_marker') and metadata['side_marker'] != 'None':
-                print(f"   • Side Marker: {metadata['side_marker']}")
+            print(f"   • Body Part: {metadata.body_part or UNKNOWN}")
+            print(f"   • View Type: {metadata.view_type or UNKNOWN}")
+            print(f"   • Side: {metadata.side or UNKNOWN}")
+            if metadata.side_marker:
+                print(f"   • Side Marker: {metadata.side_marker}")
         
         # Anatomy
-        anatomy = analysis.get("anatomy", {})
+        anatomy = analysis.anatomy
         if anatomy:
             print("\n🦴 ANATOMICAL STRUCTURES:")
-            bones = anatomy.get("bones_identified", [])
-            if bones:
-                print(f"   • Bones: {', '.join(bones)}")
-            joints = anatomy.get("joints_in_view", [])
-            if joints:
-                print(f"   • Joints: {', '.join(joints)}")
-            print(f"   • Soft Tissues Evaluated: {'Yes' if anatomy.get('soft_tissues_evaluated') else 'No'}")
+            if anatomy.bones_identified:
+                print(f"   • Bones: {', '.join(anatomy.bones_identified)}")
+            if anatomy.joints_in_view:
+                print(f"   • Joints: {', '.join(anatomy.joints_in_view)}")
+            print(f"   • Soft Tissues Evaluated: {'Yes' if anatomy.soft_tissues_evaluated else 'No'}")
         
         # Findings
-        findings = analysis.get("findings", {})
+        findings = analysis.findings
         if findings:
             print("\n🔍 CLINICAL FINDINGS:")
             
             # Fractures
-            if findings.get("fracture_detected"):
+            if findings.fracture_detected:
                 print("   🚨 FRACTURE DETECTED!")
-                fracture_details = findings.get("fracture_details", [])
-                for i, fracture in enumerate(fracture_details, 1):
+                for i, fracture in enumerate(findings.fracture_details, 1):
                     print(f"\n   Fracture #{i}:")
-                    print(f"      • Bone: {fracture.get('bone_name', 'Unknown')}")
-                    print(f"      • Location: {fracture.get('location_on_bone', 'Unknown')}")
-                    print(f"      • Type: {fracture.get('type_of_fracture', 'Unknown')}")
-                    print(f"      • Displacement: {fracture.get('displacement', 'Unknown')}")
-                    if fracture.get('angulation') and fracture['angulation'] != 'None':
-                        print(f"      • Angulation: {fracture['angulation']}")
-                    print(f"      • Joint Surface: {'Involved' if fracture.get('involves_joint_surface') else 'Not involved'}")
-                    print(f"      • Open Fracture: {'Yes' if fracture.get('open_fracture') else 'No'}")
+                    print(f"      • Bone: {fracture.bone_name}")
+                    print(f"      • Location: {fracture.location_on_bone}")
+                    print(f"      • Type: {fracture.type_of_fracture}")
+                    print(f"      • Displacement: {fracture.displacement}")
+                    if fracture.angulation:
+                        print(f"      • Angulation: {fracture.angulation}")
+                    print(f"      • Joint Surface: {'Involved' if fracture.involves_joint_surface else 'Not involved'}")
+                    print(f"      • Open Fracture: {'Yes' if fracture.open_fracture else 'No'}")
             else:
                 print("   ✅ No fractures detected")
+                if findings.fractures_unflagged:
+                    print(f"   ⚠️ ...but the model listed {len(findings.fracture_details)} fracture detail(s); review the saved result")
             
             # Other abnormalities
-            other_abnormalities = findings.get("other_abnormalities", [])
-            if other_abnormalities:
+            if findings.other_abnormalities:
                 print("\n   Other Findings:")
-                for abnormality in other_abnormalities:
-                    print(f"      • {abnormality.get('type', 'Unknown')}: {abnormality.get('description', '')}")
-                    if abnormality.get('location'):
-                        print(f"        Location: {abnormality['location']}")
+                for abnormality in findings.other_abnormalities:
+                    print(f"      • {abnormality.type}: {abnormality.description}")
+                    if abnormality.location:
+                        print(f"        Location: {abnormality.location}")
             
             # Additional findings
-            if findings.get('bone_density'):
-                print(f"\n   • Bone Density: {findings['bone_density']}")
+            if findings.bone_density:
+                print(f"\n   • Bone Density: {findings.bone_density}")
             
-            degenerative = findings.get("degenerative_changes", [])
-            if degenerative:
-                print(f"   • Degenerative Changes: {', '.join(degenerative)}")
+            if findings.degenerative_changes:
+                print(f"   • Degenerative Changes: {', '.join(findings.degenerative_changes)}")
         
         # Clinical Assessment
-        assessment = analysis.get("clinical_assessment", {})
+        assessment = analysis.clinical_assessment
         if assessment:
             print("\n⚕️ CLINICAL ASSESSMENT:")
-            severity = assessment.get('severity_level', 'Unknown')
-            urgency = assessment.get('urgency', 'Unknown')
+            urgency_icon = f"{assessment.urgency_icon} " if assessment.urgency_icon else ""
+            print(f"   • Severity: {assessment.severity_level.title()}")
+            print(f"   • Urgency: {urgency_icon}{assessment.urgency.title()}")
             
-            # Color coding for urgency
-            urgency_color = ""
-            if urgency.lower() == 'emergent':
-                urgency_color = "🚨 "
-            elif urgency.lower() == 'urgent':
-                urgency_color = "⚠️ "
-            elif urgency.lower() == 'routine':
-                urgency_color = "✅ "
-            
-            print(f"   • Severity: {severity.title()}")
-            print(f"   • Urgency: {urgency_color}{urgency.title()}")
-            
-            differential = assessment.get("differential_diagnosis", [])
-            if differential:
+            if assessment.differential_diagnosis:
                 print(f"\n   📋 Differential Diagnosis:")
-                for i, diagnosis in enumerate(differential, 1):
+                for i, diagnosis in enumerate(assessment.differential_diagnosis, 1):
                     print(f"      {i}. {diagnosis}")
             
-            recommendations = assessment.get("recommendations", [])
-            if recommendations:
+            if assessment.recommendations:
                 print(f"\n   💡 Recommendations:")
-                for i, rec in enumerate(recommendations, 1):
+                for i, rec in enumerate(assessment.recommendations, 1):
                     print(f"      {i}. {rec}")
         
         # Technical Notes
-        technical = analysis.get("technical_notes", {})
+        technical = analysis.technical_notes
         if technical:
             print("\n📋 TECHNICAL ASSESSMENT:")
-            quality = technical.get('image_quality', 'Unknown')
-            print(f"   • Image Quality: {quality}")
-            print(f"   • Artifacts Present: {'Yes' if technical.get('artifacts_present') else 'No'}")
-            if technical.get('positioning_notes'):
-                print(f"   • Positioning: {technical['positioning_notes']}")
-            if technical.get('comments'):
-                print(f"   • Additional Comments: {technical['comments']}")
+            print(f"   • Image Quality: {technical.image_quality}")
+            print(f"   • Artifacts Present: {'Yes' if technical.artifacts_present else 'No'}")
+            if technical.positioning_notes:
+                print(f"   • Positioning: {technical.positioning_notes}")
+            if technical.comments:
+                print(f"   • Additional Comments: {technical.comments}")
         
         # Model Performance Info
-        model_info = result.get("model_info", {})
+        model_info = analysis.model_info
         if model_info:
             print("\n🤖 MODEL INFORMATION:")
-            print(f"   • Model: {model_info.get('model_id', 'Unknown')}")
-            if model_info.get('input_tokens'):
-                print(f"   • Input Tokens: {model_info['input_tokens']}")
-            print(f"   • Max Tokens: {model_info.get('max_tokens', 'Unknown')}")
-            print(f"   • Device: {model_info.get('device', 'Unknown')}")
+            print(f"   • Model: {model_info.model_id}")
+            if model_info.input_tokens:
+                print(f"   • Input Tokens: {model_info.input_tokens}")
+            print(f"   • Max Tokens: {model_info.max_tokens or UNKNOWN}")
+            print(f"   • Device: {model_info.device}")
+        
+        for problem in analysis.problems:
+            print(f"\n⚠️  Skipped malformed section {problem}")
         
         print("\n" + "="*60)
         print("⚠️  MEDICAL DISCLAIMER: This analysis is for educational purposes only.")
         print("   Always consult qualified medical professionals for diagnosis and treatment.")
         print("="*60)
     
+    def print_retry_metrics(self):
+        """Summarize retries and hedges, if any happened"""
+        metrics = self.retry_policy.metrics.snapshot()
+        if not (metrics["retries"] or metrics["hedges_sent"] or metrics["giveups"]):
+            return
+        print(f"\n🔁 Retries: {metrics['retries']} | Gave up: {metrics['giveups']} | "
+              f"Hedges sent: {metrics['hedges_sent']} | Hedges won: {metrics['hedges_won']} "
+              f"({metrics['hedge_win_rate']:.0%})")
+    
     def save_result(self, result: Dict[str, Any], image_path: str):
         """Save analysis result to JSON file"""
         try:
@@ -289,21 +395,61 @@ class MedGemmaTestClient:
 def main():
     """Main function for running tests"""
     
+    metrics.start_exporter()
     parser = argparse.ArgumentParser(description="Test MedGemma-4B-IT X-ray analyzer")
     parser.add_argument("--endpoint", type=str, default=DEFAULT_ENDPOINT,
                        help="Modal endpoint URL")
     parser.add_argument("--image", type=str,
                        help="Path to X-ray image file")
-    parser.add_argument("--max-tokens", type=int, default=1024,
-                       help="Maximum tokens to generate (default: 1024)")
+    parser.add_argument("--dir", type=str,
+                       help="Analyze every JPG/PNG under this directory (batch mode)")
+    parser.add_argument("--glob", type=str,
+                       help="Analyze images matching this glob pattern, relative to --dir if given (batch mode)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                       help="Concurrent requests in batch mode (default: 4)")
+    parser.add_argument("--prep-workers", type=int,
+                       help="Image preparation processes in batch mode (default: CPU count)")
+    parser.add_argument("--manifest", type=str,
+                       help=f"Resume manifest for batch mode (default: <dir>/{DEFAULT_MANIFEST_NAME})")
+    parser.add_argument("--max-tokens", type=int, default=int(os.environ.get("MEDGEMMA_MAX_TOKENS", "1024")),
+                       help="Maximum tokens to generate (default: MEDGEMMA_MAX_TOKENS or 1024)")
     parser.add_argument("--timeout", type=int, default=180,
-                       help="Request timeout in seconds (default: 180)")
+                       help="End-to-end analysis budget in seconds, including retries (default: 180)")
     parser.add_argument("--custom-prompt", type=str,
                        help="Custom analysis prompt (overrides default)")
     parser.add_argument("--save", action="store_true",
                        help="Save analysis results to JSON file")
     parser.add_argument("--health", action="store_true",
                        help="Only check service health")
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE,
+                       help=f"Downscale images so the longest edge is at most this many pixels (default: {DEFAULT_MAX_EDGE})")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY,
+                       help=f"JPEG quality for the normalized image (default: {DEFAULT_QUALITY})")
+    parser.add_argument("--no-preprocess", action="store_true",
+                       help="Send the original image bytes without normalization")
+    parser.add_argument("--upload-mode", type=str, choices=[UPLOAD_MODE_JSON, UPLOAD_MODE_BINARY],
+                       default=DEFAULT_UPLOAD_MODE,
+                       help="Send the image as base64 JSON or as a streamed binary body (default: %(default)s)")
+    parser.add_argument("--retries", type=int, default=2,
+                       help="Retries for timeouts, 5xx and cold-start 503s (default: 2)")
+    parser.add_argument("--hedge", action="store_true",
+                       help="Send a backup request if the first is slower than the observed p95")
+    parser.add_argument("--record", type=str, metavar="CASSETTE",
+                       help="Record every health/analyze exchange to this cassette file")
+    parser.add_argument("--replay", type=str, metavar="CASSETTE",
+                       help="Serve exchanges from this cassette instead of the network")
+    parser.add_argument("--replay-realtime", action="store_true",
+                       help="When replaying, wait for each exchange's recorded latency")
+    parser.add_argument("--cache-dir", type=str, default=".medgemma_cache",
+                       help="Directory for the on-disk analysis cache (default: .medgemma_cache)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Always send the image for inference, bypassing the result cache")
+    parser.add_argument("--store", type=str, default=os.environ.get("MEDGEMMA_RESULT_STORE", DEFAULT_STORE_PATH),
+                       help="SQLite history of every analysis, queried with result_store.py; \"off\" disables it (default: %(default)s)")
+    parser.add_argument("--profile", type=str, metavar="DIR",
+                       help="Write cProfile and tracemalloc peak reports for each analysis to DIR")
+    parser.add_argument("--profile-collapsed", action="store_true",
+                       help="With --profile, also write flamegraph-compatible collapsed stacks")
     
     args = parser.parse_args()
     
@@ -323,11 +469,30 @@ def main():
             if response.lower() != 'y':
                 sys.exit(0)
     
+    batch_mode = bool(args.dir or args.glob)
+    
     # Initialize client
-    client = MedGemmaTestClient(args.endpoint)
+    cache = None if args.no_cache else AnalysisCache(disk_dir=args.cache_dir)
+    http = None
+    if args.replay:
+        http = ReplayTransport(args.replay, realtime=args.replay_realtime)
+    elif args.record:
+        http = RecordingTransport(MedGemmaHTTPClient(), args.record)
+    client = MedGemmaTestClient(
+        args.endpoint,
+        http=http,
+        cache=cache,
+        preprocess=not args.no_preprocess,
+        max_edge=args.max_edge,
+        quality=args.quality,
+        upload_mode=args.upload_mode,
+        retry_policy=RetryPolicy(max_attempts=1 + args.retries, hedge=args.hedge),
+        profiler=Profiler(args.profile, collapsed=args.profile_collapsed) if args.profile else None,
+        store=open_store(args.store) if (args.image or batch_mode) and not args.health else None
+    )
     
     # Health check
-    if args.health or (not args.image):
+    if args.health or (not args.image and not batch_mode):
         if not client.check_health():
             print("\n❌ Service health check failed. Please check your deployment.")
             print("   1. Make sure you've deployed with: modal deploy modal_app.py")
@@ -354,8 +519,31 @@ def main():
             if args.save:
                 client.save_result(result, args.image)
         
+        client.print_retry_metrics()
+        
         sys.exit(0 if result and result.get("success") else 1)
     
+    # Batch analysis
+    if batch_mode:
+        image_paths = find_images(args.dir, args.glob)
+        if not image_paths:
+            print("❌ No images found for batch mode")
+            sys.exit(1)
+        manifest_path = args.manifest or str(Path(args.dir or ".") / DEFAULT_MANIFEST_NAME)
+        summary = run_batch(
+            client,
+            image_paths,
+            manifest_path,
+            concurrency=args.concurrency,
+            prep_workers=args.prep_workers,
+            max_tokens=args.max_tokens,
+            custom_prompt=args.custom_prompt,
+            timeout=args.timeout,
+            save=args.save
+        )
+        client.print_retry_metrics()
+        sys.exit(0 if summary["failed"] == 0 else 1)
+    
     # No specific action
     print("\n📖 MedGemma-4B-IT X-ray Analyzer Test Client")
     print("="*50)
@@ -363,6 +551,7 @@ def main():
     print("  python test_client.py --health                    # Check service health")
     print("  python test_client.py --image xray.jpg           # Analyze single image")
     print("  python test_client.py --image xray.jpg --save    # Save results to JSON")
+    print("  python test_client.py --dir studies/ --concurrency 8   # Batch-analyze a folder")
     print("  python test_client.py --image xray.jpg \\")
     print("    --max-tokens 1500 --timeout 300              # Custom parameters")
     print("  python test_client.py --image xray.jpg \\")
@@ -0,0 +1,191 @@
+"""
+Record/replay transports for offline, deterministic runs.
+
+Both wrap the MedGemmaHTTPClient interface (get/post/close), so they can stand
+in for it anywhere: function.py through get_client(), MedGemmaTestClient
+through its `http` argument, and the benchmarks.
+
+RecordingTransport forwards to a real client and appends every exchange to a
+JSONL cassette: method, URL, a digest of the image, the response status,
+headers and body, and the observed latency. ReplayTransport serves those
+exchanges back without network access, optionally sleeping for the recorded
+latency so timing measurements stay repeatable.
+
+Select one for the whole process with environment variables:
+
+    MEDGEMMA_TRANSPORT=record MEDGEMMA_CASSETTE=run.jsonl streamlit run app.py
+    MEDGEMMA_TRANSPORT=replay MEDGEMMA_CASSETTE=run.jsonl MEDGEMMA_REPLAY_REALTIME=1 python test.py --image x.jpg
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+TRANSPORT_ENV = "MEDGEMMA_TRANSPORT"
+CASSETTE_ENV = "MEDGEMMA_CASSETTE"
+REALTIME_ENV = "MEDGEMMA_REPLAY_REALTIME"
+
+
+def _request_digest(kwargs: Dict[str, Any]) -> Optional[str]:
+    """Digest of the image in a request, when it is cheap to get at"""
+    payload = kwargs.get("json")
+    if isinstance(payload, dict) and isinstance(payload.get("image"), str):
+        return hashlib.sha256(payload["image"].encode("utf-8")).hexdigest()
+    data = kwargs.get("data")
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(data).hexdigest()
+    return None
+
+
+def _request_params(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Non-image request parameters worth keeping in the cassette"""
+    payload = kwargs.get("json")
+    if isinstance(payload, dict):
+        return {k: v for k, v in payload.items() if k != "image"}
+    return dict(kwargs.get("params") or {})
+
+
+class CassetteResponse:
+    """Just enough of requests.Response for the clients in this repo"""
+
+    def __init__(self, exchange: Dict[str, Any]):
+        self.status_code = exchange["status"]
+        self.headers = CaseInsensitiveDict(exchange.get("headers") or {})
+        self.text = exchange.get("body", "")
+        self.content = self.text.encode("utf-8")
+        self.url = exchange["url"]
+        self.elapsed_s = exchange.get("latency_s", 0.0)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_lines(self, decode_unicode: bool = False, **kwargs):
+        for line in self.text.splitlines():
+            yield line if decode_unicode else line.encode("utf-8")
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class RecordingTransport:
+    """Forward to a real client and append each exchange to a cassette"""
+
+    def __init__(self, inner, cassette_path: str):
+        self.inner = inner
+        self.cassette_path = cassette_path
+        self._lock = threading.Lock()
+
+    def _record(self, method: str, url: str, kwargs: Dict[str, Any], resp, latency: float):
+        exchange = {
+            "method": method,
+            "url": url,
+            "path": urlsplit(url).path,
+            "digest": _request_digest(kwargs),
+            "params": _request_params(kwargs),
+            "status": resp.status_code,
+            "headers": dict(resp.headers),
+            "body": resp.text,
+            "latency_s": round(latency, 4),
+            "recorded_at": time.time(),
+        }
+        line = json.dumps(exchange) + "\n"
+        with self._lock:
+            with open(self.cassette_path, "a") as f:
+                f.write(line)
+
+    def _call(self, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        resp = getattr(self.inner, method.lower())(url, **kwargs)
+        self._record(method, url, kwargs, resp, time.perf_counter() - start)
+        return resp
+
+    def get(self, url: str, **kwargs):
+        return self._call("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self._call("POST", url, **kwargs)
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayTransport:
+    """Serve recorded exchanges back without touching the network.
+
+    Requests are matched on method and URL path; among those, an exchange with
+    the same image digest is preferred. Matching exchanges are served in
+    recorded order and cycle when exhausted, so a short cassette can drive a
+    long benchmark.
+    """
+
+    def __init__(self, cassette_path: str, realtime: bool = False):
+        self.cassette_path = cassette_path
+        self.realtime = realtime
+        self._exchanges: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[tuple, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        with open(cassette_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    exchange = json.loads(line)
+                    self._exchanges[(exchange["method"], exchange["path"])].append(exchange)
+
+    def _call(self, method: str, url: str, **kwargs):
+        key = (method, urlsplit(url).path)
+        digest = _request_digest(kwargs)
+        with self._lock:
+            candidates = self._exchanges.get(key)
+            if not candidates:
+                raise requests.exceptions.ConnectionError(f"No recorded exchange for {method} {url}")
+            if digest:
+                same_image = [e for e in candidates if e.get("digest") == digest]
+                if same_image:
+                    candidates = same_image
+                    key = key + (digest,)
+            exchange = candidates[self._cursor[key] % len(candidates)]
+            self._cursor[key] += 1
+
+        if self.realtime:
+            time.sleep(exchange.get("latency_s", 0.0))
+        return CassetteResponse(exchange)
+
+    def get(self, url: str, **kwargs):
+        return self._call("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self._call("POST", url, **kwargs)
+
+    def close(self):
+        pass
+
+
+def wrap_from_env(client):
+    """Wrap a real client according to MEDGEMMA_TRANSPORT / MEDGEMMA_CASSETTE"""
+    mode = os.environ.get(TRANSPORT_ENV, "").lower()
+    cassette = os.environ.get(CASSETTE_ENV)
+    if not mode or mode == "live":
+        return client
+    if not cassette:
+        raise ValueError(f"{TRANSPORT_ENV}={mode} requires {CASSETTE_ENV}")
+    if mode == "record":
+        return RecordingTransport(client, cassette)
+    if mode == "replay":
+        return ReplayTransport(cassette, realtime=os.environ.get(REALTIME_ENV, "") not in ("", "0"))
+    raise ValueError(f"Unknown {TRANSPORT_ENV}: {mode}")